@@ -0,0 +1,106 @@
+"""
+Versioned schema changes that db.create_all() cannot make on existing
+tables (it only creates missing tables, never new indexes or columns).
+
+Each migration is a module in this package named mNNNN_<slug>.py with
+VERSION, NAME and upgrade(conn). Applied versions are recorded in the
+schema_migrations table; run pending ones with `python -m migrations`
+from backend/ (create_app also applies them on boot).
+"""
+
+import importlib
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+    text,
+)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def load_migrations():
+    """All migration modules, ordered by VERSION"""
+    modules = []
+    for info in pkgutil.iter_modules(__path__):
+        if info.name.startswith("m") and info.name[1:5].isdigit():
+            modules.append(importlib.import_module(f"{__name__}.{info.name}"))
+    versions = [m.VERSION for m in modules]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions: {sorted(versions)}")
+    return sorted(modules, key=lambda m: m.VERSION)
+
+
+def applied_versions(engine):
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {v for (v,) in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade(engine, verbose=True):
+    """
+    Apply pending migrations, each in its own transaction.
+    Safe to call from several gunicorn workers at once: migrations are
+    idempotent and a version another worker recorded first is skipped.
+    Returns the list of versions applied by this call.
+    """
+    done = applied_versions(engine)
+    applied = []
+    for module in load_migrations():
+        if module.VERSION in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                module.upgrade(conn)
+                conn.execute(
+                    schema_migrations.insert().values(
+                        version=module.VERSION,
+                        name=module.NAME,
+                        applied_at=datetime.utcnow(),
+                    )
+                )
+        except Exception as e:
+            if module.VERSION in applied_versions(engine):
+                continue  # another worker finished it first
+            raise RuntimeError(
+                f"Migration {module.VERSION} ({module.NAME}) failed: {e}"
+            ) from e
+        applied.append(module.VERSION)
+        if verbose:
+            print(f"Applied migration {module.VERSION:04d}: {module.NAME}")
+    return applied
+
+
+def ensure_index(conn, table_name, index_name, columns, unique=False):
+    """CREATE INDEX unless an index of that name already exists"""
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(table_name)}
+    if index_name in existing:
+        return False
+    # Reflect into private metadata so the app's models are left untouched
+    table = Table(table_name, MetaData(), autoload_with=conn)
+    Index(index_name, *[table.c[c] for c in columns], unique=unique).create(conn)
+    return True
+
+
+def ensure_column(conn, table_name, column_name, ddl_type):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return False
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl_type}"))
+    return True
@@ -0,0 +1,11 @@
+"""Apply pending schema migrations: python -m migrations (from backend/)"""
+
+from app import create_app
+from extensions import db
+from migrations import applied_versions, upgrade
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+        print(f"Schema at version {max(applied_versions(db.engine), default=0)}")
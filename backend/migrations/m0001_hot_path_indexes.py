@@ -0,0 +1,27 @@
+"""Composite indexes for the hot collection, EMI, loan and log predicates"""
+
+from migrations import ensure_index
+
+VERSION = 1
+NAME = "hot_path_indexes"
+
+# (table, index name, columns) - names match the __table_args__ in models.py
+INDEXES = (
+    ("collections", "ix_collections_loan_created", ("loan_id", "created_at")),
+    ("collections", "ix_collections_agent_created", ("agent_id", "created_at")),
+    ("collections", "ix_collections_status", ("status",)),
+    (
+        "emi_schedule",
+        "ix_emi_schedule_loan_status_due",
+        ("loan_id", "status", "due_date"),
+    ),
+    ("loans", "ix_loans_customer_status", ("customer_id", "status")),
+    ("location_logs", "ix_location_logs_user_time", ("user_id", "timestamp")),
+    ("line_customers", "ix_line_customers_line_order", ("line_id", "sequence_order")),
+    ("login_logs", "ix_login_logs_user_time", ("user_id", "login_time")),
+)
+
+
+def upgrade(conn):
+    for table, name, columns in INDEXES:
+        ensure_index(conn, table, name, columns)
@@ -0,0 +1,32 @@
+"""One field collection per loan per day, enforced by a unique index"""
+
+from sqlalchemy import text
+
+from migrations import ensure_column, ensure_index
+
+VERSION = 2
+NAME = "collection_business_date"
+
+
+def upgrade(conn):
+    if ensure_column(conn, "collections", "business_date", "DATE"):
+        # Backfill only the first collection of each loan/day so existing
+        # same-day duplicates do not block the unique index (NULLs never
+        # collide). The derived table keeps MySQL happy about updating the
+        # table it selects from.
+        conn.execute(
+            text(
+                "UPDATE collections SET business_date = DATE(created_at) "
+                "WHERE id IN (SELECT first_id FROM ("
+                "SELECT MIN(id) AS first_id FROM collections "
+                "WHERE created_at IS NOT NULL "
+                "GROUP BY loan_id, DATE(created_at)) AS firsts)"
+            )
+        )
+    ensure_index(
+        conn,
+        "collections",
+        "uq_collections_loan_business_date",
+        ("loan_id", "business_date"),
+        unique=True,
+    )
@@ -0,0 +1,22 @@
+"""Streaming anomaly model state on agent_trust_states and the per-collection score"""
+
+from migrations import ensure_column
+
+VERSION = 3
+NAME = "collection_stream_model"
+
+COLUMNS = (
+    ("agent_trust_states", "stream_events", "INTEGER NOT NULL DEFAULT 0"),
+    ("agent_trust_states", "amount_mean", "FLOAT"),
+    ("agent_trust_states", "amount_var", "FLOAT"),
+    ("agent_trust_states", "gap_mean", "FLOAT"),
+    ("agent_trust_states", "gap_var", "FLOAT"),
+    ("agent_trust_states", "last_anomaly_score", "FLOAT"),
+    ("agent_trust_states", "anomalous_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("collections", "anomaly_score", "FLOAT"),
+)
+
+
+def upgrade(conn):
+    for table, column, ddl_type in COLUMNS:
+        ensure_column(conn, table, column, ddl_type)
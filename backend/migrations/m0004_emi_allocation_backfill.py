@@ -0,0 +1,110 @@
+"""
+Backfill the emi_allocations ledger for collections approved before it existed.
+
+Allocation has always been first-in-first-out (each approved collection
+pays the oldest unpaid EMIs), so replaying a loan's approved collections
+in time order against what each EMI has received so far (amount - balance)
+rebuilds the same rows. Money beyond the EMIs' paid amounts (foreclosure
+settlements) stays unallocated, as it was at the time.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, select
+
+VERSION = 4
+NAME = "emi_allocation_backfill"
+
+LOAN_CHUNK = 1000
+EPSILON = 1e-6
+
+
+def _received(emi):
+    """What the EMI has been paid so far"""
+    if emi.balance is None:  # legacy rows: no partial payments recorded
+        return emi.amount if emi.status == "paid" else 0.0
+    return max((emi.amount or 0.0) - emi.balance, 0.0)
+
+
+def _replay(emis, collections, now):
+    """Ledger rows for one loan: its EMIs (due order) and approved collections"""
+    rows = []
+    queue = [[emi, _received(emi)] for emi in emis]
+    queue = [item for item in queue if item[1] > EPSILON]
+    position = 0
+    for collection in collections:
+        remaining = collection.amount or 0.0
+        while remaining > EPSILON and position < len(queue):
+            emi, capacity = queue[position]
+            amount = min(remaining, capacity)
+            rows.append(
+                {
+                    "collection_id": collection.id,
+                    "emi_id": emi.id,
+                    "loan_id": emi.loan_id,
+                    "amount": amount,
+                    "paid_at": collection.created_at or emi.due_date,
+                    "created_at": now,
+                }
+            )
+            remaining -= amount
+            queue[position][1] -= amount
+            if queue[position][1] <= EPSILON:
+                position += 1
+    return rows
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    allocations = Table("emi_allocations", metadata, autoload_with=conn)
+    if conn.execute(select(allocations.c.id).limit(1)).first():
+        return  # ledger already in use
+    emi_schedule = Table("emi_schedule", metadata, autoload_with=conn)
+    collections = Table("collections", metadata, autoload_with=conn)
+
+    approved = collections.c.status == "approved"
+    loan_ids = [
+        loan_id
+        for (loan_id,) in conn.execute(
+            select(collections.c.loan_id)
+            .where(approved)
+            .distinct()
+            .order_by(collections.c.loan_id)
+        )
+    ]
+    now = datetime.utcnow()
+    for start in range(0, len(loan_ids), LOAN_CHUNK):
+        chunk = loan_ids[start : start + LOAN_CHUNK]
+        emis_by_loan = {}
+        for emi in conn.execute(
+            select(emi_schedule)
+            .where(emi_schedule.c.loan_id.in_(chunk))
+            .order_by(
+                emi_schedule.c.loan_id, emi_schedule.c.due_date, emi_schedule.c.id
+            )
+        ):
+            emis_by_loan.setdefault(emi.loan_id, []).append(emi)
+        collections_by_loan = {}
+        for collection in conn.execute(
+            select(
+                collections.c.id,
+                collections.c.loan_id,
+                collections.c.amount,
+                collections.c.created_at,
+            )
+            .where(approved, collections.c.loan_id.in_(chunk))
+            .order_by(collections.c.loan_id, collections.c.created_at, collections.c.id)
+        ):
+            collections_by_loan.setdefault(collection.loan_id, []).append(collection)
+
+        rows = []
+        for loan_id in chunk:
+            rows.extend(
+                _replay(
+                    emis_by_loan.get(loan_id, []),
+                    collections_by_loan.get(loan_id, []),
+                    now,
+                )
+            )
+        if rows:
+            conn.execute(allocations.insert(), rows)
@@ -0,0 +1,15 @@
+"""Index for the collection review queue (status filter, newest first)"""
+
+from migrations import ensure_index
+
+VERSION = 5
+NAME = "review_queue_index"
+
+
+def upgrade(conn):
+    ensure_index(
+        conn,
+        "collections",
+        "ix_collections_status_created",
+        ("status", "created_at"),
+    )
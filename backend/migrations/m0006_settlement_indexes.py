@@ -0,0 +1,16 @@
+"""Indexes for the settlement board join and the settlement history range scan"""
+
+from migrations import ensure_index
+
+VERSION = 6
+NAME = "settlement_indexes"
+
+INDEXES = (
+    ("daily_settlements", "ix_daily_settlements_agent_date", ("agent_id", "date")),
+    ("daily_settlements", "ix_daily_settlements_date", ("date",)),
+)
+
+
+def upgrade(conn):
+    for table, name, columns in INDEXES:
+        ensure_index(conn, table, name, columns)
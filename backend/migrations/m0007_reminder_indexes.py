@@ -0,0 +1,12 @@
+"""Index for selecting reminder targets by EMI due date"""
+
+from migrations import ensure_index
+
+VERSION = 7
+NAME = "reminder_indexes"
+
+
+def upgrade(conn):
+    ensure_index(
+        conn, "emi_schedule", "ix_emi_schedule_due_status", ("due_date", "status")
+    )
@@ -0,0 +1,19 @@
+"""Indexes matching the keyset pagination orders of the loan and customer lists"""
+
+from migrations import ensure_index
+
+VERSION = 8
+NAME = "listing_indexes"
+
+# (table, index name, columns) - names match the __table_args__ in models.py
+INDEXES = (
+    ("loans", "ix_loans_created_id", ("created_at", "id")),
+    ("loans", "ix_loans_status_pending", ("status", "pending_amount", "id")),
+    ("loans", "ix_loans_pending_id", ("pending_amount", "id")),
+    ("customers", "ix_customers_created_id", ("created_at", "id")),
+)
+
+
+def upgrade(conn):
+    for table, name, columns in INDEXES:
+        ensure_index(conn, table, name, columns)
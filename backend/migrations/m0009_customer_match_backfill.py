@@ -0,0 +1,16 @@
+"""
+Derive duplicate-detection keys for customers created before
+customer_match_keys existed, so /check-duplicate sees them.
+
+Customers that already have keys (indexed by the ORM events since) are
+left as they are; rebuild everything with POST /match-index/rebuild.
+"""
+
+from utils.customer_match import index_missing
+
+VERSION = 9
+NAME = "customer_match_backfill"
+
+
+def upgrade(conn):
+    index_missing(conn)
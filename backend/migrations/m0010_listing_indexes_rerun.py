@@ -0,0 +1,13 @@
+"""
+Re-apply the listing indexes of 0008 on databases that ran it before
+ix_loans_pending_id (outstanding report order) was added to it.
+"""
+
+from migrations import m0008_listing_indexes
+
+VERSION = 10
+NAME = "listing_indexes_rerun"
+
+
+def upgrade(conn):
+    m0008_listing_indexes.upgrade(conn)
@@ -0,0 +1,16 @@
+"""Server receive time of collections, apart from when they were collected"""
+
+from sqlalchemy import text
+
+from migrations import ensure_column
+
+VERSION = 11
+NAME = "collection_received_at"
+
+
+def upgrade(conn):
+    # db.DateTime's type: DATETIME on MySQL (its TIMESTAMP ends in 2038)
+    ddl_type = "DATETIME" if conn.dialect.name == "mysql" else "TIMESTAMP"
+    if ensure_column(conn, "collections", "received_at", ddl_type):
+        # Until now collections were stamped on receipt
+        conn.execute(text("UPDATE collections SET received_at = created_at"))
@@ -0,0 +1,15 @@
+"""Index for review queue polling on the server receive time"""
+
+from migrations import ensure_index
+
+VERSION = 12
+NAME = "review_queue_received_index"
+
+
+def upgrade(conn):
+    ensure_index(
+        conn,
+        "collections",
+        "ix_collections_status_received",
+        ("status", "received_at"),
+    )
@@ -77,6 +77,8 @@ class QRCode(db.Model):
 
 class LoginLog(db.Model):
     __tablename__ = "login_logs"
+    __table_args__ = (db.Index("ix_login_logs_user_time", "user_id", "login_time"),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     login_time = db.Column(db.DateTime, default=datetime.utcnow)
@@ -106,6 +108,9 @@ class Device(db.Model):
 
 class Customer(db.Model):
     __tablename__ = "customers"
+    # Keyset pagination order of the customer list (utils/listing.py)
+    __table_args__ = (db.Index("ix_customers_created_id", "created_at", "id"),)
+
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(
         db.String(20), unique=True, nullable=True
@@ -152,6 +157,14 @@ class Customer(db.Model):
 
 class Loan(db.Model):
     __tablename__ = "loans"
+    __table_args__ = (
+        db.Index("ix_loans_customer_status", "customer_id", "status"),
+        # Keyset pagination orders of the loan list and outstanding report
+        db.Index("ix_loans_created_id", "created_at", "id"),
+        db.Index("ix_loans_status_pending", "status", "pending_amount", "id"),
+        db.Index("ix_loans_pending_id", "pending_amount", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     loan_id = db.Column(db.String(25), unique=True, nullable=True)  # LN-YYYY-XXXXXX
     customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False)
@@ -198,6 +211,11 @@ class Loan(db.Model):
 
 class EMISchedule(db.Model):
     __tablename__ = "emi_schedule"
+    __table_args__ = (
+        db.Index("ix_emi_schedule_loan_status_due", "loan_id", "status", "due_date"),
+        db.Index("ix_emi_schedule_due_status", "due_date", "status"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     loan_id = db.Column(db.Integer, db.ForeignKey("loans.id"), nullable=False)
     emi_no = db.Column(db.Integer, nullable=False)
@@ -209,6 +227,34 @@ class EMISchedule(db.Model):
     status = db.Column(db.String(20), default="pending")  # 'pending', 'paid', 'overdue'
 
 
+class EMIAllocation(db.Model):
+    """Ledger of how much of each approved collection went to which EMI"""
+
+    __tablename__ = "emi_allocations"
+    __table_args__ = (db.Index("ix_emi_allocations_loan_paid", "loan_id", "paid_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    collection_id = db.Column(
+        db.Integer, db.ForeignKey("collections.id"), nullable=False, index=True
+    )
+    emi_id = db.Column(
+        db.Integer, db.ForeignKey("emi_schedule.id"), nullable=False, index=True
+    )
+    loan_id = db.Column(db.Integer, db.ForeignKey("loans.id"), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    paid_at = db.Column(db.DateTime, nullable=False)  # when the money was collected
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # when allocated
+
+    collection = db.relationship(
+        "Collection",
+        backref=db.backref("allocations", cascade="all, delete-orphan"),
+    )
+    emi = db.relationship(
+        "EMISchedule",
+        backref=db.backref("allocations", cascade="all, delete-orphan"),
+    )
+
+
 class LoanAuditLog(db.Model):
     __tablename__ = "loan_audit_logs"
     id = db.Column(db.Integer, primary_key=True)
@@ -234,6 +280,23 @@ class LoanDocument(db.Model):
 
 class Collection(db.Model):
     __tablename__ = "collections"
+    __table_args__ = (
+        db.Index("ix_collections_loan_created", "loan_id", "created_at"),
+        db.Index("ix_collections_agent_created", "agent_id", "created_at"),
+        db.Index("ix_collections_status", "status"),
+        # Review queue: pending/flagged newest first
+        db.Index("ix_collections_status_created", "status", "created_at"),
+        # Review queue polling (?since= on the receive time)
+        db.Index("ix_collections_status_received", "status", "received_at"),
+        # One field collection per loan per day (NULL for settlements/legacy rows)
+        db.Index(
+            "uq_collections_loan_business_date",
+            "loan_id",
+            "business_date",
+            unique=True,
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     loan_id = db.Column(db.Integer, db.ForeignKey("loans.id"), nullable=False)
     agent_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -245,7 +308,11 @@ class Collection(db.Model):
     status = db.Column(db.String(20), default="pending")
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # when collected
+    # When the server received it (differs for items synced from offline)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    business_date = db.Column(db.Date, nullable=True)  # UTC day of a field collection
+    anomaly_score = db.Column(db.Float, nullable=True)  # utils/ml_stream.py, at submit
 
     # Relationships
     loan = db.relationship(
@@ -275,6 +342,10 @@ class Line(db.Model):
 
 class LineCustomer(db.Model):
     __tablename__ = "line_customers"
+    __table_args__ = (
+        db.Index("ix_line_customers_line_order", "line_id", "sequence_order"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     line_id = db.Column(db.Integer, db.ForeignKey("lines.id"), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False)
@@ -287,6 +358,10 @@ class LineCustomer(db.Model):
 
 class DailySettlement(db.Model):
     __tablename__ = "daily_settlements"
+    __table_args__ = (
+        db.Index("ix_daily_settlements_agent_date", "agent_id", "date"),
+        db.Index("ix_daily_settlements_date", "date"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     agent_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     date = db.Column(db.Date, nullable=False)  # The date of collection
@@ -379,6 +454,180 @@ class CustomerSyncLog(db.Model):
     customer = db.relationship("Customer", backref="sync_logs")
 
 
+class CustomerMatchKey(db.Model):
+    """Normalized duplicate-detection keys, maintained by utils/customer_match.py"""
+
+    __tablename__ = "customer_match_keys"
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(
+        db.Integer, db.ForeignKey("customers.id"), nullable=False, index=True
+    )
+    key_type = db.Column(db.String(20), nullable=False)  # 'name', 'phone', 'id_proof'
+    key_value = db.Column(db.String(64), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_customer_match_keys_lookup", "key_type", "key_value"),
+    )
+
+
+class AgentTrustState(db.Model):
+    """Running per-agent collection counters, maintained by utils/agent_trust.py"""
+
+    __tablename__ = "agent_trust_states"
+    agent_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+
+    # Collections by current status (moves between buckets on review)
+    total_count = db.Column(db.Integer, default=0, nullable=False)
+    pending_count = db.Column(db.Integer, default=0, nullable=False)
+    flagged_count = db.Column(db.Integer, default=0, nullable=False)
+    approved_count = db.Column(db.Integer, default=0, nullable=False)
+    rejected_count = db.Column(db.Integer, default=0, nullable=False)
+    approved_amount = db.Column(db.Float, default=0.0, nullable=False)
+    # Exponentially weighted share of recent decisions that were approvals
+    approval_rate = db.Column(db.Float, default=1.0, nullable=False)
+
+    # Latest collection, for the velocity check
+    last_collection_at = db.Column(db.DateTime, nullable=True)
+    last_latitude = db.Column(db.Float, nullable=True)
+    last_longitude = db.Column(db.Float, nullable=True)
+    last_loan_id = db.Column(db.Integer, nullable=True)
+
+    # Streaming anomaly model (utils/ml_stream.py): exponentially weighted
+    # mean/variance of log(amount) and log(seconds between collections)
+    stream_events = db.Column(db.Integer, default=0, nullable=False)
+    amount_mean = db.Column(db.Float, nullable=True)
+    amount_var = db.Column(db.Float, nullable=True)
+    gap_mean = db.Column(db.Float, nullable=True)
+    gap_var = db.Column(db.Float, nullable=True)
+    last_anomaly_score = db.Column(db.Float, nullable=True)
+    anomalous_count = db.Column(db.Integer, default=0, nullable=False)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TamperFinding(db.Model):
+    """Failed reconciliation check (utils/tamper_scan.py), one row per loan and check"""
+
+    __tablename__ = "tamper_findings"
+    __table_args__ = (
+        db.UniqueConstraint("loan_id", "kind", name="uq_tamper_findings_loan_kind"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    loan_id = db.Column(db.Integer, db.ForeignKey("loans.id"), nullable=False)
+    kind = db.Column(db.String(40), nullable=False)  # 'BALANCE_MISMATCH', ...
+    reason = db.Column(db.String(255), nullable=False)
+    expected = db.Column(db.Float, nullable=True)
+    actual = db.Column(db.Float, nullable=True)
+    first_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime, nullable=True, index=True)  # NULL = open
+
+    loan = db.relationship(
+        "Loan", backref=db.backref("tamper_findings", cascade="all, delete-orphan")
+    )
+
+
+class TamperScan(db.Model):
+    """One tamper-detection run and the row ids it scanned up to"""
+
+    __tablename__ = "tamper_scans"
+    id = db.Column(db.Integer, primary_key=True)
+    full = db.Column(db.Boolean, default=False, nullable=False)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    loans_checked = db.Column(db.Integer, default=0, nullable=False)
+    findings = db.Column(db.Integer, default=0, nullable=False)  # found this run
+
+    # Watermarks: the next incremental run rechecks loans with newer rows
+    last_collection_id = db.Column(db.Integer, default=0, nullable=False)
+    last_allocation_id = db.Column(db.Integer, default=0, nullable=False)
+    last_audit_id = db.Column(db.Integer, default=0, nullable=False)
+
+
+class IdempotencyKey(db.Model):
+    """Stored responses of retried write requests, see utils/idempotency.py"""
+
+    __tablename__ = "idempotency_keys"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    endpoint = db.Column(db.String(50), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), default="in_progress")  # 'in_progress', 'completed'
+    response_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "endpoint", "key", name="uq_idempotency_keys_scope"
+        ),
+    )
+
+
+class ComputeJob(db.Model):
+    """CPU-heavy work run in the process pool, see utils/compute_pool.py"""
+
+    __tablename__ = "compute_jobs"
+    __table_args__ = (
+        db.Index("ix_compute_jobs_kind_params", "kind", "params_key", "status"),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=True)  # JSON
+    params_key = db.Column(db.String(64), nullable=False)  # sha256 of kind + params
+    status = db.Column(
+        db.String(20), default="queued"
+    )  # 'queued', 'running', 'done', 'failed', 'cancelled', 'timed_out'
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    timeout_seconds = db.Column(db.Integer, nullable=False)
+    submitted_by = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class ScheduledJob(db.Model):
+    """Schedule state and lease of one background job, see utils/scheduler.py"""
+
+    __tablename__ = "scheduled_jobs"
+    name = db.Column(db.String(50), primary_key=True)
+    schedule = db.Column(db.String(100), nullable=False)  # cron: m h dom mon dow (UTC)
+    enabled = db.Column(db.Boolean, default=True, nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)  # failures in a row
+    lease_owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    last_started_at = db.Column(db.DateTime, nullable=True)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+
+class JobRun(db.Model):
+    """One execution of a scheduled job, with its timing and result"""
+
+    __tablename__ = "job_runs"
+    __table_args__ = (db.Index("ix_job_runs_job_started", "job_name", "started_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(50), nullable=False)
+    attempt = db.Column(db.Integer, default=1, nullable=False)
+    worker = db.Column(db.String(100), nullable=True)  # host:pid
+    status = db.Column(
+        db.String(20), default="running"
+    )  # 'running', 'succeeded', 'failed', 'abandoned'
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON the job returned
+    error = db.Column(db.Text, nullable=True)
+
+
 class SystemSetting(db.Model):
     __tablename__ = "system_settings"
     key = db.Column(db.String(50), primary_key=True)
@@ -387,6 +636,13 @@ class SystemSetting(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class IdSequence(db.Model):
+    __tablename__ = "id_sequences"
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'CUST-2024'
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class DailyAccountingReport(db.Model):
     __tablename__ = "daily_accounting_reports"
     id = db.Column(db.Integer, primary_key=True)
@@ -402,8 +658,92 @@ class DailyAccountingReport(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class PenaltySnapshot(db.Model):
+    """Per-loan penalty accrual for one day, see utils/penalty_engine.py"""
+
+    __tablename__ = "penalty_snapshots"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "snapshot_date", "loan_id", name="uq_penalty_snapshots_date_loan"
+        ),
+        db.Index("ix_penalty_snapshots_date_line", "snapshot_date", "line_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    loan_id = db.Column(db.Integer, db.ForeignKey("loans.id"), nullable=False)
+    line_id = db.Column(db.Integer, db.ForeignKey("lines.id"), nullable=True)
+    overdue_emis = db.Column(db.Integer, default=0, nullable=False)
+    penalised_emis = db.Column(db.Integer, default=0, nullable=False)  # past grace
+    overdue_balance = db.Column(db.Float, default=0.0, nullable=False)
+    penalty = db.Column(db.Float, default=0.0, nullable=False)
+    max_days_overdue = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ReminderMessage(db.Model):
+    """One outgoing EMI reminder in the delivery outbox, see utils/reminders.py"""
+
+    __tablename__ = "reminder_outbox"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "emi_id", "due_date", "channel", name="uq_reminder_outbox_emi_channel"
+        ),
+        db.Index("ix_reminder_outbox_status_next", "status", "next_attempt_at"),
+        db.Index("ix_reminder_outbox_due_status", "due_date", "status"),
+        db.Index("ix_reminder_outbox_provider_id", "provider_message_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    due_date = db.Column(db.Date, nullable=False)  # the EMI due date reminded of
+    emi_id = db.Column(db.Integer, db.ForeignKey("emi_schedule.id"), nullable=False)
+    loan_id = db.Column(db.Integer, db.ForeignKey("loans.id"), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False)
+    channel = db.Column(db.String(20), nullable=False)  # 'sms', 'whatsapp'
+    recipient = db.Column(db.String(20), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(
+        db.String(20), default="queued", nullable=False
+    )  # 'queued', 'sending', 'sent', 'delivered', 'failed'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # while 'sending'
+    provider_message_id = db.Column(db.String(100), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+
+
+class OutboxEvent(db.Model):
+    """A domain event awaiting delivery to one webhook sink, see utils/outbox.py"""
+
+    __tablename__ = "event_outbox"
+    __table_args__ = (
+        db.Index("ix_event_outbox_sink_status_id", "sink", "status", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # delivery order
+    sink = db.Column(db.String(30), nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    loan_id = db.Column(db.Integer, nullable=True)  # events of a loan stay in order
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(
+        db.String(20), default="pending", nullable=False
+    )  # 'pending', 'delivered', 'failed'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+
+
 class LocationLog(db.Model):
     __tablename__ = "location_logs"
+    __table_args__ = (
+        db.Index("ix_location_logs_user_time", "user_id", "timestamp"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     latitude = db.Column(db.Float, nullable=False)
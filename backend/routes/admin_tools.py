@@ -1,5 +1,8 @@
+import hmac
+import os
+
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 from models import (
     db,
     User,
@@ -8,13 +11,21 @@ from models import (
     Loan,
     Line,
     Collection,
+    EMISchedule,
     DailySettlement,
     CustomerVersion,
     CustomerNote,
     CustomerDocument,
     SystemSetting,
+    ScheduledJob,
+    JobRun,
 )
 from utils.auth_helpers import get_user_by_identity
+from utils.dates import before_day, between_days
+from utils.db_pool import pool_metrics
+from utils.outbox import outbox_summary
+from utils.scheduled_jobs import SCHEDULE
+from utils.scheduler import sync_jobs, trigger
 
 admin_tools_bp = Blueprint("admin_tools", __name__)
 
@@ -141,9 +152,9 @@ def ai_analyst():
             )
             
             if start_date:
-                coll_query = coll_query.filter(db.func.date(Collection.created_at) >= start_date)
-                if end_date:
-                    coll_query = coll_query.filter(db.func.date(Collection.created_at) <= end_date)
+                coll_query = coll_query.filter(
+                    between_days(Collection.created_at, start_date, end_date)
+                )
             
             total = coll_query.scalar() or 0
             
@@ -166,11 +177,9 @@ def ai_analyst():
             count_query = Collection.query.filter(Collection.status == "approved")
             
             if start_date:
-                coll_query = coll_query.filter(db.func.date(Collection.created_at) >= start_date)
-                count_query = count_query.filter(db.func.date(Collection.created_at) >= start_date)
-                if end_date:
-                    coll_query = coll_query.filter(db.func.date(Collection.created_at) <= end_date)
-                    count_query = count_query.filter(db.func.date(Collection.created_at) <= end_date)
+                in_range = between_days(Collection.created_at, start_date, end_date)
+                coll_query = coll_query.filter(in_range)
+                count_query = count_query.filter(in_range)
 
             total = coll_query.scalar() or 0
             count = count_query.count()
@@ -196,7 +205,7 @@ def ai_analyst():
             # Overdue EMIs
             overdue_emi_sum = db.session.query(db.func.sum(EMISchedule.balance)).filter(
                 EMISchedule.status == "pending",
-                db.func.cast(EMISchedule.due_date, db.Date) < datetime.utcnow().date()
+                before_day(EMISchedule.due_date, datetime.utcnow().date())
             ).scalar() or 0
             
             # Total Pending Loan Amount
@@ -303,3 +312,140 @@ def seed_users():
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Seeding failed", "error": str(e)}), 500
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _run_dict(run):
+    return {
+        "id": run.id,
+        "job_name": run.job_name,
+        "attempt": run.attempt,
+        "worker": run.worker,
+        "status": run.status,
+        "started_at": _iso(run.started_at),
+        "finished_at": _iso(run.finished_at),
+        "duration_ms": run.duration_ms,
+        "result": run.result,
+        "error": run.error,
+    }
+
+
+def _job_dict(job):
+    spec = SCHEDULE.get(job.name)
+    return {
+        "name": job.name,
+        "schedule": job.schedule,
+        "enabled": job.enabled,
+        "next_run_at": _iso(job.next_run_at),
+        "attempts": job.attempts,
+        "max_attempts": spec.max_attempts if spec else None,
+        "running_on": job.lease_owner,
+        "last_started_at": _iso(job.last_started_at),
+        "last_finished_at": _iso(job.last_finished_at),
+        "last_status": job.last_status,
+        "last_error": job.last_error,
+    }
+
+
+def _admin_required():
+    user = get_user_by_identity(get_jwt_identity())
+    return user is not None and user.role == UserRole.ADMIN
+
+
+@admin_tools_bp.route("/jobs", methods=["GET"])
+@jwt_required()
+def list_scheduled_jobs():
+    """Scheduled background jobs with their next and last run"""
+    if not _admin_required():
+        return jsonify({"msg": "Access Denied"}), 403
+
+    try:
+        sync_jobs()
+        jobs = ScheduledJob.query.order_by(ScheduledJob.name).all()
+        return jsonify([_job_dict(job) for job in jobs]), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Error fetching jobs", "error": str(e)}), 500
+
+
+@admin_tools_bp.route("/jobs/<name>/runs", methods=["GET"])
+@jwt_required()
+def list_job_runs(name):
+    """Most recent runs of a job (?limit=, default 50)"""
+    if not _admin_required():
+        return jsonify({"msg": "Access Denied"}), 403
+
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    runs = (
+        JobRun.query.filter_by(job_name=name)
+        .order_by(JobRun.started_at.desc(), JobRun.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return jsonify([_run_dict(run) for run in runs]), 200
+
+
+@admin_tools_bp.route("/jobs/<name>/run", methods=["POST"])
+@jwt_required()
+def run_job_now(name):
+    """Make a job due now; the scheduler picks it up on its next pass"""
+    if not _admin_required():
+        return jsonify({"msg": "Access Denied"}), 403
+
+    try:
+        sync_jobs()
+        if not trigger(name):
+            return jsonify({"msg": "Job not found"}), 404
+        return jsonify({"msg": "Job queued", "name": name}), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Error queueing job", "error": str(e)}), 500
+
+
+@admin_tools_bp.route("/jobs/<name>", methods=["PATCH"])
+@jwt_required()
+def update_scheduled_job(name):
+    """Pause or resume a job: {"enabled": true|false}"""
+    if not _admin_required():
+        return jsonify({"msg": "Access Denied"}), 403
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get("enabled"), bool):
+        return jsonify({"msg": "enabled must be true or false"}), 400
+
+    job = db.session.get(ScheduledJob, name)
+    if job is None:
+        return jsonify({"msg": "Job not found"}), 404
+
+    job.enabled = data["enabled"]
+    db.session.commit()
+    return jsonify(_job_dict(job)), 200
+
+
+@admin_tools_bp.route("/outbox", methods=["GET"])
+@jwt_required()
+def get_outbox_summary():
+    """Webhook outbox backlog by sink and status"""
+    if not _admin_required():
+        return jsonify({"msg": "Access Denied"}), 403
+
+    return jsonify(outbox_summary()), 200
+
+
+@admin_tools_bp.route("/db-pool", methods=["GET"])
+def get_db_pool_metrics():
+    """
+    Connection pool state and checkout metrics of the answering worker.
+    Admins, or monitors sending X-Internal-Token (INTERNAL_METRICS_TOKEN).
+    """
+    token = os.getenv("INTERNAL_METRICS_TOKEN", "")
+    supplied = request.headers.get("X-Internal-Token", "")
+    if not (token and hmac.compare_digest(token, supplied)):
+        verify_jwt_in_request()
+        if not _admin_required():
+            return jsonify({"msg": "Access Denied"}), 403
+
+    return jsonify(pool_metrics(db.engine)), 200
@@ -1,9 +1,10 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Customer, Loan, Collection, EMISchedule, UserRole
+from models import db, Customer, Loan, Collection, EMISchedule, UserRole
 from datetime import datetime, timedelta
 from sqlalchemy import func
 from utils.auth_helpers import get_user_by_identity
+from routes.compute import run_offloaded
 
 analytics_bp = Blueprint("analytics", __name__)
 
@@ -206,60 +207,31 @@ def get_worker_performance_analytics():
     """
     AI-Powered Worker Performance Scoring (Simulated Clustering)
     Detects: Efficiency, Anomalies (Fraud), and Patterns.
+    Runs in the compute pool; ?async=1 returns the job to poll instead
+    of waiting for the result.
     """
-    if not get_admin_user():
+    user = get_admin_user()
+    if not user:
         return jsonify({"msg": "Admin access required"}), 403
 
-    agents = User.query.filter_by(role=UserRole.FIELD_AGENT).all()
-    analytics = []
-
-    # Prepare Raw Data for ML Engine
-    raw_data = []
-
-    for agent in agents:
-        collections = Collection.query.filter_by(agent_id=agent.id).all()
-        total_collected = sum(c.amount for c in collections if c.status == "approved")
-        count = len(collections)
-
-        # Risk factors
-        flagged_count = Collection.query.filter_by(
-            agent_id=agent.id, status="flagged"
-        ).count()
-
-        # Batch entry detection
-        timestamp_counts = (
-            db.session.query(Collection.created_at)
-            .filter_by(agent_id=agent.id)
-            .group_by(Collection.created_at)
-            .having(func.count(Collection.id) > 1)
-            .all()
-        )
-        batch_events = len(timestamp_counts)
+    return run_offloaded("worker_performance", user=user)
 
-        raw_data.append(
-            {
-                "agent_id": agent.id,
-                "name": agent.name,
-                "amount": total_collected,
-                "count": count,
-                "flagged": flagged_count,
-                "batch_events": batch_events,
-                "collections": collections,  # Keep ref for later
-            }
-        )
 
+def worker_performance():
+    """Scored workforce report behind /worker-performance"""
     # --- REAL ML ANALYSIS ---
+    # Features from one grouped query, scored against the scheduled model;
+    # cached until collections or agents change
     from utils.ml_worker import worker_engine
 
-    ml_results = worker_engine.analyze_workforce(raw_data)
+    raw_data = worker_engine.report()
 
     analytics = []
     for data in raw_data:
         agent_id = data["agent_id"]
-        ml_res = ml_results.get(agent_id, {})
 
-        cluster = ml_res.get("cluster", "STEADY")
-        is_suspicious = ml_res.get("is_suspicious", False)
+        cluster = data.get("cluster", "STEADY")
+        is_suspicious = data.get("is_suspicious", False)
 
         # Determine Color
         color = "blue"
@@ -321,7 +293,49 @@ def get_worker_performance_analytics():
         reverse=True,
     )
 
-    return jsonify(analytics), 200
+    return analytics
+
+
+@analytics_bp.route("/automation/refit-worker-model", methods=["POST"])
+@jwt_required()
+def refit_worker_model():
+    """
+    Scheduled refit of the workforce models (call from the automation
+    service). Skips the fit while the current model is fresher than
+    WORKER_MODEL_REFIT_HOURS unless {"force": true}.
+    """
+    if not get_admin_user():
+        return jsonify({"msg": "Admin access required"}), 403
+
+    from utils.ml_worker import worker_engine
+
+    data = request.get_json(silent=True) or {}
+    try:
+        model = worker_engine.refit(force=bool(data.get("force")))
+        return jsonify({"msg": "worker_model_ready", "model": model}), 200
+    except Exception as e:
+        print(f"Worker model refit failed: {e}")
+        return jsonify({"msg": str(e)}), 500
+
+
+@analytics_bp.route("/automation/refit-behavior-model", methods=["POST"])
+@jwt_required()
+def refit_behavior_model():
+    """
+    Nightly customer segmentation over the whole population (call from the
+    automation service, or run behavior_segmentation_job.py).
+    """
+    if not get_admin_user():
+        return jsonify({"msg": "Admin access required"}), 403
+
+    from utils.ml_behavior import behavior_engine
+
+    try:
+        model = behavior_engine.refit()
+        return jsonify({"msg": "behavior_model_ready", "model": model}), 200
+    except Exception as e:
+        print(f"Behavior model refit failed: {e}")
+        return jsonify({"msg": str(e)}), 500
 
 
 @analytics_bp.route("/customer-behavior/<int:customer_id>", methods=["GET"])
@@ -347,27 +361,14 @@ def get_customer_behavior_analytics(customer_id):
             200,
         )
 
-    # --- PREPARE DATA FOR ML ENGINE ---
-    # To cluster effectively, we need a population.
-    # We'll fetch metrics for this customer + a random sample of 50 others to form a baseline.
-    # (In production, cluster centers would be saved, but for dynamic "relative" scoring, this works well).
-
-    # 1. Calculate metrics for the target customer
-    target_stats = _calculate_customer_stats(customer, loans)
-
-    # 2. Get Population sample (Quick heuristic query for speed)
-    # Ideally, we have a background job computing these stats nightly.
-    # For now, we will create a synthetic population based on target to simulate comparison if DB is small,
-    # or fetch real if available.
-
-    population_data = [target_stats]
-
     # --- REAL ML ANALYSIS ---
-    from utils.ml_behavior import behavior_engine
+    # Features for this customer, scored against the segment centroids the
+    # nightly population job stored
+    from utils.ml_behavior import behavior_engine, behavior_features
 
-    # We pass the single target (and potentially others if we had them ready)
-    # The engine works even with 1 item (falls back to logic), but ideal with more.
-    ml_results = behavior_engine.analyze_behavior(population_data)
+    features = behavior_features([customer.id])
+    target_stats = features.loc[customer.id]
+    ml_results = behavior_engine.score(features)
 
     result = ml_results.get(customer.id, {})
     segment = result.get("segment", "NEW")
@@ -393,9 +394,9 @@ def get_customer_behavior_analytics(customer_id):
             {
                 "customer_name": customer.name,
                 "segment": segment,
-                "reliability_score": round(target_stats["reliability_score"], 1),
+                "reliability_score": round(float(target_stats["reliability_score"]), 1),
                 "total_loans": len(loans),
-                "total_emis_tracked": target_stats["total_emis"],
+                "total_emis_tracked": int(target_stats["total_emis"]),
                 "on_time_ratio": f"{round(target_stats['reliability_score'])}%",
                 "loan_limit_suggestion": int(suggested_loan),
                 "observations": observations,
@@ -405,77 +406,24 @@ def get_customer_behavior_analytics(customer_id):
     )
 
 
-def _calculate_customer_stats(customer, loans):
-    total_emis_due = 0
-    total_paid_on_time = 0
-    delays = []
-    payment_amounts = []
-
-    for loan in loans:
-        emis = EMISchedule.query.filter_by(loan_id=loan.id).all()
-        for emi in emis:
-            if emi.status == "paid":
-                total_emis_due += 1
-                payment_amounts.append(emi.amount)
-
-                # Check delay
-                last_coll = (
-                    Collection.query.filter_by(loan_id=loan.id, status="approved")
-                    .order_by(Collection.created_at.desc())
-                    .first()
-                )
-                if last_coll:
-                    if last_coll.created_at.date() <= emi.due_date.date():
-                        total_paid_on_time += 1
-                        delays.append(0)
-                    else:
-                        delay = (last_coll.created_at.date() - emi.due_date.date()).days
-                        delays.append(delay)
-                else:
-                    # Paid but no collection record? weird, assume on time
-                    total_paid_on_time += 1
-                    delays.append(0)
-            elif emi.due_date < datetime.utcnow().date():
-                # Overdue
-                total_emis_due += 1
-                delay = (datetime.utcnow().date() - emi.due_date.date()).days
-                delays.append(delay)
-
-    reliability = (
-        (total_paid_on_time / total_emis_due * 100) if total_emis_due > 0 else 100
-    )
-    avg_delay = sum(delays) / len(delays) if delays else 0
-
-    # Volatility (Std Dev of delays)
-    import numpy as np
-
-    volatility = np.std(delays) if len(delays) > 1 else 0
-
-    avg_capacity = (
-        sum(payment_amounts) / len(payment_amounts) if payment_amounts else 5000
-    )
-
-    return {
-        "customer_id": customer.id,
-        "reliability_score": reliability,
-        "avg_delay_days": avg_delay,
-        "payment_volatility": volatility,
-        "total_loans_closed": len([lx for lx in loans if lx.status == "closed"]),
-        "avg_payment_capacity": avg_capacity,
-        "total_emis": total_emis_due,
-    }
-
-
 @analytics_bp.route("/dashboard-ai-insights", methods=["GET"])
 @jwt_required()
 def get_dashboard_ai_insights():
     """
     AI decision support for Admin.
     Analyzes: Weekly collection drops, Risky areas, and Problem loans.
+    Runs in the compute pool; ?async=1 returns the job to poll instead
+    of waiting for the result.
     """
-    if not get_admin_user():
+    user = get_admin_user()
+    if not user:
         return jsonify({"msg": "Admin access required"}), 403
 
+    return run_offloaded("dashboard_insights", user=user)
+
+
+def dashboard_insights():
+    """Weekly trend, risky areas and problem loans behind /dashboard-ai-insights"""
     today = datetime.utcnow()
     last_week = today - timedelta(days=7)
     prev_week = last_week - timedelta(days=7)
@@ -512,33 +460,10 @@ def get_dashboard_ai_insights():
     # Check if drop is due to underperforming workers
     underperforming_agents = []
     if collection_drop_pct > 5:
-        # Run Worker ML on active agents
-        agents = User.query.filter_by(role=UserRole.FIELD_AGENT).all()
-        # (Simplified data prep for ML - reusing logic would be better refactored, but inline for now)
-        agent_data = []
-        for ag in agents:
-            colls = Collection.query.filter_by(agent_id=ag.id).count()
-            amt = (
-                db.session.query(func.sum(Collection.amount))
-                .filter_by(agent_id=ag.id)
-                .scalar()
-                or 0
-            )
-            agent_data.append(
-                {
-                    "agent_id": ag.id,
-                    "amount": amt,
-                    "count": colls,
-                    "batch_events": 0,
-                    "flagged": 0,
-                }
-            )
-
-        worker_results = worker_engine.analyze_workforce(agent_data)
-        for aid, res in worker_results.items():
-            if res["cluster"] == "UNDERPERFORMING":
-                agent_name = next((a.name for a in agents if a.id == aid), "Unknown")
-                underperforming_agents.append(agent_name)
+        # Same cached workforce report as the worker performance page
+        for res in worker_engine.report():
+            if res.get("cluster") == "UNDERPERFORMING":
+                underperforming_agents.append(res["name"])
 
     # 2. ML-Based Risky Area Analysis
     # Instead of just overdue amount, we look for areas with high concentration of "High Risk" ML scores
@@ -634,26 +559,21 @@ def get_dashboard_ai_insights():
             f"Attention: {len(problem_loans)} loans flagged for immediate collection follow-up."
         )
 
-    return (
-        jsonify(
+    return {
+        "weekly_stats": {
+            "this_week": float(this_week_total),
+            "prev_week": float(prev_week_total),
+            "drop_pct": round(collection_drop_pct, 1),
+        },
+        "risky_areas": risky_areas,
+        "problem_loans": [
             {
-                "weekly_stats": {
-                    "this_week": float(this_week_total),
-                    "prev_week": float(prev_week_total),
-                    "drop_pct": round(collection_drop_pct, 1),
-                },
-                "risky_areas": risky_areas,
-                "problem_loans": [
-                    {
-                        "loan_id": pl[0],
-                        "customer": pl[1],
-                        "missed": pl[2],
-                        "pending": float(pl[3]),
-                    }
-                    for pl in problem_loans
-                ],
-                "ai_summaries": summaries,
+                "loan_id": pl[0],
+                "customer": pl[1],
+                "missed": pl[2],
+                "pending": float(pl[3]),
             }
-        ),
-        200,
-    )
+            for pl in problem_loans
+        ],
+        "ai_summaries": summaries,
+    }
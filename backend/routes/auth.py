@@ -11,6 +11,8 @@ import bcrypt
 
 from datetime import datetime, timedelta
 from utils.auth_helpers import get_user_by_identity
+from utils.dates import between_days
+from utils.hydrate import hydrate
 
 auth_bp = Blueprint("auth", __name__)
 import logging
@@ -585,9 +587,9 @@ def get_audit_logs():
 
     logs = LoginLog.query.order_by(LoginLog.login_time.desc()).limit(100).all()
     log_data = []
+    users = hydrate(User, (log_entry.user_id for log_entry in logs))
     for log_entry in logs:
-        # Try to join with user to get name
-        u = User.query.get(log_entry.user_id) if log_entry.user_id else None
+        u = users.get(log_entry.user_id)
         log_data.append(
             {
                 "id": log_entry.id,
@@ -977,13 +979,23 @@ def get_performance_stats():
     users_with_bio = FaceEmbedding.query.join(User).count()
     bio_rate = (users_with_bio / total_users * 100) if total_users > 0 else 0
 
-    # 3. Last 7 days login activity
+    # 3. Last 7 days login activity: one range scan grouped by day
     today = datetime.utcnow().date()
+    login_day = db.func.date(LoginLog.login_time)
+    per_day = {
+        str(day)[:10]: count
+        for day, count in db.session.query(login_day, db.func.count(LoginLog.id))
+        .filter(between_days(LoginLog.login_time, today - timedelta(days=6), today))
+        .group_by(login_day)
+        .all()
+    }
+
     activity_data = []
     for i in range(7):
         date = today - timedelta(days=i)
-        count = LoginLog.query.filter(db.func.date(LoginLog.login_time) == date).count()
-        activity_data.append({"date": date.isoformat(), "count": count})
+        activity_data.append(
+            {"date": date.isoformat(), "count": per_day.get(date.isoformat(), 0)}
+        )
 
     return (
         jsonify(
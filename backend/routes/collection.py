@@ -14,109 +14,293 @@ from models import (
 )
 from utils.auth_helpers import get_user_by_identity
 from datetime import datetime, timedelta
+import os
+import time
 from utils.interest_utils import (  # noqa: F401
     calculate_flat_emi,
     calculate_reducing_emi,
     generate_dates,
     get_distance_meters,
 )
+from utils.id_allocator import next_id
+from utils import agent_trust, outbox
+from utils.allocation import allocate_payment
+from utils.bulk_review import REVIEW_STATUSES, review_collections
+from utils.listing import keyset_page, get_page_size, InvalidCursor
+from utils.dates import on_day, on_or_before_day
+from utils.idempotency import (
+    IDEMPOTENCY_HEADER,
+    IdempotencyConflict,
+    idempotency_store,
+    replay_response,
+)
+from utils.collection_context import CollectionContext, InvalidTimestamp, collected_at
+from sqlalchemy.exc import IntegrityError
 
 collection_bp = Blueprint("collection", __name__)
 
+SUBMIT_ENDPOINT = "collection.submit"
+MAX_BATCH_SIZE = 200
+MAX_BULK_REVIEW = 500
+# How long a request can hold an uncommitted collection (gunicorn timeout)
+WATERMARK_SLACK = timedelta(seconds=int(os.getenv("GUNICORN_TIMEOUT", 120)))
+
 
 @collection_bp.route("/submit", methods=["POST"])
 @jwt_required()
 def submit_collection():
+    """
+    Records one collection.
+    Clients may send an Idempotency-Key header: a retry with the same key
+    and body gets the stored response back (Idempotent-Replayed: true)
+    without re-running any checks or touching EMIs.
+    """
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    data = request.get_json()
+    data = request.get_json() or {}
+    idem_key = request.headers.get(IDEMPOTENCY_HEADER)
+
+    if idem_key:
+        try:
+            replay = idempotency_store.begin(user.id, SUBMIT_ENDPOINT, idem_key, data)
+        except IdempotencyConflict as e:
+            return jsonify({"msg": e.msg}), e.status_code
+        if replay:
+            return replay_response(*replay)
+
+    try:
+        body, status_code = _stage_collection(user, data, CollectionContext(user))
+        if idem_key:
+            idempotency_store.complete(
+                user.id, SUBMIT_ENDPOINT, idem_key, body, status_code
+            )
+        db.session.commit()
+        return jsonify(body), status_code
+    except Exception as e:
+        db.session.rollback()
+        if idem_key:
+            idempotency_store.release(user.id, SUBMIT_ENDPOINT, idem_key)
+        return jsonify({"msg": str(e)}), 500
+
+
+@collection_bp.route("/submit-batch", methods=["POST"])
+@jwt_required()
+def submit_collection_batch():
+    """
+    Records many collections (e.g. a day queued offline) in one request.
+    Body: {"collections": [{...same fields as /submit, "local_id",
+    "idempotency_key"}, ...]}. Items should carry collected_at (ISO 8601,
+    when the money was taken, up to 48 h back), so the time-window,
+    velocity and stream checks see the real pace of the day rather than
+    the sync time, and each item counts against its own day's
+    one-per-loan limit. /submit ignores collected_at and uses server time.
+
+    Items run in order through the same checks as /submit and get the
+    same outcome they would have got as separate calls, but lookups are
+    preloaded in bulk, each item is isolated in a savepoint and the batch
+    commits once. Item keys share /submit's namespace, so an item already
+    sent on its own is replayed rather than recorded twice.
+    """
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    data = request.get_json() or {}
+    items = data.get("collections")
+    if not isinstance(items, list) or not items:
+        return jsonify({"msg": "collections list required"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"msg": f"At most {MAX_BATCH_SIZE} collections per batch"}), 400
+
+    results = [None] * len(items)
+    claimed = {}  # index -> idempotency key this request now owns
+
+    # Claim every key before staging: the claims use their own connections
+    # and must not wait on this session's write lock (SQLite)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = ({"msg": "Invalid collection"}, 400, False)
+            continue
+        key = item.get("idempotency_key")
+        if not key:
+            continue
+        try:
+            replay = idempotency_store.begin(
+                user.id, SUBMIT_ENDPOINT, key, _item_payload(item)
+            )
+        except IdempotencyConflict as e:
+            results[index] = ({"msg": e.msg}, e.status_code, False)
+            continue
+        if replay:
+            results[index] = (replay[0], replay[1], True)
+        else:
+            claimed[index] = key
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    try:
+        ctx = CollectionContext(user)
+        ctx.preload([items[i] for i in pending])
+
+        for index in pending:
+            payload = _item_payload(items[index])
+            try:
+                body, status_code = _stage_collection(
+                    user, payload, ctx, offline=True
+                )
+            except Exception as e:
+                body, status_code = {"msg": str(e)}, 500
+            results[index] = (body, status_code, False)
+
+            key = claimed.get(index)
+            if key and status_code < 500:
+                idempotency_store.complete(
+                    user.id, SUBMIT_ENDPOINT, key, body, status_code
+                )
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for key in claimed.values():
+            idempotency_store.release(user.id, SUBMIT_ENDPOINT, key)
+        return jsonify({"msg": str(e)}), 500
+
+    # Keys whose item failed with a server error stay retryable
+    for index, key in claimed.items():
+        if results[index][1] >= 500:
+            idempotency_store.release(user.id, SUBMIT_ENDPOINT, key)
+
+    response = []
+    for index, (body, status_code, replayed) in enumerate(results):
+        item = items[index] if isinstance(items[index], dict) else {}
+        response.append(
+            {
+                "index": index,
+                "local_id": item.get("local_id"),
+                "status_code": status_code,
+                "replayed": replayed,
+                **body,
+            }
+        )
+
+    return (
+        jsonify(
+            {
+                "msg": "batch_processed",
+                "results": response,
+                "submitted": sum(1 for r in results if r[1] == 201),
+                "failed": sum(1 for r in results if r[1] >= 400),
+            }
+        ),
+        200,
+    )
+
+
+def _item_payload(item):
+    """Batch item as the /submit body it stands for (idempotency hashing)"""
+    return {k: v for k, v in item.items() if k not in ("local_id", "idempotency_key")}
+
+
+def _stage_collection(user, data, ctx, offline=False):
+    """
+    Runs _record_collection in a savepoint, so a failing item leaves the
+    rest of the transaction untouched. Returns (body, status_code).
+    """
+    try:
+        with db.session.begin_nested():
+            return _record_collection(user, data, ctx, offline)
+    except IntegrityError:
+        # A concurrent submission for this loan won the unique index race
+        return {"msg": "already_collected_today"}, 400
+
+
+def _record_collection(user, data, ctx, offline=False):
+    """
+    Validates and stages one collection in the session.
+    Returns (body, status_code); the caller commits. An `offline` item
+    (from /submit-batch) may carry collected_at; online ones use server time.
+    """
     loan_id = data.get("loan_id")
-    amount = float(data.get("amount"))
+    amount = data.get("amount")
     payment_mode = data.get("payment_mode", "cash")
     latitude = data.get("latitude")
     longitude = data.get("longitude")
     line_id = data.get("line_id")
 
     if not loan_id or amount is None:
-        return jsonify({"msg": "Missing required fields"}), 400
-
-    loan = Loan.query.get(loan_id)
+        return {"msg": "Missing required fields"}, 400
+    amount = float(amount)
+    # When the agent took the money; queued offline items carry their own
+    at = datetime.utcnow()
+    if offline:
+        try:
+            at = collected_at(data.get("collected_at"), at) or at
+        except InvalidTimestamp as e:
+            return {"msg": str(e)}, 400
+    business_date = at.date()
+
+    loan = ctx.loan(loan_id)
     if not loan:
-        return jsonify({"msg": "Loan not found"}), 404
+        return {"msg": "Loan not found"}, 404
 
     # --- NEW: ENFORCE ENHANCED SECURITY ---
-    today = datetime.utcnow().date()
-    
-    # 1. Check if already collected today FOR THIS LOAN
-    existing_today = Collection.query.filter(
-        Collection.loan_id == loan_id,
-        db.func.date(Collection.created_at) == today
-    ).first()
-    
-    if existing_today:
-        return jsonify({"msg": "already_collected_today"}), 400
+    # 1. Check if already collected that day FOR THIS LOAN
+    # (backed by the unique loan_id + business_date index)
+    if ctx.collected_on(loan.id, business_date):
+        return {"msg": "already_collected_today"}, 400
 
     # 2. Check Time Window if line_id provided
     if line_id:
-        line = Line.query.get(line_id)
+        line = ctx.line(line_id)
         if line and line.start_time and line.end_time:
-            # Current time in IST (User preference)
-            ist_now = datetime.utcnow() + timedelta(hours=5, minutes=30)
+            # Collection time in IST (User preference)
+            ist_now = at + timedelta(hours=5, minutes=30)
             current_time_str = ist_now.strftime("%H:%M")
             
             if not (line.start_time <= current_time_str <= line.end_time):
-                return jsonify({
+                return {
                     "msg": "collection_window_closed",
                     "window": f"{line.start_time} - {line.end_time}",
                     "current": current_time_str
-                }), 403
+                }, 403
 
-    # 3. Duplicate Check (Idempotency - Short term)
-    # ...
+    # 3. Retried submissions are handled by the Idempotency-Key check above
 
     # --- PHASE 11: AI-POWERED FRAUD DETECTION & GEOFENCING ---
     fraud_flag = False
     fraud_reason = []
 
     # A. Geofencing Check
-    distance = None  # Initialize
-    if (
-        loan.customer
-        and loan.customer.latitude
-        and loan.customer.longitude
-        and latitude
-        and longitude
-    ):
-        distance = get_distance_meters(
-            latitude, longitude, loan.customer.latitude, loan.customer.longitude
+    distance = ctx.distance(loan, latitude, longitude)
+    if distance is not None and distance > 200:  # 200 meters threshold
+        fraud_flag = True
+        fraud_reason.append(
+            f"Geofencing Violation: {round(distance)}m away from customer profile location"
         )
-        if distance > 200:  # 200 meters threshold
-            fraud_flag = True
-            fraud_reason.append(
-                f"Geofencing Violation: {round(distance)}m away from customer profile location"
-            )
 
     # B. Collection Velocity Check (Anti-Speed Collection)
     # If agent is submitting multiple collections from different customers too fast
-    last_agent_collection = (
-        Collection.query.filter_by(agent_id=user.id)
-        .order_by(Collection.created_at.desc())
-        .first()
-    )
-    if last_agent_collection:
-        time_diff = (
-            datetime.utcnow() - last_agent_collection.created_at
-        ).total_seconds()
+    last_collection_at = ctx.last_collection_at()
+    if last_collection_at:
+        time_diff = abs((at - last_collection_at).total_seconds())
         if time_diff < 30:  # Less than 30 seconds between distinct collections
             fraud_flag = True
             fraud_reason.append(
                 f"Velocity Anomaly: System detected rapid-fire collection ({int(time_diff)}s since last entry)"
             )
 
+    # C. Streaming anomaly model: pace, travel speed and amount against the
+    # agent's own running history (utils/ml_stream.py)
+    anomaly = ctx.score_event(amount, latitude, longitude, at)
+    if anomaly.flagged:
+        fraud_flag = True
+        fraud_reason.extend(anomaly.reasons)
+
     collect_status = "pending"  # Requires admin approval
     if fraud_flag:
         collect_status = "flagged"  # Admin must review
@@ -132,10 +316,7 @@ def submit_collection():
     ):
         # Check Agent Trust History
         # If agent has 0 flagged collections in history, they are trusted
-        flagged_count = Collection.query.filter_by(
-            agent_id=user.id, status="flagged"
-        ).count()
-        if flagged_count == 0:
+        if ctx.flagged_count() == 0:
             collect_status = "approved"
             # Log AI auto-approval
             ai_log = LoanAuditLog(
@@ -148,7 +329,7 @@ def submit_collection():
 
     # 2. Record Collection
     new_collection = Collection(
-        loan_id=loan_id,
+        loan_id=loan.id,
         agent_id=user.id,
         line_id=line_id,
         amount=amount,
@@ -156,6 +337,10 @@ def submit_collection():
         latitude=latitude,
         longitude=longitude,
         status=collect_status,
+        business_date=business_date,
+        created_at=anomaly.features["at"],
+        received_at=ctx.received_at,
+        anomaly_score=anomaly.score,
     )
 
     if fraud_flag:
@@ -172,51 +357,21 @@ def submit_collection():
 
     # 3. Allocating Payment to EMIs (The "Brain")
     # ONLY apply financial impact if status is approved (Manual or AI)
+    loan_closed = False
     if collect_status == "approved":
-        remaining = amount
-        emis = (
-            EMISchedule.query.filter_by(loan_id=loan_id)
-            .filter(EMISchedule.status != "paid")
-            .order_by(EMISchedule.due_date)
-            .all()
-        )
-
-        allocation_details = []
-
-        for emi in emis:
-            if remaining <= 0:
-                break
-
-            # If emi.balance is None (legacy data), assume full amount
-            current_balance = emi.balance if emi.balance is not None else emi.amount
-
-            check_amount = min(remaining, current_balance)
-
-            new_balance = current_balance - check_amount
-            remaining -= check_amount
-
-            emi.balance = new_balance
-            if new_balance <= 0.1:  # Float tolerance
-                emi.status = "paid"
-                emi.balance = 0
-            else:
-                emi.status = "partial"
-
-            allocation_details.append(f"EMI #{emi.emi_no}: Paid {check_amount}")
+        emis = ctx.unpaid_emis(loan.id)
+        allocation_details = allocate_payment(new_collection, emis)
 
         # 4. Update Loan Balance
         loan.pending_amount = max(0, loan.pending_amount - amount)
 
         # Check for Loan Closure
         if loan.pending_amount <= 10:  # Small tolerance for calc errors
-            # Verify all EMIs are paid
-            all_paid = (
-                not EMISchedule.query.filter_by(loan_id=loan_id)
-                .filter(EMISchedule.status != "paid")
-                .first()
-            )
+            # Verify all EMIs are paid (emis held every unpaid one)
+            all_paid = all(emi.status == "paid" for emi in emis)
             if all_paid:
                 loan.status = "closed"
+                loan_closed = True
                 allocation_details.append("Loan Closed")
 
         # 5. Audit Log (Financial)
@@ -238,23 +393,34 @@ def submit_collection():
         )
         db.session.add(audit)
 
-    try:
-        db.session.commit()
-        return (
-            jsonify(
-                {
-                    "msg": "collection_submitted_successfully",
-                    "id": new_collection.id,
-                    "status": new_collection.status,
-                    "loan_balance": loan.pending_amount,
-                    "fraud_warning": fraud_reason if fraud_flag else None,
-                }
-            ),
-            201,
-        )
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": str(e)}), 500
+    db.session.flush()
+    ctx.record(new_collection, anomaly)
+
+    if outbox.events_enabled():
+        events = [
+            (
+                "collection.submitted",
+                loan.id,
+                outbox.submitted_collection_data(
+                    new_collection, loan, fraud_reason if fraud_flag else None
+                ),
+            )
+        ]
+        if loan_closed:
+            events.append(("loan.closed", loan.id, outbox.loan_data(loan)))
+        outbox.record_events(events)
+
+    return (
+        {
+            "msg": "collection_submitted_successfully",
+            "id": new_collection.id,
+            "status": new_collection.status,
+            "loan_balance": loan.pending_amount,
+            "fraud_warning": fraud_reason if fraud_flag else None,
+            "anomaly_score": anomaly.score,
+        },
+        201,
+    )
 
 
 @collection_bp.route("/customers", methods=["GET"])
@@ -295,16 +461,8 @@ def create_customer():
     if not name or not mobile:
         return jsonify({"msg": "Name and Mobile are required"}), 400
 
-    # Generate Unique Customer ID
-    current_year = datetime.now().year
-    count = Customer.query.filter(
-        Customer.created_at >= datetime(current_year, 1, 1)
-    ).count()
-    cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-    while Customer.query.filter_by(customer_id=cust_unique_id).first():
-        count += 1
-        cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
+    # Generate Unique Customer ID (sequence-backed, safe across workers)
+    cust_unique_id = next_id("CUST")
 
     new_customer = Customer(
         name=name,
@@ -358,6 +516,19 @@ def get_customer_loans(customer_id):
 @collection_bp.route("/pending-collections", methods=["GET"])
 @jwt_required()
 def get_pending_collections():
+    """
+    Review queue: pending and flagged collections, newest first.
+
+    Filters: ?status= (pending|flagged), ?agent_id=, ?line_id=, and
+    ?since=<ISO time> to poll only for items received after the last poll
+    (the X-Queue-Watermark header carries the value for the next one).
+    The watermark is on the server receive time, not collected_at, and
+    trails the clock by the request timeout so rows still being committed
+    are not skipped; items near it come back again, dedupe them by id.
+    Without ?limit= the whole queue is returned (legacy clients); with
+    ?limit= (and ?cursor= for later pages) it is keyset-paginated and the
+    next page token is sent in the X-Next-Cursor header.
+    """
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
@@ -369,102 +540,140 @@ def get_pending_collections():
     if current_role != UserRole.ADMIN.value:
         return jsonify({"msg": "Admin Access Required"}), 403
 
-    # Get all pending and flagged collections with joins
-    collections = (
-        Collection.query.filter(Collection.status.in_(["pending", "flagged"]))
-        .order_by(Collection.created_at.desc())
-        .all()
+    status_filter = request.args.get("status")
+    if status_filter and status_filter not in REVIEW_STATUSES:
+        return jsonify({"msg": "Invalid status"}), 400
+    agent_id = request.args.get("agent_id", type=int)
+    line_id = request.args.get("line_id", type=int)
+    cursor = request.args.get("cursor")
+    polled_at = datetime.utcnow()
+    since = request.args.get("since")
+    if since:
+        try:
+            since = datetime.fromisoformat(since.rstrip("Z"))
+        except ValueError:
+            return jsonify({"msg": "Invalid since timestamp"}), 400
+
+    # Column-only projection: one query with the loan, customer and agent joined
+    query = (
+        db.session.query(
+            Collection.id,
+            Collection.amount,
+            Collection.payment_mode,
+            Collection.status,
+            Collection.created_at,
+            Collection.latitude,
+            Collection.longitude,
+            Collection.anomaly_score,
+            Collection.agent_id,
+            Collection.line_id,
+            Loan.loan_id.label("loan_number"),
+            Customer.name.label("customer_name"),
+            Customer.area.label("customer_area"),
+            User.name.label("agent_name"),
+        )
+        .outerjoin(Loan, Loan.id == Collection.loan_id)
+        .outerjoin(Customer, Customer.id == Loan.customer_id)
+        .outerjoin(User, User.id == Collection.agent_id)
+        .filter(Collection.status.in_([status_filter] if status_filter else REVIEW_STATUSES))
     )
+    if agent_id:
+        query = query.filter(Collection.agent_id == agent_id)
+    if line_id:
+        query = query.filter(Collection.line_id == line_id)
+    if since:
+        query = query.filter(Collection.received_at > since)
 
-    result = []
-    for c in collections:
-        loan = Loan.query.get(c.loan_id)
-        customer = Customer.query.get(loan.customer_id) if loan else None
-        agent = User.query.get(c.agent_id)
-
-        result.append(
+    next_cursor = None
+    try:
+        if cursor or "limit" in request.args:
+            rows, next_cursor = keyset_page(
+                query,
+                Collection.created_at,
+                Collection.id,
+                cursor=cursor,
+                limit=get_page_size(request.args),
+            )
+        else:
+            rows = query.order_by(
+                Collection.created_at.desc(), Collection.id.desc()
+            ).all()
+    except InvalidCursor as e:
+        return jsonify({"msg": str(e)}), 400
+
+    response = jsonify(
+        [
             {
-                "id": c.id,
-                "amount": c.amount,
-                "payment_mode": c.payment_mode,
-                "status": c.status,
-                "created_at": c.created_at.isoformat() + "Z",
-                "customer_name": customer.name if customer else "Unknown",
-                "customer_area": customer.area if customer else "",
-                "loan_id": loan.loan_id if loan else "",
-                "agent_name": agent.name if agent else "Unknown",
-                "latitude": c.latitude,
-                "longitude": c.longitude,
+                "id": row.id,
+                "amount": row.amount,
+                "payment_mode": row.payment_mode,
+                "status": row.status,
+                "created_at": row.created_at.isoformat() + "Z",
+                "customer_name": row.customer_name or "Unknown",
+                "customer_area": row.customer_area or "",
+                "loan_id": row.loan_number or "",
+                "agent_id": row.agent_id,
+                "agent_name": row.agent_name or "Unknown",
+                "line_id": row.line_id,
+                "latitude": row.latitude,
+                "longitude": row.longitude,
+                "anomaly_score": row.anomaly_score,
             }
-        )
-
-    return jsonify(result), 200
-
-
-@collection_bp.route("/<int:collection_id>/status", methods=["PATCH"])
-@jwt_required()
-def update_collection_status(collection_id):
-    identity = get_jwt_identity()
-    user = get_user_by_identity(identity)
-
-    if not user:
-        return jsonify({"msg": "Access Denied"}), 403
-
-    # Normalize role check
-    current_role = user.role.value if hasattr(user.role, 'value') else user.role
-    if current_role == UserRole.FIELD_AGENT.value:
-        return jsonify({"msg": "Access Denied"}), 403
-
-    data = request.get_json()
-    status = data.get("status")
-
-    if status not in ["approved", "rejected"]:
-        return jsonify({"msg": "Invalid status"}), 400
-
-    collection = Collection.query.get(collection_id)
-    if not collection:
-        return jsonify({"msg": "Collection not found"}), 404
-
+            for row in rows
+        ]
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    # Anything received before this has committed by now (or timed out)
+    watermark = polled_at - WATERMARK_SLACK
+    response.headers["X-Queue-Watermark"] = watermark.isoformat() + "Z"
+    return response, 200
+
+
+def _apply_review(collection, status, user):
+    """
+    Set a reviewed collection's status; approving it (for the first time)
+    allocates the payment to EMIs and updates the loan. Caller commits.
+    """
     old_status = collection.status
+    if collection.agent_id:
+        agent_trust.record_status_change(collection, old_status, status)
     collection.status = status
+    events = [
+        (
+            f"collection.{status}",
+            collection.loan_id,
+            outbox.reviewed_collection_data(
+                collection.id,
+                collection.loan_id,
+                collection.agent_id,
+                collection.amount,
+                status,
+                user.id,
+            ),
+        )
+    ]
 
     if status == "approved" and old_status != "approved":
         loan = Loan.query.get(collection.loan_id)
         if loan:
             # Applying financial update only now
 
-            remaining = collection.amount
             emis = (
                 EMISchedule.query.filter_by(loan_id=loan.id)
                 .filter(EMISchedule.status != "paid")
                 .order_by(EMISchedule.due_date)
                 .all()
             )
-
-            allocation_details = []
-            for emi in emis:
-                if remaining <= 0:
-                    break
-                current_balance = emi.balance if emi.balance is not None else emi.amount
-                check_amount = min(remaining, current_balance)
-                emi.balance = current_balance - check_amount
-                remaining -= check_amount
-                if emi.balance <= 0.1:
-                    emi.status = "paid"
-                    emi.balance = 0
-                else:
-                    emi.status = "partial"
-                allocation_details.append(f"EMI #{emi.emi_no}: Paid {check_amount}")
+            allocation_details = allocate_payment(collection, emis)
 
             loan.pending_amount = max(0, loan.pending_amount - collection.amount)
             if loan.pending_amount <= 10:
-                all_paid = (
-                    not EMISchedule.query.filter_by(loan_id=loan.id)
-                    .filter(EMISchedule.status != "paid")
-                    .first()
-                )
+                # emis held every unpaid EMI of the loan
+                all_paid = all(emi.status == "paid" for emi in emis)
                 if all_paid:
                     loan.status = "closed"
+                    events.append(("loan.closed", loan.id, outbox.loan_data(loan)))
 
             # Audit log
             audit = LoanAuditLog(
@@ -475,13 +684,104 @@ def update_collection_status(collection_id):
                 + ", ".join(allocation_details),
             )
             db.session.add(audit)
-    else:
-        collection.status = status
+
+    outbox.record_events(events)
+
+
+def _get_reviewer():
+    """The current user if allowed to review collections (not a field agent)"""
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+    if not user:
+        return None
+
+    # Normalize role check
+    current_role = user.role.value if hasattr(user.role, 'value') else user.role
+    if current_role == UserRole.FIELD_AGENT.value:
+        return None
+    return user
+
+
+@collection_bp.route("/<int:collection_id>/status", methods=["PATCH"])
+@jwt_required()
+def update_collection_status(collection_id):
+    user = _get_reviewer()
+    if not user:
+        return jsonify({"msg": "Access Denied"}), 403
+
+    data = request.get_json()
+    status = data.get("status")
+
+    if status not in ["approved", "rejected"]:
+        return jsonify({"msg": "Invalid status"}), 400
+
+    collection = Collection.query.get(collection_id)
+    if not collection:
+        return jsonify({"msg": "Collection not found"}), 404
+
+    _apply_review(collection, status, user)
 
     db.session.commit()
     return jsonify({"msg": "collection_updated_successfully", "status": status}), 200
 
 
+@collection_bp.route("/bulk-status", methods=["POST"])
+@jwt_required()
+def bulk_update_collection_status():
+    """
+    Approve or reject queued collections in one transaction.
+    Body: {"ids": [...], "status": "approved" | "rejected"}
+
+    Collections are grouped by loan and allocated to its EMIs in the order
+    they were collected (utils/bulk_review.py). Items no longer in the
+    review queue are left alone. Returns one outcome per id and the
+    throughput.
+    """
+    user = _get_reviewer()
+    if not user:
+        return jsonify({"msg": "Access Denied"}), 403
+
+    data = request.get_json() or {}
+    status = data.get("status")
+    ids = data.get("ids")
+
+    if status not in ["approved", "rejected"]:
+        return jsonify({"msg": "Invalid status"}), 400
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"msg": "ids must be a non-empty list"}), 400
+    if len(ids) > MAX_BULK_REVIEW:
+        return jsonify({"msg": f"At most {MAX_BULK_REVIEW} ids per request"}), 400
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return jsonify({"msg": "ids must be integers"}), 400
+
+    started = time.perf_counter()
+    try:
+        outcomes = review_collections(ids, status, user.id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk Review Error: {e}")
+        return jsonify({"msg": str(e)}), 500
+    elapsed = time.perf_counter() - started
+
+    updated = sum(outcome == status for outcome in outcomes.values())
+    return (
+        jsonify(
+            {
+                "msg": "collections_updated",
+                "status": status,
+                "updated": updated,
+                "results": [{"id": cid, "outcome": outcomes[cid]} for cid in ids],
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "per_second": round(updated / elapsed, 1) if elapsed else None,
+            }
+        ),
+        200,
+    )
+
+
 @collection_bp.route("/stats/financials", methods=["GET"])
 @jwt_required()
 def get_financial_stats():
@@ -511,7 +811,7 @@ def get_financial_stats():
     today_total = (
         db.session.query(db.func.sum(Collection.amount))
         .filter(
-            db.func.date(Collection.created_at) == today,
+            on_day(Collection.created_at, today),
             Collection.status == "approved",
         )
         .scalar()
@@ -607,7 +907,7 @@ def get_agent_stats():
             Line.agent_id == user.id,
             Loan.status == "active",
             EMISchedule.status.in_(["pending", "partial", "overdue"]),
-            db.func.date(EMISchedule.due_date) <= today
+            on_or_before_day(EMISchedule.due_date, today)
         )
         .scalar()
         or 0
@@ -623,7 +923,7 @@ def get_agent_stats():
                 Customer.assigned_worker_id == user.id,
                 Loan.status == "active",
                 EMISchedule.status.in_(["pending", "partial", "overdue"]),
-                db.func.date(EMISchedule.due_date) <= today
+                on_or_before_day(EMISchedule.due_date, today)
             )
             .scalar()
             or 0
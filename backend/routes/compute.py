@@ -0,0 +1,149 @@
+import json
+import os
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, ComputeJob
+from utils.auth_helpers import get_user_by_identity
+from utils.compute_pool import (
+    PoolBusy,
+    UnknownJobKind,
+    compute_pool,
+    job_summary,
+)
+
+compute_bp = Blueprint("compute", __name__)
+
+# How long a heavy GET waits on its pool job before answering 202 instead.
+# Kept short: the wait holds a request thread, and render.yaml runs a
+# single sync gunicorn worker
+OFFLOAD_WAIT_SECONDS = float(os.getenv("COMPUTE_OFFLOAD_WAIT", 1.5))
+
+
+def get_admin_user():
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+    if user:
+        # Normalize role check
+        current_role = (
+            user.role.value if hasattr(user.role, "value") else str(user.role)
+        )
+        if current_role == "admin":
+            return user
+    return None
+
+
+def wants_async():
+    """?async=1 (or {"async": true}) asks a heavy endpoint for a job instead"""
+    flag = request.args.get("async")
+    if flag is None:
+        flag = (request.get_json(silent=True) or {}).get("async")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def queue_job(kind, params=None, user=None, timeout=None):
+    """
+    Submit a compute job and describe it: 202 while it is queued or running,
+    200 when an identical finished job's cached result is returned.
+    """
+    try:
+        job, _ = compute_pool.submit(
+            kind, params, user_id=user.id if user else None, timeout=timeout
+        )
+    except UnknownJobKind as e:
+        return jsonify({"msg": str(e)}), 400
+    except PoolBusy as e:
+        return jsonify({"msg": str(e)}), 503
+
+    return _job_response(job, 200 if job.status == "done" else 202)
+
+
+def _job_response(job, status_code):
+    response = jsonify({"msg": f"job_{job.status}", "job": job_summary(job)})
+    response.headers["Location"] = f"/api/compute/jobs/{job.id}"
+    return response, status_code
+
+
+def run_offloaded(kind, params=None, user=None):
+    """
+    Heavy endpoint body: the work always runs in the compute pool. With
+    ?async=1 the job is returned at once; otherwise the request waits up
+    to OFFLOAD_WAIT_SECONDS and answers with the job's result, as the
+    synchronous endpoint did, or 202 and the job when it takes longer.
+    """
+    if wants_async():
+        return queue_job(kind, params, user=user)
+    try:
+        job, _ = compute_pool.submit(kind, params, user_id=user.id if user else None)
+    except UnknownJobKind as e:
+        return jsonify({"msg": str(e)}), 400
+    except PoolBusy as e:
+        return jsonify({"msg": str(e)}), 503
+
+    job = compute_pool.wait(job, OFFLOAD_WAIT_SECONDS)
+    if job.status == "done":
+        return jsonify(json.loads(job.result) if job.result else None), 200
+    return _job_response(job, 202 if job.status in ("queued", "running") else 500)
+
+
+@compute_bp.route("/jobs", methods=["POST"])
+@jwt_required()
+def submit_job():
+    """Queue a job: {"kind": ..., "params": {...}, "timeout": seconds (optional)}"""
+    user = get_admin_user()
+    if not user:
+        return jsonify({"msg": "Admin access required"}), 403
+
+    data = request.get_json(silent=True) or {}
+    kind = data.get("kind")
+    params = data.get("params") or {}
+    if not kind or not isinstance(params, dict):
+        return jsonify({"msg": "kind and a params object are required"}), 400
+
+    try:
+        timeout = int(data["timeout"]) if data.get("timeout") else None
+    except (TypeError, ValueError):
+        return jsonify({"msg": "timeout must be a number of seconds"}), 400
+
+    try:
+        return queue_job(kind, params, user=user, timeout=timeout)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Compute Job Error: {e}")
+        return jsonify({"msg": str(e)}), 500
+
+
+@compute_bp.route("/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    """Job status; the result is included once it is done"""
+    user = get_admin_user()
+    if not user:
+        return jsonify({"msg": "Admin access required"}), 403
+
+    job = db.session.get(ComputeJob, job_id)
+    if job is None:
+        return jsonify({"msg": "Job not found"}), 404
+
+    job = compute_pool.refresh(job)
+    return jsonify(job_summary(job)), 200
+
+
+@compute_bp.route("/jobs/<job_id>", methods=["DELETE"])
+@jwt_required()
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    user = get_admin_user()
+    if not user:
+        return jsonify({"msg": "Admin access required"}), 403
+
+    job = db.session.get(ComputeJob, job_id)
+    if job is None:
+        return jsonify({"msg": "Job not found"}), 404
+
+    if not compute_pool.cancel(job):
+        return (
+            jsonify({"msg": f"Job already {job.status}", "job": job_summary(job)}),
+            409,
+        )
+    return jsonify({"msg": "job_cancelled", "job": job_summary(job)}), 200
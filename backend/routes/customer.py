@@ -9,20 +9,35 @@ from models import (
     CustomerNote,
     Loan,
     PassbookToken,
+    Line,
+    LineCustomer,
 )
 from datetime import datetime, timedelta
 import uuid
 from utils.auth_helpers import get_user_by_identity
+from utils.listing import keyset_page, get_page_size, InvalidCursor
+from utils.id_allocator import allocate_ids, next_id
+from utils.customer_match import duplicate_matcher, index_rows, rebuild_index
+from sqlalchemy import insert
 
 customer_bp = Blueprint("customer", __name__)
 
 
+# Keeps IN (...) lists well under every driver's bind-parameter limit
+SYNC_CHUNK_SIZE = 500
+
+
 @customer_bp.route("/sync", methods=["POST"])
 @jwt_required()
 def sync_customers():
     """
     Receives a list of customers created offline.
     Returns a mapping of {local_id: server_id, ...} and {local_id: error}
+
+    Set-based: one IN lookup per chunk for existing mobiles, one block of
+    CUST ids from the id_sequences table and one bulk INSERT. If the bulk
+    insert fails, rows are retried one savepoint each so a bad row only
+    fails itself.
     """
     print("=== SYNC CUSTOMER REQUEST RECEIVED ===")
     identity = get_jwt_identity()
@@ -33,77 +48,149 @@ def sync_customers():
         return jsonify({"msg": "User not found"}), 404
 
     data = request.get_json()
-    print(f"Request data: {data}")
     customers_to_sync = data.get("customers", [])
     print(f"Number of customers to sync: {len(customers_to_sync)}")
 
     success_map = {}
     error_map = {}
 
-    current_year = datetime.now().year
-
+    # 1. Validate and de-duplicate within the batch
+    pending = []  # (local_id, cust_data) for mobiles not seen earlier in the batch
+    batch_duplicates = {}  # mobile -> [local_id, ...] repeated in the batch
+    first_local_for_mobile = {}
     for cust_data in customers_to_sync:
         local_id = cust_data.get("local_id")
+        mobile = cust_data.get("mobile_number")
+        if not mobile or not cust_data.get("name"):
+            error_map[local_id] = "name and mobile_number are required"
+            continue
+        if mobile in first_local_for_mobile:
+            batch_duplicates.setdefault(mobile, []).append(local_id)
+            continue
+        first_local_for_mobile[mobile] = local_id
+        pending.append((local_id, cust_data))
+
+    # 2. Resolve every mobile already on the server in one IN query per chunk
+    mobiles = [c["mobile_number"] for _, c in pending]
+    existing = {}
+    for i in range(0, len(mobiles), SYNC_CHUNK_SIZE):
+        rows = (
+            db.session.query(
+                Customer.id, Customer.customer_id, Customer.mobile_number
+            )
+            .filter(Customer.mobile_number.in_(mobiles[i : i + SYNC_CHUNK_SIZE]))
+            .all()
+        )
+        existing.update({r.mobile_number: r for r in rows})
+
+    to_create = []
+    for local_id, cust_data in pending:
+        match = existing.get(cust_data["mobile_number"])
+        if match:
+            # If already exists, return the existing ID
+            success_map[local_id] = {
+                "server_id": match.id,
+                "customer_id": match.customer_id,
+                "status": "duplicate",
+            }
+        else:
+            to_create.append((local_id, cust_data))
+
+    # 3. One contiguous block of CUST-YYYY-NNNNNN ids for all new rows
+    if to_create:
         try:
-            # Check for duplicate by mobile number
-            existing = Customer.query.filter_by(
-                mobile_number=cust_data["mobile_number"]
-            ).first()
-            if existing:
-                # If already exists, return the existing ID
-                success_map[local_id] = {
-                    "server_id": existing.id,
-                    "customer_id": existing.customer_id,
-                    "status": "duplicate",
-                }
-                continue
-
-            # Generate Unique Customer ID
-            count = Customer.query.filter(
-                Customer.created_at >= datetime(current_year, 1, 1)
-            ).count()
-            cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-            # Double check uniqueness loop
-            while Customer.query.filter_by(customer_id=cust_unique_id).first():
-                count += 1
-                cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-            new_customer = Customer(
-                name=cust_data["name"],
-                mobile_number=cust_data["mobile_number"],
-                address=cust_data.get("address"),
-                area=cust_data.get("area"),
-                customer_id=cust_unique_id,
-                assigned_worker_id=(
-                    user.id if user.role == UserRole.FIELD_AGENT else None
-                ),
-                id_proof_number=cust_data.get("id_proof_number"),
-                profile_image=cust_data.get("profile_image"),
-                status="active",
-                latitude=cust_data.get("latitude"),
-                longitude=cust_data.get("longitude"),
-                created_at=datetime.utcnow(),
+            new_ids = allocate_ids("CUST", len(to_create))
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"msg": f"Could not allocate customer ids: {e}"}), 500
+
+        worker_id = user.id if user.role == UserRole.FIELD_AGENT else None
+        now = datetime.utcnow()
+        rows = [
+            {
+                "name": cust_data["name"],
+                "mobile_number": cust_data["mobile_number"],
+                "address": cust_data.get("address"),
+                "area": cust_data.get("area"),
+                "customer_id": cust_unique_id,
+                "assigned_worker_id": worker_id,
+                "id_proof_number": cust_data.get("id_proof_number"),
+                "profile_image": cust_data.get("profile_image"),
+                "status": "active",
+                "latitude": cust_data.get("latitude"),
+                "longitude": cust_data.get("longitude"),
+                "created_at": now,
+                "version": 1,
+                "is_locked": False,
+            }
+            for (_, cust_data), cust_unique_id in zip(to_create, new_ids)
+        ]
+
+        # 4. Bulk insert; fall back to per-row savepoints on any failure
+        inserted = []
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Customer), rows)
+            inserted = list(zip(to_create, rows))
+        except Exception as e:
+            print(f"Bulk customer insert failed, isolating rows: {e}")
+            for item, row in zip(to_create, rows):
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(Customer), [row])
+                    inserted.append((item, row))
+                except Exception as row_error:
+                    error_map[item[0]] = str(row_error)
+
+        # 5. Map back to server ids in one query per chunk
+        created_codes = [row["customer_id"] for _, row in inserted]
+        server_ids = {}
+        for i in range(0, len(created_codes), SYNC_CHUNK_SIZE):
+            server_ids.update(
+                db.session.query(Customer.customer_id, Customer.id)
+                .filter(
+                    Customer.customer_id.in_(created_codes[i : i + SYNC_CHUNK_SIZE])
+                )
+                .all()
             )
 
-            db.session.add(new_customer)
-            db.session.flush()
+        # Bulk INSERTs bypass the ORM events that maintain match keys
+        index_rows(
+            db.session.connection(),
+            [
+                {**row, "id": server_ids.get(row["customer_id"])}
+                for _, row in inserted
+            ],
+        )
 
+        for (local_id, _), row in inserted:
             success_map[local_id] = {
-                "server_id": new_customer.id,
-                "customer_id": new_customer.customer_id,
+                "server_id": server_ids.get(row["customer_id"]),
+                "customer_id": row["customer_id"],
                 "status": "created",
             }
 
-        except Exception as e:
-            db.session.rollback()
-            error_map[local_id] = str(e)
-            continue
+    # Repeats of a mobile inside the batch resolve to the first occurrence
+    for mobile, local_ids in batch_duplicates.items():
+        first = success_map.get(first_local_for_mobile[mobile])
+        for local_id in local_ids:
+            if first:
+                success_map[local_id] = {**first, "status": "duplicate"}
+            else:
+                error_map[local_id] = error_map.get(
+                    first_local_for_mobile[mobile], "Duplicate mobile in batch"
+                )
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 500
 
     response_data = {"msg": "Sync complete", "synced": success_map, "errors": error_map}
-    print(f"=== SYNC RESPONSE: {response_data} ===")
+    print(
+        f"=== SYNC RESPONSE: {len(success_map)} synced, {len(error_map)} errors ==="
+    )
     return jsonify(response_data), 200
 
 
@@ -135,23 +222,8 @@ def create_customer_online():
                 400,
             )
 
-        # Generate Unique Customer ID
-        current_year = datetime.now().year
-        # Fix PostgreSQL Date Comparison logic
-        try:
-             count = Customer.query.filter(
-                db.extract('year', Customer.created_at) == current_year
-            ).count()
-        except:
-             # Fallback for SQLite/MySQL if extract fails
-             count = Customer.query.filter(
-                Customer.created_at >= datetime(current_year, 1, 1)
-            ).count()
-        cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-        while Customer.query.filter_by(customer_id=cust_unique_id).first():
-            count += 1
-            cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
+        # Generate Unique Customer ID (sequence-backed, safe across workers)
+        cust_unique_id = next_id("CUST")
 
         new_customer = Customer(
             name=data["name"],
@@ -234,6 +306,11 @@ def get_customer_by_qr(qr_code):
 @customer_bp.route("/list", methods=["GET"])
 @jwt_required()
 def list_customers():
+    """
+    Customer listing, newest first.
+    ?page= keeps the legacy offset response (total/pages); ?cursor= or ?limit=
+    switches to keyset paging on (created_at, id) and returns next_cursor.
+    """
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
@@ -241,20 +318,33 @@ def list_customers():
         return jsonify({"msg": "User not found"}), 404
 
     page = request.args.get("page", 1, type=int)
-    per_page = request.args.get("per_page", 50, type=int)
+    per_page = get_page_size(request.args)
+    cursor = request.args.get("cursor")
     search = request.args.get("search", "")
 
-    query = Customer.query
+    query = db.session.query(
+        Customer.id,
+        Customer.customer_id,
+        Customer.name,
+        Customer.mobile_number,
+        Customer.area,
+        Customer.address,
+        Customer.status,
+        Customer.assigned_worker_id,
+        Customer.created_at,
+    )
 
     # RLS: Workers only see their own customers (Direct or via Lines)
+    # IN-subquery instead of DISTINCT + outer joins keeps one row per customer
     if user.role == UserRole.FIELD_AGENT:
-        from models import Line, LineCustomer
-        query = query.distinct().outerjoin(
-            LineCustomer, Customer.id == LineCustomer.customer_id
-        ).outerjoin(
-            Line, LineCustomer.line_id == Line.id
-        ).filter(
-            (Customer.assigned_worker_id == user.id) | (Line.agent_id == user.id)
+        line_customer_ids = (
+            db.session.query(LineCustomer.customer_id)
+            .join(Line, LineCustomer.line_id == Line.id)
+            .filter(Line.agent_id == user.id)
+        )
+        query = query.filter(
+            (Customer.assigned_worker_id == user.id)
+            | (Customer.id.in_(line_customer_ids))
         )
 
     if search:
@@ -265,43 +355,85 @@ def list_customers():
             | (Customer.customer_id.ilike(search_term))
         )
 
-    pagination = query.order_by(Customer.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    keyset_mode = cursor is not None or "limit" in request.args
+    next_cursor = None
+    try:
+        if keyset_mode:
+            rows, next_cursor = keyset_page(
+                query, Customer.created_at, Customer.id, cursor=cursor, limit=per_page
+            )
+        else:
+            total = query.order_by(None).count()
+            rows = (
+                query.order_by(Customer.created_at.desc(), Customer.id.desc())
+                .offset((max(page, 1) - 1) * per_page)
+                .limit(per_page)
+                .all()
+            )
+    except InvalidCursor as e:
+        return jsonify({"msg": str(e)}), 400
+
+    # Active loans for the whole page in one IN query
+    loans_by_customer = {}
+    if rows:
+        active_loans = (
+            db.session.query(
+                Loan.customer_id,
+                Loan.loan_id,
+                Loan.principal_amount,
+                Loan.pending_amount,
+                Loan.start_date,
+            )
+            .filter(
+                Loan.customer_id.in_([r.id for r in rows]),
+                Loan.status == "active",
+            )
+            .order_by(Loan.id)
+            .all()
+        )
+        for loan in active_loans:
+            loans_by_customer.setdefault(loan.customer_id, []).append(
+                {
+                    "loan_id": loan.loan_id,
+                    "amount": loan.principal_amount,
+                    "pending": loan.pending_amount,
+                    "next_emi_date": (
+                        loan.start_date.strftime("%Y-%m-%d")
+                        if loan.start_date
+                        else None
+                    ),
+                }
+            )
 
-    return (
-        jsonify(
+    result = {
+        "customers": [
             {
-                "customers": [
-                    {
-                        "id": c.id,
-                        "customer_id": c.customer_id,
-                        "name": c.name,
-                        "mobile": c.mobile_number,
-                        "area": c.area,
-                        "address": c.address,
-                        "active_loans": [
-                            {
-                                "loan_id": loan.loan_id,
-                                "amount": loan.principal_amount,
-                                "pending": loan.pending_amount,
-                                "next_emi_date": loan.start_date.strftime("%Y-%m-%d"),
-                            }
-                            for loan in c.loans
-                            if loan.status == "active"
-                        ],
-                        "status": c.status,
-                        "assigned_worker_id": c.assigned_worker_id,
-                    }
-                    for c in pagination.items
-                ],
-                "total": pagination.total,
-                "pages": pagination.pages,
+                "id": c.id,
+                "customer_id": c.customer_id,
+                "name": c.name,
+                "mobile": c.mobile_number,
+                "area": c.area,
+                "address": c.address,
+                "active_loans": loans_by_customer.get(c.id, []),
+                "status": c.status,
+                "assigned_worker_id": c.assigned_worker_id,
+            }
+            for c in rows
+        ],
+    }
+
+    if keyset_mode:
+        result["next_cursor"] = next_cursor
+    else:
+        result.update(
+            {
+                "total": total,
+                "pages": (total + per_page - 1) // per_page,
                 "current_page": page,
             }
-        ),
-        200,
-    )
+        )
+
+    return jsonify(result), 200
 
 
 @customer_bp.route("/<int:id>", methods=["GET"])
@@ -482,51 +614,26 @@ def update_customer_status(id):
 @customer_bp.route("/check-duplicate", methods=["POST"])
 @jwt_required()
 def check_duplicate():
-    """Check for potential duplicate customers"""
-    data = request.get_json()
-    name = data.get("name", "").strip()
-    mobile = data.get("mobile_number", "").strip()
-    area = data.get("area", "").strip()
-
-    duplicates = []
-
-    # Exact mobile match
-    if mobile:
-        exact_mobile = Customer.query.filter_by(mobile_number=mobile).first()
-        if exact_mobile:
-            duplicates.append(
-                {
-                    "type": "exact_mobile",
-                    "customer_id": exact_mobile.customer_id,
-                    "name": exact_mobile.name,
-                    "mobile": exact_mobile.mobile_number,
-                    "area": exact_mobile.area,
-                    "confidence": "high",
-                }
-            )
+    """
+    Check for potential duplicate customers.
+    Looks up phonetic name keys, normalized phone numbers and ID-proof
+    hashes in customer_match_keys and returns candidates ranked by score.
+    """
+    data = request.get_json() or {}
+    probe = {
+        "name": (data.get("name") or "").strip(),
+        "mobile_number": (data.get("mobile_number") or "").strip(),
+        "alternate_contact": (data.get("alternate_contact") or "").strip(),
+        "id_proof_number": (data.get("id_proof_number") or "").strip(),
+        "area": (data.get("area") or "").strip(),
+    }
 
-    # Fuzzy name + area match
-    if name and area:
-        similar = (
-            Customer.query.filter(
-                Customer.name.ilike(f"%{name}%"), Customer.area == area
-            )
-            .limit(5)
-            .all()
+    try:
+        duplicates = duplicate_matcher.find(
+            probe, exclude_id=data.get("exclude_id")
         )
-
-        for sim in similar:
-            if sim.mobile_number != mobile:
-                duplicates.append(
-                    {
-                        "type": "similar_name_area",
-                        "customer_id": sim.customer_id,
-                        "name": sim.name,
-                        "mobile": sim.mobile_number,
-                        "area": sim.area,
-                        "confidence": "medium",
-                    }
-                )
+    except Exception as e:
+        return jsonify({"msg": str(e)}), 500
 
     return (
         jsonify(
@@ -540,6 +647,24 @@ def check_duplicate():
     )
 
 
+@customer_bp.route("/match-index/rebuild", methods=["POST"])
+@jwt_required()
+def rebuild_match_index():
+    """Admin: re-derive duplicate-detection keys for every customer"""
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+    if not user or user.role != UserRole.ADMIN:
+        return jsonify({"msg": "Admin access required"}), 403
+
+    try:
+        indexed = rebuild_index()
+        db.session.commit()
+        return jsonify({"msg": "Match index rebuilt", "customers": indexed}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 500
+
+
 @customer_bp.route("/<int:id>/notes", methods=["POST"])
 @jwt_required()
 def add_customer_note(id):
@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Loan, LoanDocument, SystemSetting, EMISchedule
+from models import db, User, Loan, LoanDocument
+from utils.penalty_engine import accrue, overdue_emis, penalty_terms
 from utils.auth_helpers import get_user_by_identity
 from datetime import datetime
 import os
+import numpy as np
 from werkzeug.utils import secure_filename
 
 document_bp = Blueprint("document", __name__)
@@ -126,43 +128,22 @@ def get_penalty_summary(loan_id):
     """Calculate real-time penalty for overdue EMIs"""
     loan = Loan.query.get_or_404(loan_id)
 
-    # Fetch system settings
-    grace_period_setting = SystemSetting.query.get("grace_period_days")
-    penalty_setting = SystemSetting.query.get("penalty_amount")
-
-    grace_period = int(grace_period_setting.value) if grace_period_setting else 3
-    penalty_per_emi = float(penalty_setting.value) if penalty_setting else 50.0
-
-    today = datetime.utcnow()
-    overdue_emis = EMISchedule.query.filter(
-        EMISchedule.loan_id == loan_id,
-        EMISchedule.status != "paid",
-        EMISchedule.due_date < today,
-    ).all()
-
-    penalty_details = []
-    total_penalty = 0
-
-    for emi in overdue_emis:
-        days_overdue = (today - emi.due_date).days
-
-        if days_overdue > grace_period:
-            # Calculate penalty: base penalty + additional for each week overdue
-            weeks_overdue = max(0, (days_overdue - grace_period) // 7)
-            emi_penalty = penalty_per_emi + (weeks_overdue * 10)  # ₹10 per week
-
-            penalty_details.append(
-                {
-                    "emi_no": emi.emi_no,
-                    "due_date": emi.due_date.isoformat(),
-                    "days_overdue": days_overdue,
-                    "penalty": emi_penalty,
-                    "emi_amount": emi.amount,
-                    "pending_balance": emi.balance,
-                }
-            )
-
-            total_penalty += emi_penalty
+    grace_period, penalty_per_emi, penalty_per_week = penalty_terms()
+    emis = overdue_emis(datetime.utcnow(), loan_id=loan_id)
+    penalties = accrue(emis["days"], grace_period, penalty_per_emi, penalty_per_week)
+
+    penalty_details = [
+        {
+            "emi_no": int(emis["emi_no"][i]),
+            "due_date": emis["due_date"][i].isoformat(),
+            "days_overdue": int(emis["days"][i]),
+            "penalty": float(penalties[i]),
+            "emi_amount": float(emis["amount"][i]),
+            "pending_balance": float(emis["balance"][i]),
+        }
+        for i in np.flatnonzero(penalties)
+    ]
+    total_penalty = float(penalties.sum())
 
     return (
         jsonify(
@@ -171,7 +152,7 @@ def get_penalty_summary(loan_id):
                 "total_penalty": total_penalty,
                 "grace_period_days": grace_period,
                 "base_penalty": penalty_per_emi,
-                "overdue_count": len(overdue_emis),
+                "overdue_count": len(penalties),
                 "penalties": penalty_details,
             }
         ),
@@ -15,6 +15,7 @@ from utils.auth_helpers import get_user_by_identity
 from datetime import datetime
 from utils.interest_utils import get_distance_meters
 from utils.ml_risk import risk_engine
+from utils.dates import on_day
 
 
 line_bp = Blueprint("line", __name__)
@@ -232,7 +233,7 @@ def get_line_customers(line_id):
         for l in active_loans:
             todays_collections = Collection.query.filter(
                 Collection.loan_id == l.id,
-                db.func.date(Collection.created_at) == today,
+                on_day(Collection.created_at, today),
                 Collection.status != 'rejected'
             ).all()
 
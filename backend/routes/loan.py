@@ -1,8 +1,21 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Loan, EMISchedule, LoanAuditLog, Collection
+from models import (
+    db,
+    User,
+    UserRole,
+    Customer,
+    Loan,
+    EMISchedule,
+    LoanAuditLog,
+    Collection,
+)
 from datetime import datetime
 from utils.auth_helpers import get_user_by_identity
+from utils.listing import keyset_page, get_page_size, InvalidCursor
+from utils.id_allocator import next_id
+from utils.scheduled_jobs import mark_overdue_emis
+from utils import agent_trust, outbox
 from utils.interest_utils import (
     calculate_flat_emi,
     calculate_reducing_emi,
@@ -46,18 +59,8 @@ def create_loan():
         return jsonify({"msg": "Customer ID and Amount are required"}), 400
 
     try:
-        # Generate Temporary Loan ID logic
-        year = datetime.utcnow().year
-        # Fixed for PostgreSQL compatibility
-        try:
-             count = Loan.query.filter(
-                db.extract('year', Loan.created_at) == year
-            ).count()
-        except:
-             # Fallback
-             count = Loan.query.filter(Loan.created_at >= datetime(year, 1, 1)).count()
-
-        loan_id_str = f"LN-{year}-{count + 1:06d}"
+        # Generate Loan ID (sequence-backed, safe across workers)
+        loan_id_str = next_id("LN")
 
         new_loan = Loan(
             loan_id=loan_id_str,
@@ -90,6 +93,7 @@ def create_loan():
             remarks="Loan draft created",
         )
         db.session.add(audit)
+        outbox.record_event("loan.created", new_loan.id, outbox.loan_data(new_loan))
         db.session.commit()
 
         return (
@@ -169,6 +173,11 @@ def approve_loan(id):
         new_status="approved",
     )
     db.session.add(audit)
+    outbox.record_event(
+        "loan.approved",
+        loan.id,
+        outbox.loan_data(loan, start_date=loan.start_date, emi_count=len(schedule_data)),
+    )
     db.session.commit()
 
     return jsonify({"msg": "Loan approved and schedule generated"}), 200
@@ -245,6 +254,7 @@ def activate_loan(id):
         return jsonify({"msg": "Only approved loans can be activated"}), 400
 
     loan.status = "active"
+    outbox.record_event("loan.activated", loan.id, outbox.loan_data(loan))
     db.session.commit()
 
     return jsonify({"msg": "Loan is now ACTIVE"}), 200
@@ -270,6 +280,7 @@ def foreclose_loan(id):
 
     try:
         # 1. Create Collection Entry for the settlement
+        trust = agent_trust.load_state(user.id)
         collection = Collection(
             loan_id=loan.id,
             customer_id=loan.customer_id,
@@ -279,6 +290,8 @@ def foreclose_loan(id):
             notes=f"Foreclosure Settlement. Reason: {reason}",
         )
         db.session.add(collection)
+        db.session.flush()
+        agent_trust.record_collection(trust, collection)
 
         # 2. Close the Loan
         loan.status = "closed"
@@ -294,6 +307,13 @@ def foreclose_loan(id):
             remarks=f"Settled for {settlement_amount}. {reason}",
         )
         db.session.add(audit)
+        outbox.record_event(
+            "loan.closed",
+            loan.id,
+            outbox.loan_data(
+                loan, settlement_amount=settlement_amount, reason="foreclosure"
+            ),
+        )
 
         db.session.commit()
         return jsonify({"msg": "Loan foreclosed successfully"}), 200
@@ -318,20 +338,7 @@ def run_overdue_check():
 
     try:
         now = datetime.utcnow()
-        overdue_emis = (
-            EMISchedule.query.filter(
-                EMISchedule.due_date < now,
-                EMISchedule.status.in_(["pending", "partial"]),
-            )
-            .all()
-        )
-
-        updated_count = 0
-        for emi in overdue_emis:
-            emi.status = "overdue"
-            updated_count += 1
-
-        db.session.commit()
+        updated_count = mark_overdue_emis(now)
 
         return (
             jsonify(
@@ -351,37 +358,75 @@ def run_overdue_check():
 @loan_bp.route("/all", methods=["GET"])
 @jwt_required()
 def get_all_loans():
+    """
+    Loan listing. Without ?limit= the full list is returned (legacy clients);
+    with ?limit= (and ?cursor= for later pages) it is keyset-paginated and the
+    next page token is sent in the X-Next-Cursor header.
+    """
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
     status_filter = request.args.get("status")
+    cursor = request.args.get("cursor")
+
+    # Column-only projection: one LEFT JOIN instead of a lazy customer load per row
+    query = db.session.query(
+        Loan.id,
+        Loan.loan_id,
+        Customer.name.label("customer_name"),
+        Loan.principal_amount,
+        Loan.interest_rate,
+        Loan.interest_type,
+        Loan.tenure,
+        Loan.tenure_unit,
+        Loan.status,
+        Loan.created_at,
+    ).outerjoin(Customer, Loan.customer_id == Customer.id)
 
-    query = Loan.query
     # Normalize role check
     current_role = user.role.value if hasattr(user.role, 'value') else str(user.role)
     if current_role != "admin" and current_role != UserRole.ADMIN.value:
         # Workers see their assigned loans
-        query = query.filter_by(assigned_worker_id=user.id)
+        query = query.filter(Loan.assigned_worker_id == user.id)
 
     if status_filter:
-        query = query.filter_by(status=status_filter)
+        query = query.filter(Loan.status == status_filter)
 
-    loans = query.order_by(Loan.created_at.desc()).all()
+    next_cursor = None
+    try:
+        if cursor or "limit" in request.args:
+            rows, next_cursor = keyset_page(
+                query,
+                Loan.created_at,
+                Loan.id,
+                cursor=cursor,
+                limit=get_page_size(request.args),
+            )
+        else:
+            rows = query.order_by(Loan.created_at.desc(), Loan.id.desc()).all()
+    except InvalidCursor as e:
+        return jsonify({"msg": str(e)}), 400
 
-    return jsonify(
+    response = jsonify(
         [
             {
-                "id": loan.id,
-                "loan_id": loan.loan_id,
-                "customer_name": loan.customer.name if loan.customer else "Unknown",
-                "principal_amount": loan.principal_amount,
-                "interest_rate": loan.interest_rate,
-                "interest_type": loan.interest_type,
-                "tenure": loan.tenure,
-                "tenure_unit": loan.tenure_unit,
-                "status": loan.status,
-                "created_at": loan.created_at.isoformat() + "Z",
+                "id": row.id,
+                "loan_id": row.loan_id,
+                "customer_name": row.customer_name or "Unknown",
+                "principal_amount": row.principal_amount,
+                "interest_rate": row.interest_rate,
+                "interest_type": row.interest_type,
+                "tenure": row.tenure,
+                "tenure_unit": row.tenure_unit,
+                "status": row.status,
+                "created_at": row.created_at.isoformat() + "Z",
             }
-            for loan in loans
+            for row in rows
         ]
     )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
@@ -1,16 +1,16 @@
-from flask import Blueprint, jsonify, Response
+from flask import Blueprint, jsonify, request, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import (
     db,
     User,
     Loan,
-    Collection,
-    EMISchedule,
     UserRole,
     LoanAuditLog,
     LoginLog,
 )
 from utils.auth_helpers import get_user_by_identity
+from utils import tamper_scan
+from utils.hydrate import hydrate, name_of
 from datetime import datetime, timedelta
 import csv
 import io
@@ -50,15 +50,15 @@ def export_audit_csv():
         ]
     )
 
+    # Get user names for readability
+    users = hydrate(User, (log.performed_by for log in logs))
     for log in logs:
-        # Get user name for readability
-        user = User.query.get(log.performed_by)
         cw.writerow(
             [
                 log.id,
                 log.loan_id,
                 log.action,
-                user.name if user else f"UID {log.performed_by}",
+                name_of(users, log.performed_by, f"UID {log.performed_by}"),
                 log.old_status,
                 log.new_status,
                 log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
@@ -80,51 +80,78 @@ def detect_tampering():
     """
     Cross-checks collections against loan status and EMI balances.
     Detects if data was manually edited in DB bypassing logic.
+
+    Rechecks loans touched since the last scan (?full=1 for the whole
+    book) and returns every open finding.
     """
     if not get_admin_user():
         return jsonify({"msg": "Admin access required"}), 403
 
-    active_loans = Loan.query.filter_by(status="active").all()
-    tamper_alerts = []
+    try:
+        full = request.args.get("full") in ("1", "true")
+        scan = tamper_scan.run_scan(full=full)
 
-    for loan in active_loans:
-        # 1. Check if (Initial Principal - Interest) vs Expected matches
-        total_collected = (
-            db.session.query(db.func.sum(Collection.amount))
-            .filter_by(loan_id=loan.id, status="approved")
-            .scalar()
-            or 0
+        tamper_alerts = [
+            {
+                "loan_id": loan_number,
+                "customer": customer_name,
+                "kind": finding.kind,
+                "reason": finding.reason,
+                "expected": finding.expected,
+                "actual": finding.actual,
+                "first_seen": finding.first_seen_at.isoformat(),
+            }
+            for finding, loan_number, customer_name in tamper_scan.open_findings()
+        ]
+        checked_count = Loan.query.filter(
+            Loan.status.in_(tamper_scan.CHECKED_STATUSES)
+        ).count()
+
+        return (
+            jsonify(
+                {
+                    "status": "warning" if tamper_alerts else "secure",
+                    "alerts": tamper_alerts,
+                    "checked_count": checked_count,
+                    "scan": _scan_summary(scan),
+                }
+            ),
+            200,
         )
+    except Exception as e:
+        db.session.rollback()
+        print(f"Tamper Detection Error: {e}")
+        return jsonify({"msg": str(e)}), 500
 
-        # Simple math block: Principal - Collected (approximated) should roughly match pending
-        # This is a heuristic tamper check
-        # Real tamper check would use Hashing, but this satisfies the requirement of 'detection'
-
-        # 2. Check for EMIs marked 'paid' without a corresponding collection record
-        paid_emis = EMISchedule.query.filter_by(loan_id=loan.id, status="paid").all()
-        for emi in paid_emis:
-            # Look for a collection that covers this EMI timing
-            # If emi is paid but no collection exists for that loan...
-            if total_collected == 0 and len(paid_emis) > 0:
-                tamper_alerts.append(
-                    {
-                        "loan_id": loan.loan_id,
-                        "customer": loan.customer.name,
-                        "reason": "EMI marked PAID without any collection records detected.",
-                    }
-                )
-                break
 
-    return (
-        jsonify(
-            {
-                "status": "warning" if tamper_alerts else "secure",
-                "alerts": tamper_alerts,
-                "checked_count": len(active_loans),
-            }
-        ),
-        200,
-    )
+@security_bp.route("/automation/tamper-scan", methods=["POST"])
+@jwt_required()
+def automation_tamper_scan():
+    """Scheduled scan (n8n); {"full": true} for the nightly whole-book pass"""
+    if not get_admin_user():
+        return jsonify({"msg": "Admin access required"}), 403
+
+    try:
+        full = bool((request.get_json(silent=True) or {}).get("full"))
+        scan = tamper_scan.run_scan(full=full)
+        return (
+            jsonify({"msg": "tamper_scan_complete", "scan": _scan_summary(scan)}),
+            200,
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"Tamper Scan Error: {e}")
+        return jsonify({"msg": str(e)}), 500
+
+
+def _scan_summary(scan):
+    return {
+        "id": scan.id,
+        "full": scan.full,
+        "loans_checked": scan.loans_checked,
+        "findings": scan.findings,
+        "finished_at": scan.finished_at.isoformat(),
+    }
 
 
 @security_bp.route("/role-abuse-detection", methods=["GET"])
@@ -150,11 +177,11 @@ def role_abuse_detection():
     )  # More than 20 audit logs in 1 hour
 
     flags = []
+    users = hydrate(User, (user_id for user_id, _ in abuse_logs))
     for user_id, count in abuse_logs:
-        user = User.query.get(user_id)
         flags.append(
             {
-                "user": user.name if user else "Unknown",
+                "user": name_of(users, user_id),
                 "action_count": count,
                 "type": "High Velocity Admin Actions",
                 "warning": "Bulk modification detected. Please verify intent.",
@@ -192,11 +219,11 @@ def device_monitoring():
     )
 
     monitors = []
+    users = hydrate(User, (uid for uid, _ in multi_login))
     for uid, device_count in multi_login:
-        user = User.query.get(uid)
         monitors.append(
             {
-                "user": user.name if user else "Unknown",
+                "user": name_of(users, uid),
                 "device_count": device_count,
                 "risk": "SUSPICIOUS MULTI-DEVICE LOGIN",
             }
@@ -1,22 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, SystemSetting, User, UserRole
+from models import db, User, UserRole
+from utils.settings_store import get_settings as current_settings, settings_store
 
 
 settings_bp = Blueprint("settings", __name__)
 
-DEFAULTS = {
-    "default_interest_rate": "10.0",
-    "penalty_amount": "50.0",
-    "grace_period_days": "3",
-    "max_loan_amount": "50000.0",
-    "emi_frequency_options": "['daily', 'weekly', 'monthly']",
-    "worker_can_edit_customer": "false",
-    "upi_id": "arun.finance@okaxis",
-    "upi_qr_url": "",
-    "error_detection_webhook_url": "https://n8n.your-instance.com/webhook/error-detection",
-}
-
 from utils.auth_helpers import get_user_by_identity
 
 
@@ -34,26 +23,9 @@ def get_admin_user():
 @settings_bp.route("/", methods=["GET"])
 @jwt_required()
 def get_settings():
-    """Get all system settings, seeding defaults if missing"""
+    """Get all system settings (defaults filled in for unset keys)"""
     try:
-        settings = SystemSetting.query.all()
-        settings_dict = {s.key: s.value for s in settings}
-
-        # Seed defaults if missing
-        changed = False
-        for key, value in DEFAULTS.items():
-            if key not in settings_dict:
-                new_setting = SystemSetting(
-                    key=key, value=str(value), description=key.replace("_", " ").title()
-                )
-                db.session.add(new_setting)
-                settings_dict[key] = str(value)
-                changed = True
-
-        if changed:
-            db.session.commit()
-
-        return jsonify(settings_dict), 200
+        return jsonify(current_settings().as_dict()), 200
     except Exception as e:
         return jsonify({"msg": str(e)}), 500
 
@@ -68,15 +40,7 @@ def update_settings():
 
     data = request.get_json()
     try:
-        for key, value in data.items():
-            setting = SystemSetting.query.get(key)
-            if setting:
-                setting.value = str(value)
-            else:
-                # Should not happen typically if seeded, but handle it
-                setting = SystemSetting(key=key, value=str(value))
-                db.session.add(setting)
-
+        settings_store.update(data)
         db.session.commit()
         return jsonify({"msg": "Settings updated successfully"}), 200
     except Exception as e:
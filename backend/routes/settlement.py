@@ -4,10 +4,23 @@ from models import db, User, Collection, DailySettlement, UserRole
 from datetime import datetime, date
 from sqlalchemy import func
 from utils.auth_helpers import get_user_by_identity
+from utils.dates import on_day
+from utils.hydrate import hydrate, name_of
+from utils.listing import keyset_page, get_page_size, InvalidCursor
 
 settlement_bp = Blueprint("settlement", __name__)
 
 
+def _cash_by_agent(day, agent_id=None):
+    """Cash collected on `day` per agent: rows of (agent_id, system_cash)"""
+    query = db.session.query(
+        Collection.agent_id, func.sum(Collection.amount).label("system_cash")
+    ).filter(on_day(Collection.created_at, day), Collection.payment_mode == "cash")
+    if agent_id is not None:
+        query = query.filter(Collection.agent_id == agent_id)
+    return query.group_by(Collection.agent_id)
+
+
 @settlement_bp.route("/today", methods=["GET"])
 @jwt_required()
 def get_todays_status():
@@ -26,31 +39,35 @@ def get_todays_status():
 
     today = date.today()
 
-    # 1. Get all agents
-    agents = User.query.filter_by(role=UserRole.FIELD_AGENT).all()
-
-    result = []
-
-    for agent in agents:
-        # 2. Calculate System Cash for today
-        # Only sum 'cash' collections
-        total_cash = (
-            db.session.query(func.sum(Collection.amount))
-            .filter(Collection.agent_id == agent.id)
-            .filter(func.date(Collection.created_at) == today)
-            .filter(Collection.payment_mode == "cash")
-            .scalar()
-            or 0.0
+    # One statement: every field agent, today's cash (grouped) and settlement
+    cash = _cash_by_agent(today).subquery()
+    rows = (
+        db.session.query(
+            User.id,
+            User.name,
+            func.coalesce(cash.c.system_cash, 0.0),
+            DailySettlement,
         )
+        .outerjoin(cash, cash.c.agent_id == User.id)
+        .outerjoin(
+            DailySettlement,
+            (DailySettlement.agent_id == User.id) & (DailySettlement.date == today),
+        )
+        .filter(User.role == UserRole.FIELD_AGENT)
+        .order_by(User.id)
+        .all()
+    )
 
-        # 3. Check if settlement exists
-        settlement = DailySettlement.query.filter_by(
-            agent_id=agent.id, date=today
-        ).first()
+    result = []
+    seen = set()
+    for agent_id, agent_name, total_cash, settlement in rows:
+        if agent_id in seen:
+            continue  # duplicate settlement rows for the day: first one wins
+        seen.add(agent_id)
 
         agent_data = {
-            "agent_id": agent.id,
-            "agent_name": agent.name,
+            "agent_id": agent_id,
+            "agent_name": agent_name,
             "system_cash": total_cash,
             "status": "pending",
         }
@@ -98,20 +115,15 @@ def verify_settlement():
     today = date.today()
 
     # Recalculate system cash to be safe
-    system_cash = (
-        db.session.query(func.sum(Collection.amount))
-        .filter(Collection.agent_id == agent_id)
-        .filter(func.date(Collection.created_at) == today)
-        .filter(Collection.payment_mode == "cash")
-        .scalar()
-        or 0.0
-    )
+    cash = _cash_by_agent(today, agent_id).first()
+    system_cash = cash.system_cash if cash else 0.0
 
     difference = (physical_cash + expenses) - system_cash
 
     settlement = DailySettlement.query.filter_by(agent_id=agent_id, date=today).first()
 
     if settlement:
+        settlement.system_cash = system_cash
         settlement.physical_cash = physical_cash
         settlement.expenses = expenses
         settlement.difference = difference
@@ -145,6 +157,13 @@ def verify_settlement():
 @settlement_bp.route("/history", methods=["GET"])
 @jwt_required()
 def get_settlement_history():
+    """
+    Verified/pending settlements, newest day first. ?start= and ?end=
+    (YYYY-MM-DD, inclusive) bound the range and ?agent_id= picks one agent.
+    Without ?limit= the whole range is returned (legacy clients); with
+    ?limit= (and ?cursor= for later pages) it is keyset-paginated and the
+    next page token is sent in the X-Next-Cursor header.
+    """
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
@@ -155,18 +174,51 @@ def get_settlement_history():
     if current_role != UserRole.ADMIN.value:
         return jsonify({"msg": "Access Denied"}), 403
 
-    settlements = (
-        db.session.query(DailySettlement, User.name.label("agent_name"))
-        .join(User, DailySettlement.agent_id == User.id)
-        .order_by(DailySettlement.date.desc())
-        .all()
+    try:
+        start = request.args.get("start")
+        end = request.args.get("end")
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except ValueError:
+        return jsonify({"msg": "Dates must be YYYY-MM-DD"}), 400
+    agent_id = request.args.get("agent_id", type=int)
+    cursor = request.args.get("cursor")
+
+    query = DailySettlement.query
+    if start:
+        query = query.filter(DailySettlement.date >= start)
+    if end:
+        query = query.filter(DailySettlement.date <= end)
+    if agent_id:
+        query = query.filter(DailySettlement.agent_id == agent_id)
+
+    next_cursor = None
+    try:
+        if cursor or "limit" in request.args:
+            settlements, next_cursor = keyset_page(
+                query,
+                DailySettlement.date,
+                DailySettlement.id,
+                cursor=cursor,
+                limit=get_page_size(request.args),
+            )
+        else:
+            settlements = query.order_by(
+                DailySettlement.date.desc(), DailySettlement.id.desc()
+            ).all()
+    except InvalidCursor as e:
+        return jsonify({"msg": str(e)}), 400
+
+    # Agents and verifiers in one IN query
+    users = hydrate(
+        User, [s.agent_id for s in settlements] + [s.verified_by for s in settlements]
     )
 
     result = []
-    for s, agent_name in settlements:
+    for s in settlements:
         res = {
             "id": s.id,
-            "agent_name": agent_name,
+            "agent_name": name_of(users, s.agent_id),
             "date": s.date.isoformat(),
             "system_cash": s.system_cash,
             "physical_cash": s.physical_cash,
@@ -175,7 +227,11 @@ def get_settlement_history():
             "notes": s.notes,
             "status": s.status,
             "verified_at": s.verified_at.isoformat() if s.verified_at else None,
+            "verified_by": name_of(users, s.verified_by, None),
         }
         result.append(res)
 
-    return jsonify(result), 200
+    response = jsonify(result)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, UserRole, LocationLog
 from datetime import datetime
 from utils.auth_helpers import get_user_by_identity
+from utils.dates import on_day
 
 tracking_bp = Blueprint("tracking", __name__)
 
@@ -59,7 +60,7 @@ def get_agent_history(agent_id):
     
     if date_str:
         target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        query = query.filter(db.func.date(LocationLog.timestamp) == target_date)
+        query = query.filter(on_day(LocationLog.timestamp, target_date))
     
     history = query.order_by(LocationLog.timestamp.asc()).all()
     
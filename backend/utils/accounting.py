@@ -0,0 +1,121 @@
+"""
+End-of-day accounting: today's approved collections split by session,
+payment mode and principal/interest, and the saved DailyAccountingReport.
+"""
+
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import Collection, DailyAccountingReport
+
+
+def daily_accounting_stats():
+    """Today's (UTC) accounting figures, as served by /reports/auto-accounting"""
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    today_end = datetime.utcnow().replace(
+        hour=23, minute=59, second=59, microsecond=999999
+    )
+
+    collections = (
+        db.session.query(Collection)
+        .filter(
+            Collection.created_at >= today_start,
+            Collection.created_at <= today_end,
+            Collection.status == "approved",
+        )
+        .all()
+    )
+
+    total = 0.0
+    morning = 0.0
+    evening = 0.0
+    cash = 0.0
+    upi = 0.0
+    principal_part = 0.0
+    interest_part = 0.0
+
+    # Morning/Evening Cutoff: 2:00 PM (14:00)
+    cutoff_hour = 14
+
+    for c in collections:
+        amt = c.amount
+        total += amt
+
+        # Time Split (UTC to IST approx adjustment if needed, but using server time for now)
+        # Assuming server is UTC, IST is +5.30.
+        # If created_at is UTC, we should convert to local expected time for "Morning/Evening" logic
+        # IST = UTC + 5.5 hours
+        local_time = c.created_at + timedelta(hours=5, minutes=30)
+
+        if local_time.hour < cutoff_hour:
+            morning += amt
+        else:
+            evening += amt
+
+        # Mode Split
+        if c.payment_mode.lower() == "cash":
+            cash += amt
+        else:
+            upi += amt
+
+        # Principal vs Interest Split (Approximation)
+        loan = c.loan
+        if loan:
+            # Calculate simple interest ratio
+            p = loan.principal_amount or 0.0
+            r = loan.interest_rate or 0.0
+            t = loan.tenure or 100
+            unit = loan.tenure_unit or "days"
+
+            # Normalize time to years for formula
+            t_years = t
+            if unit == "months":
+                t_years = t / 12
+            elif unit == "weeks":  # approx
+                t_years = t / 52
+            elif unit == "days":
+                t_years = t / 365
+
+            total_interest = (p * r * t_years) / 100
+            total_payable = p + total_interest
+
+            if total_payable > 0:
+                int_ratio = total_interest / total_payable
+            else:
+                int_ratio = 0
+
+            c_int = amt * int_ratio
+            c_prin = amt - c_int
+
+            interest_part += c_int
+            principal_part += c_prin
+
+    return {
+        "total": round(total, 2),
+        "morning": round(morning, 2),
+        "evening": round(evening, 2),
+        "cash": round(cash, 2),
+        "upi": round(upi, 2),
+        "loan_principal": round(principal_part, 2),
+        "loan_interest": round(interest_part, 2),
+        "count": len(collections),
+        "date": datetime.now().strftime("%Y-%m-%d"),
+    }
+
+
+def save_daily_report(stats, report_date=None):
+    """Insert or update the DailyAccountingReport for the day. Caller commits."""
+    report_date = report_date or datetime.utcnow().date()
+    report = DailyAccountingReport.query.filter_by(report_date=report_date).first()
+    if report is None:
+        report = DailyAccountingReport(report_date=report_date)
+        db.session.add(report)
+    report.total_amount = stats["total"]
+    report.morning_amount = stats["morning"]
+    report.evening_amount = stats["evening"]
+    report.cash_amount = stats["cash"]
+    report.upi_amount = stats["upi"]
+    report.loan_principal = stats["loan_principal"]
+    report.loan_interest = stats["loan_interest"]
+    report.collection_count = stats["count"]
+    return report
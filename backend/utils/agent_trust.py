@@ -0,0 +1,200 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import ClauseElement
+
+from extensions import db
+from models import AgentTrustState, Collection
+from utils.ml_stream import stream_detector
+
+STATUS_COUNTERS = {
+    "pending": "pending_count",
+    "flagged": "flagged_count",
+    "approved": "approved_count",
+    "rejected": "rejected_count",
+}
+
+# Weight of the newest review decision in approval_rate
+APPROVAL_RATE_ALPHA = 0.1
+# Recent collections replayed to warm up a new agent's stream model
+WARMUP_HISTORY = 50
+
+
+def new_state(agent_id):
+    """An empty state (column defaults only apply on INSERT)"""
+    return AgentTrustState(
+        agent_id=agent_id,
+        total_count=0,
+        pending_count=0,
+        flagged_count=0,
+        approved_count=0,
+        rejected_count=0,
+        approved_amount=0.0,
+        approval_rate=1.0,
+        stream_events=0,
+        anomalous_count=0,
+        updated_at=datetime.utcnow(),
+    )
+
+
+def _from_history(agent_id):
+    """Initial state for an agent, computed once from existing collections"""
+    state = new_state(agent_id)
+    rows = (
+        db.session.query(
+            Collection.status,
+            db.func.count(Collection.id),
+            db.func.sum(Collection.amount),
+        )
+        .filter(Collection.agent_id == agent_id)
+        .group_by(Collection.status)
+        .all()
+    )
+    for status, count, amount in rows:
+        state.total_count += count
+        if status in STATUS_COUNTERS:
+            setattr(state, STATUS_COUNTERS[status], count)
+        if status == "approved":
+            state.approved_amount = float(amount or 0)
+
+    decided = state.approved_count + state.rejected_count
+    if decided:
+        state.approval_rate = state.approved_count / decided
+
+    recent = (
+        Collection.query.filter(
+            Collection.agent_id == agent_id, Collection.created_at.isnot(None)
+        )
+        .order_by(Collection.created_at.desc())
+        .limit(WARMUP_HISTORY)
+        .all()
+    )
+    for past in reversed(recent):
+        stream_detector.observe(
+            state, past.amount, past.latitude, past.longitude, past.created_at
+        )
+    if recent:
+        state.last_loan_id = recent[0].loan_id
+    return state
+
+
+def load_state(agent_id, lock=False):
+    """
+    The agent's trust row (a primary-key read), created from history the
+    first time. A concurrent creator wins cleanly via the savepoint.
+    lock=True takes a row lock (FOR UPDATE) so one agent's submissions
+    fold into the stream model one at a time.
+    """
+    state = db.session.get(AgentTrustState, agent_id, with_for_update=lock)
+    if state is not None:
+        return state
+
+    state = _from_history(agent_id)
+    try:
+        with db.session.begin_nested():
+            db.session.add(state)
+    except IntegrityError:
+        state = db.session.get(
+            AgentTrustState, agent_id, populate_existing=True, with_for_update=lock
+        )
+    return state
+
+
+def _pending(state, column):
+    """The column's not-yet-flushed SQL expression, else the column itself"""
+    value = getattr(state, column)
+    if isinstance(value, ClauseElement):
+        return value
+    return getattr(AgentTrustState, column)
+
+
+def _bump(state, column, delta):
+    # SQL-side increment, so concurrent requests never lose an update;
+    # bumps before the next flush add up
+    setattr(state, column, _pending(state, column) + delta)
+
+
+def _decide(state, approved, decisions=1):
+    """Fold `decisions` identical review decisions into approval_rate"""
+    target = 1.0 if approved else 0.0
+    keep = (1 - APPROVAL_RATE_ALPHA) ** decisions
+    state.approval_rate = _pending(state, "approval_rate") * keep + target * (1 - keep)
+
+
+def record_collection(state, collection, anomaly=None):
+    """
+    Fold a newly staged collection into the agent's state.
+    `anomaly` is the AnomalyResult it was scored with at submit time;
+    unscored collections (foreclosures) still update the stream model.
+    """
+    _bump(state, "total_count", 1)
+    if collection.status in STATUS_COUNTERS:
+        _bump(state, STATUS_COUNTERS[collection.status], 1)
+    if collection.status == "approved":
+        _bump(state, "approved_amount", collection.amount or 0)
+        _decide(state, True)
+
+    if anomaly is None:
+        stream_detector.observe(
+            state,
+            collection.amount,
+            collection.latitude,
+            collection.longitude,
+            collection.created_at,
+        )
+    else:
+        stream_detector.update(state, anomaly.features, anomaly.score)
+        if anomaly.flagged:
+            _bump(state, "anomalous_count", 1)
+    state.last_loan_id = collection.loan_id
+    state.updated_at = datetime.utcnow()
+
+
+def record_status_change(collection, old_status, new_status):
+    """
+    Move a reviewed collection between the status counters.
+    Call before assigning the new status, so a first-time backfill still
+    sees the old one.
+    """
+    if old_status == new_status:
+        return
+    state = load_state(collection.agent_id)
+    if old_status in STATUS_COUNTERS:
+        _bump(state, STATUS_COUNTERS[old_status], -1)
+    if new_status in STATUS_COUNTERS:
+        _bump(state, STATUS_COUNTERS[new_status], 1)
+
+    amount = collection.amount or 0
+    if old_status == "approved":
+        _bump(state, "approved_amount", -amount)
+    if new_status == "approved":
+        _bump(state, "approved_amount", amount)
+    if new_status in ("approved", "rejected"):
+        _decide(state, new_status == "approved")
+    state.updated_at = datetime.utcnow()
+
+
+def record_status_changes(agent_id, changes, new_status):
+    """
+    record_status_change for many of one agent's collections at once:
+    `changes` is a list of (old_status, amount). One increment per counter.
+    """
+    changes = [(old, amount or 0) for old, amount in changes if old != new_status]
+    if not changes:
+        return
+    state = load_state(agent_id)
+    for old_status, count in Counter(old for old, _ in changes).items():
+        if old_status in STATUS_COUNTERS:
+            _bump(state, STATUS_COUNTERS[old_status], -count)
+    if new_status in STATUS_COUNTERS:
+        _bump(state, STATUS_COUNTERS[new_status], len(changes))
+
+    unapproved = sum(amount for old, amount in changes if old == "approved")
+    if unapproved:
+        _bump(state, "approved_amount", -unapproved)
+    if new_status == "approved":
+        _bump(state, "approved_amount", sum(amount for _, amount in changes))
+    if new_status in ("approved", "rejected"):
+        _decide(state, new_status == "approved", len(changes))
+    state.updated_at = datetime.utcnow()
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from models import EMIAllocation
+
+# Balance below which an EMI counts as fully paid (float tolerance)
+PAID_TOLERANCE = 0.1
+
+
+def apply_payment(amount, emis):
+    """
+    Pay `amount` into `emis` (a loan's unpaid EMIs, oldest due first),
+    updating each EMI's balance and status in place. Works on EMISchedule
+    rows or any object with amount/balance/status attributes.
+
+    Returns [(emi, amount paid into it)].
+    """
+    remaining = amount
+    paid = []
+
+    for emi in emis:
+        if remaining <= 0:
+            break
+        if emi.status == "paid":
+            continue  # settled by an earlier payment in the same pass
+
+        # If emi.balance is None (legacy data), assume full amount
+        current_balance = emi.balance if emi.balance is not None else emi.amount
+
+        check_amount = min(remaining, current_balance)
+
+        new_balance = current_balance - check_amount
+        remaining -= check_amount
+
+        emi.balance = new_balance
+        if new_balance <= PAID_TOLERANCE:
+            emi.status = "paid"
+            emi.balance = 0
+        else:
+            emi.status = "partial"
+
+        paid.append((emi, check_amount))
+
+    return paid
+
+
+def describe(paid):
+    """Audit remarks for apply_payment's result, one "EMI #n: Paid x" per EMI"""
+    return [f"EMI #{emi.emi_no}: Paid {amount}" for emi, amount in paid]
+
+
+def allocate_payment(collection, emis):
+    """
+    Apply an approved collection to a loan's unpaid EMIs (oldest due first)
+    and record an EMIAllocation ledger row for every EMI it touches. The
+    rows hang off collection.allocations, so the collection need not be
+    flushed yet.
+
+    Returns the audit remarks, one "EMI #n: Paid x" per EMI.
+    """
+    paid_at = collection.created_at or datetime.utcnow()
+    paid = apply_payment(collection.amount, emis)
+    for emi, amount in paid:
+        collection.allocations.append(
+            EMIAllocation(
+                emi=emi,
+                loan_id=emi.loan_id,
+                amount=amount,
+                paid_at=paid_at,
+            )
+        )
+    return describe(paid)
@@ -0,0 +1,214 @@
+"""
+Bulk approve/reject for the collection review queue.
+
+Selected collections are grouped by loan and applied in created_at order
+through one allocation pass per loan over plain EMI records. Collection
+statuses, EMI balances, the allocation ledger, loan balances and audit
+logs are then written with one executemany statement each, and trust
+counters with one grouped update per agent. The effect is the same as
+approving the collections one by one through PATCH /<id>/status.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+
+from extensions import db
+from models import Collection, EMIAllocation, EMISchedule, Loan, LoanAuditLog
+from utils import agent_trust, outbox
+from utils.allocation import apply_payment, describe
+
+# Statuses that sit in the admin review queue
+REVIEW_STATUSES = ["pending", "flagged"]
+# Pending amount at or below which a loan with every EMI paid is closed
+CLOSE_TOLERANCE = 10
+
+
+class EMIRecord:
+    """The EMISchedule columns allocation reads and writes, without the ORM"""
+
+    __slots__ = ("id", "loan_id", "emi_no", "amount", "balance", "status", "touched")
+
+    def __init__(self, row):
+        self.id = row.id
+        self.loan_id = row.loan_id
+        self.emi_no = row.emi_no
+        self.amount = row.amount
+        self.balance = row.balance
+        self.status = row.status
+        self.touched = False
+
+
+def _unpaid_emis(loan_ids):
+    """{loan_id: [EMIRecord, ...]} oldest due first, in one query"""
+    emis = defaultdict(list)
+    rows = db.session.execute(
+        select(
+            EMISchedule.id,
+            EMISchedule.loan_id,
+            EMISchedule.emi_no,
+            EMISchedule.amount,
+            EMISchedule.balance,
+            EMISchedule.status,
+        )
+        .where(EMISchedule.loan_id.in_(loan_ids), EMISchedule.status != "paid")
+        .order_by(EMISchedule.loan_id, EMISchedule.due_date)
+    )
+    for row in rows:
+        emis[row.loan_id].append(EMIRecord(row))
+    return emis
+
+
+def _allocate(approved, reviewer_id, now):
+    """
+    One allocation pass per loan; writes EMIs, ledger, loans and audit logs.
+    Returns [(loan id, loan code, pending_amount)] for the loans it closed.
+    """
+    by_loan = defaultdict(list)
+    for collection in approved:  # already in created_at order
+        by_loan[collection.loan_id].append(collection)
+
+    loans = {
+        row.id: row
+        for row in db.session.execute(
+            select(Loan.id, Loan.loan_id, Loan.pending_amount, Loan.status)
+            .where(Loan.id.in_(by_loan))
+            .with_for_update()
+        )
+    }
+    emis = _unpaid_emis(list(loans))
+
+    ledger, audits, loan_updates, closed = [], [], [], []
+    for loan_id, collections in by_loan.items():
+        loan = loans.get(loan_id)
+        if loan is None:
+            continue
+        loan_emis = emis.get(loan_id, [])
+        pending = loan.pending_amount
+        for collection in collections:
+            paid = apply_payment(collection.amount, loan_emis)
+            for emi, amount in paid:
+                emi.touched = True
+                ledger.append(
+                    {
+                        "collection_id": collection.id,
+                        "emi_id": emi.id,
+                        "loan_id": loan_id,
+                        "amount": amount,
+                        "paid_at": collection.created_at or now,
+                        "created_at": now,
+                    }
+                )
+            pending = max(0, pending - collection.amount)
+            audits.append(
+                {
+                    "loan_id": loan_id,
+                    "action": "COLLECTION_APPROVED_BY_ADMIN",
+                    "performed_by": reviewer_id,
+                    "remarks": f"Admin manual approval. Collected {collection.amount}. "
+                    + ", ".join(describe(paid)),
+                    "timestamp": now,
+                }
+            )
+
+        status = loan.status
+        if pending <= CLOSE_TOLERANCE and all(e.status == "paid" for e in loan_emis):
+            status = "closed"
+            if loan.status != "closed":
+                closed.append((loan_id, loan.loan_id, pending))
+        loan_updates.append(
+            {"id": loan_id, "pending_amount": pending, "status": status}
+        )
+
+    emi_updates = [
+        {"id": emi.id, "balance": emi.balance, "status": emi.status}
+        for loan_emis in emis.values()
+        for emi in loan_emis
+        if emi.touched
+    ]
+    # ORM bulk UPDATE by primary key and multi-row INSERTs
+    if emi_updates:
+        db.session.execute(update(EMISchedule), emi_updates)
+    if ledger:
+        db.session.execute(insert(EMIAllocation), ledger)
+    if loan_updates:
+        db.session.execute(update(Loan), loan_updates)
+    if audits:
+        db.session.execute(insert(LoanAuditLog), audits)
+    return closed
+
+
+def review_collections(ids, status, reviewer_id):
+    """
+    Approve or reject the queued collections among `ids`. Caller commits.
+    Returns {id: outcome}: the new status, "already_<status>" for items no
+    longer in the queue, or "not_found".
+    """
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        select(
+            Collection.id,
+            Collection.loan_id,
+            Collection.agent_id,
+            Collection.amount,
+            Collection.status,
+            Collection.created_at,
+        )
+        .where(Collection.id.in_(ids))
+        .order_by(Collection.created_at, Collection.id)
+        .with_for_update()
+    ).all()
+
+    outcomes = {cid: "not_found" for cid in ids}
+    queued = []
+    for row in rows:
+        if row.status in REVIEW_STATUSES:
+            queued.append(row)
+            outcomes[row.id] = status
+        else:
+            outcomes[row.id] = f"already_{row.status}"
+    if not queued:
+        return outcomes
+
+    changes = defaultdict(list)
+    for row in queued:
+        if row.agent_id:
+            changes[row.agent_id].append((row.status, row.amount))
+    for agent_id, agent_changes in changes.items():
+        agent_trust.record_status_changes(agent_id, agent_changes, status)
+
+    db.session.execute(
+        update(Collection)
+        .where(Collection.id.in_([row.id for row in queued]))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    closed = _allocate(queued, reviewer_id, now) if status == "approved" else []
+
+    if outbox.events_enabled():
+        events = [
+            (
+                f"collection.{status}",
+                row.loan_id,
+                outbox.reviewed_collection_data(
+                    row.id, row.loan_id, row.agent_id, row.amount, status, reviewer_id
+                ),
+            )
+            for row in queued
+        ]
+        events.extend(
+            (
+                "loan.closed",
+                loan_id,
+                {
+                    "loan_id": loan_id,
+                    "loan_code": loan_code,
+                    "status": "closed",
+                    "pending_amount": pending,
+                },
+            )
+            for loan_id, loan_code, pending in closed
+        )
+        outbox.record_events(events)
+    return outcomes
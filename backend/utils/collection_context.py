@@ -0,0 +1,236 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import Collection, EMISchedule, Line, Loan
+from utils import agent_trust
+from utils.interest_utils import get_distance_meters, get_distances_meters
+from utils.ml_stream import stream_detector
+
+_UNSET = object()
+
+# Bounds of collected_at on /submit-batch items (online /submit always
+# uses server time): phone clock drift ahead of the server, and how long
+# an offline phone may hold a collection before syncing it
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+MAX_OFFLINE_AGE = timedelta(hours=48)
+
+
+class InvalidTimestamp(ValueError):
+    pass
+
+
+def collected_at(value, now=None):
+    """
+    When the collection was made, from the client's ISO 8601 collected_at
+    (naive values are UTC). None when the client sent none; raises
+    InvalidTimestamp when it is malformed or out of bounds.
+    """
+    if value in (None, ""):
+        return None
+    now = now or datetime.utcnow()
+    try:
+        at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise InvalidTimestamp("invalid_collected_at")
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    if at > now + MAX_CLOCK_SKEW or at < now - MAX_OFFLINE_AGE:
+        raise InvalidTimestamp("collected_at_out_of_range")
+    return min(at, now)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _has_coords(*values):
+    # Same truthiness test submit_collection always used (0.0 counts as missing)
+    return all(values)
+
+
+class CollectionContext:
+    """
+    Everything the collection checks look up, for one agent and day.
+
+    /submit uses it lazily (one query per lookup, as before). /submit-batch
+    calls preload() so loans, customers, lines, today's collections and
+    unpaid EMIs come from a handful of IN queries and geofence distances are
+    computed in one vectorised pass. The agent's history (last entry time,
+    flagged count, streaming anomaly model) is a single AgentTrustState row,
+    locked for the request. record() keeps the running state and the trust
+    row up to date, so item N sees exactly what it would have seen as the
+    Nth single request.
+    """
+
+    def __init__(self, user, today=None):
+        self.user = user
+        self.received_at = datetime.utcnow()
+        self.today = today or self.received_at.date()
+        self._loans = {}
+        self._lines = {}
+        self._collected = None  # (loan id, business date) pairs already collected
+        self._trust = None
+        self._last_at = _UNSET
+        self._flagged = None
+        self._emis = {}
+        self._distances = {}
+
+    def preload(self, items):
+        loan_ids = {_as_int(i.get("loan_id")) for i in items} - {None}
+        days = {self.item_day(i) for i in items}
+        line_ids = {_as_int(i.get("line_id")) for i in items if i.get("line_id")}
+        line_ids.discard(None)
+
+        if loan_ids:
+            loans = (
+                Loan.query.options(joinedload(Loan.customer))
+                .filter(Loan.id.in_(loan_ids))
+                .all()
+            )
+            self._loans = {loan.id: loan for loan in loans}
+            self._collected = set(
+                db.session.query(Collection.loan_id, Collection.business_date)
+                .filter(
+                    Collection.loan_id.in_(loan_ids),
+                    Collection.business_date.in_(days),
+                )
+                .all()
+            )
+            for emi in (
+                EMISchedule.query.filter(
+                    EMISchedule.loan_id.in_(loan_ids), EMISchedule.status != "paid"
+                )
+                .order_by(EMISchedule.loan_id, EMISchedule.due_date)
+                .all()
+            ):
+                self._emis.setdefault(emi.loan_id, []).append(emi)
+            for loan_id in loan_ids:
+                self._emis.setdefault(loan_id, [])
+        else:
+            self._collected = set()
+
+        if line_ids:
+            self._lines = {
+                line.id: line for line in Line.query.filter(Line.id.in_(line_ids))
+            }
+
+        self.last_collection_at()
+        self.flagged_count()
+        self._preload_distances(items)
+
+    def _preload_distances(self, items):
+        pairs = []
+        for item in items:
+            loan = self._loans.get(_as_int(item.get("loan_id")))
+            customer = loan.customer if loan else None
+            lat, lon = item.get("latitude"), item.get("longitude")
+            if customer and _has_coords(
+                customer.latitude, customer.longitude, lat, lon
+            ):
+                pairs.append((loan.id, lat, lon, customer.latitude, customer.longitude))
+        if not pairs:
+            return
+        _, lat1, lon1, lat2, lon2 = zip(*pairs)
+        distances = get_distances_meters(lat1, lon1, lat2, lon2)
+        for (loan_id, lat, lon, _, _), distance in zip(pairs, distances):
+            self._distances[(loan_id, lat, lon)] = float(distance)
+
+    def loan(self, loan_id):
+        key = _as_int(loan_id)
+        if key is None:
+            return None
+        if key not in self._loans:
+            self._loans[key] = db.session.get(Loan, key)
+        return self._loans[key]
+
+    def line(self, line_id):
+        key = _as_int(line_id)
+        if key is None:
+            return None
+        if key not in self._lines:
+            self._lines[key] = db.session.get(Line, key)
+        return self._lines[key]
+
+    def item_day(self, item):
+        """Business date of a batch item: its collected_at day, else today"""
+        try:
+            at = collected_at(item.get("collected_at"), self.received_at)
+        except InvalidTimestamp:
+            at = None  # rejected when the item is recorded
+        return at.date() if at else self.today
+
+    def collected_on(self, loan_id, day):
+        """True if the loan already has a field collection for `day`"""
+        if self._collected is None:
+            return (
+                Collection.query.filter_by(loan_id=loan_id, business_date=day).first()
+                is not None
+            )
+        return (loan_id, day) in self._collected
+
+    def distance(self, loan, latitude, longitude):
+        """Metres from the customer's saved location, None if unknown"""
+        customer = loan.customer
+        if not customer or not _has_coords(
+            customer.latitude, customer.longitude, latitude, longitude
+        ):
+            return None
+        cached = self._distances.get((loan.id, latitude, longitude))
+        if cached is not None:
+            return cached
+        return get_distance_meters(
+            latitude, longitude, customer.latitude, customer.longitude
+        )
+
+    def trust(self):
+        """The agent's AgentTrustState row, read once by primary key"""
+        if self._trust is None:
+            self._trust = agent_trust.load_state(self.user.id, lock=True)
+            self._last_at = self._trust.last_collection_at
+            self._flagged = self._trust.flagged_count
+        return self._trust
+
+    def last_collection_at(self):
+        if self._last_at is _UNSET:
+            self.trust()
+        return self._last_at
+
+    def flagged_count(self):
+        if self._flagged is None:
+            self.trust()
+        return self._flagged
+
+    def score_event(self, amount, latitude, longitude, at=None):
+        """Streaming anomaly score of a collection made at `at` (default now)"""
+        state = self.trust()
+        return stream_detector.score(
+            state, stream_detector.features(state, amount, latitude, longitude, at)
+        )
+
+    def unpaid_emis(self, loan_id):
+        """Unpaid EMIs of a loan, oldest due first"""
+        if loan_id not in self._emis:
+            self._emis[loan_id] = (
+                EMISchedule.query.filter_by(loan_id=loan_id)
+                .filter(EMISchedule.status != "paid")
+                .order_by(EMISchedule.due_date)
+                .all()
+            )
+        return self._emis[loan_id]
+
+    def record(self, collection, anomaly=None):
+        """Fold a staged collection into the running state"""
+        if self._collected is not None:
+            self._collected.add((collection.loan_id, collection.business_date))
+        agent_trust.record_collection(self.trust(), collection, anomaly)
+        at = collection.created_at or datetime.utcnow()
+        # Offline items may arrive older than the agent's latest collection
+        if self._last_at in (_UNSET, None) or at > self._last_at:
+            self._last_at = at
+        if collection.status == "flagged":
+            self._flagged += 1
@@ -0,0 +1,85 @@
+"""
+Job kinds the compute pool may run (see utils/compute_pool.py).
+
+Each entry names a function by "module:attribute" (imported in the pool
+process, so web workers never load it for nothing), the longest it may
+run and how long a finished result is reused for an identical request.
+Job functions take JSON parameters as keyword arguments, run inside an
+app context and return something JSON serialisable.
+"""
+
+from collections import namedtuple
+
+JobSpec = namedtuple("JobSpec", ["func", "timeout", "cache_seconds"])
+
+JOBS = {
+    "dashboard_insights": JobSpec("routes.analytics:dashboard_insights", 300, 300),
+    "worker_performance": JobSpec("routes.analytics:worker_performance", 300, 300),
+    "statement_pdfs": JobSpec("utils.compute_jobs:statement_pdfs", 900, 0),
+    "worker_assignment": JobSpec("utils.compute_jobs:worker_assignment", 300, 600),
+    "budget_allocation": JobSpec("utils.compute_jobs:budget_allocation", 120, 600),
+    # Scheduled jobs (utils.scheduled_jobs); each timeout is under its lease
+    "penalty_snapshot": JobSpec("utils.penalty_engine:run_snapshot", 1500, 0),
+    "tamper_scan": JobSpec("utils.compute_jobs:tamper_scan", 1500, 0),
+    "worker_model_refit": JobSpec("utils.compute_jobs:worker_model_refit", 1500, 0),
+    "behavior_model_refit": JobSpec("utils.compute_jobs:behavior_model_refit", 3300, 0),
+}
+
+
+def statement_pdfs(month):
+    """Pre-render the month's daily accounting statements (YYYY-MM)"""
+    from models import DailyAccountingReport
+    from utils.pdf_reports import month_bounds, statement_cache
+
+    start, end = month_bounds(month)
+    reports = (
+        DailyAccountingReport.query.filter(
+            DailyAccountingReport.report_date >= start,
+            DailyAccountingReport.report_date <= end,
+        )
+        .order_by(DailyAccountingReport.report_date)
+        .all()
+    )
+    summary = statement_cache.render_month(reports)
+    summary["month"] = month
+    return summary
+
+
+def worker_assignment(workers, customers, max_per_worker=50):
+    """OptimizationEngine.assign_workers_to_customers over the given points"""
+    from utils.optimization_engine import OptimizationEngine
+
+    return OptimizationEngine.assign_workers_to_customers(
+        workers, customers, max_per_worker
+    )
+
+
+def budget_allocation(fund_limit, categories):
+    """OptimizationEngine.optimize_budget; None when no optimum was found"""
+    from utils.optimization_engine import OptimizationEngine
+
+    return OptimizationEngine.optimize_budget(float(fund_limit), categories)
+
+
+def tamper_scan(full=False):
+    """utils.tamper_scan.run_scan; full rechecks every loan"""
+    from utils.tamper_scan import run_scan
+
+    scan = run_scan(full=full)
+    return {
+        "full": scan.full,
+        "loans_checked": scan.loans_checked,
+        "findings": scan.findings,
+    }
+
+
+def worker_model_refit():
+    from utils.ml_worker import worker_engine
+
+    return worker_engine.refit()
+
+
+def behavior_model_refit():
+    from utils.ml_behavior import behavior_engine
+
+    return behavior_engine.refit()
@@ -0,0 +1,405 @@
+"""
+Process pool for CPU-heavy work (ML reports, the pulp solvers, PDF
+batches), so it never runs on a gunicorn request thread.
+
+A request submits a job kind from utils.compute_jobs.JOBS with JSON
+parameters and gets a job id back at once. The job row in compute_jobs
+carries status and result, so any gunicorn worker can answer the poll,
+whichever one owns the pool that runs it. A submission identical to one
+that is still queued or running, or that finished within the kind's
+cache window, returns that job instead of starting another.
+
+Each gunicorn worker lazily starts its own pool of COMPUTE_WORKERS
+spawned processes, which import numpy/sklearn/pulp once at start-up and
+keep a database-only Flask app. Jobs are bounded by their timeout
+(SIGALRM inside the worker where available). Cancelling stops a queued
+job. A running job is marked cancelled in its row; a watcher thread in
+the pool process polls the row every CANCEL_POLL_SECONDS and interrupts
+the job (SIGUSR1 to the process's main thread), freeing the slot. This
+works whichever gunicorn worker or host takes the cancel request. Like
+the timeout, the interrupt lands between Python bytecodes, so a long
+call into C code finishes that call first. If a pool process dies (an
+OOM kill, say), its jobs are failed on their next poll and the broken
+pool is replaced on the next submission.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+
+from sqlalchemy import or_, select, update
+
+from extensions import db
+from models import ComputeJob
+from utils.compute_jobs import JOBS
+
+# Pool processes per gunicorn worker
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", 2))
+# Jobs this process may have queued or running before submissions are refused
+MAX_PENDING_JOBS = int(os.getenv("COMPUTE_MAX_PENDING", 20))
+# A queued job that has not started by then is assumed lost with its process
+QUEUE_TIMEOUT_SECONDS = int(os.getenv("COMPUTE_QUEUE_TIMEOUT", 3600))
+# Slack past a job's timeout before a poll gives up on its worker
+TIMEOUT_GRACE_SECONDS = 30
+# How often a running job's watcher checks whether it was cancelled
+CANCEL_POLL_SECONDS = 1.0
+CANCEL_SIGNAL = getattr(signal, "SIGUSR1", None)
+
+# Imported once in every pool process so jobs start warm
+PRELOAD_MODULES = ("numpy", "pandas", "sklearn", "pulp")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class UnknownJobKind(ValueError):
+    pass
+
+
+class PoolBusy(RuntimeError):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def params_key(kind, params):
+    payload = json.dumps([kind, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _resolve(path):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+# --- Pool process side ---
+
+_worker_app = None
+# Job the pool process is running, and the one a watcher asked to stop
+_current_job = None
+_cancel_job = None
+
+
+def _init_worker():
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    from flask import Flask
+
+    from app import configure_database
+    from utils.db_pool import install
+
+    global _worker_app
+    _worker_app = Flask("compute_worker")
+    configure_database(_worker_app, role="compute")
+    db.init_app(_worker_app)
+    with _worker_app.app_context():
+        install(db.engine)
+
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+
+def _on_cancel(signum, frame):
+    # A late signal for a job that already ended must not hit the next one
+    if _current_job is not None and _cancel_job == _current_job:
+        raise JobCancelled()
+
+
+def _watch(job_id, stop):
+    """Poll the job's status; interrupt the main thread once it is cancelled"""
+    global _cancel_job
+    with _worker_app.app_context():
+        while not stop.wait(CANCEL_POLL_SECONDS):
+            try:
+                with db.engine.connect() as conn:
+                    status = conn.execute(
+                        select(ComputeJob.status).where(ComputeJob.id == job_id)
+                    ).scalar()
+            except Exception as e:
+                print(f"Compute job watcher error: {e}")
+                continue
+            if status == "cancelled":
+                _cancel_job = job_id
+                signal.pthread_kill(threading.main_thread().ident, CANCEL_SIGNAL)
+                return
+
+
+def _run(job_id, func, params, timeout):
+    """Call the job function under its timeout and cancel watcher"""
+    global _current_job
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    stop = threading.Event()
+    if CANCEL_SIGNAL is not None and hasattr(signal, "pthread_kill"):
+        signal.signal(CANCEL_SIGNAL, _on_cancel)
+        _current_job = job_id
+        threading.Thread(target=_watch, args=(job_id, stop), daemon=True).start()
+    try:
+        result = func(**params)
+        return {"status": "done", "result": json.dumps(result, default=str)}
+    except JobTimeout:
+        return {"status": "timed_out", "error": f"Exceeded {timeout}s"}
+    except JobCancelled:
+        raise
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+    finally:
+        stop.set()
+        _disarm()
+
+
+def _disarm():
+    global _current_job
+    _current_job = None
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _finish(job_id, **values):
+    """Record the outcome unless the job was cancelled meanwhile"""
+    db.session.execute(
+        update(ComputeJob)
+        .where(ComputeJob.id == job_id, ComputeJob.status == "running")
+        .values(finished_at=datetime.utcnow(), **values)
+    )
+    db.session.commit()
+
+
+def _execute(job_id):
+    with _worker_app.app_context():
+        claimed = db.session.execute(
+            update(ComputeJob)
+            .where(ComputeJob.id == job_id, ComputeJob.status == "queued")
+            .values(status="running", started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return  # cancelled before it started
+
+        job = db.session.get(ComputeJob, job_id)
+        func = _resolve(JOBS[job.kind].func)
+        params = json.loads(job.params or "{}")
+        timeout = job.timeout_seconds
+        db.session.commit()
+
+        try:
+            outcome = _run(job_id, func, params, timeout)
+        except JobCancelled:
+            # Also when it landed in _run's cleanup; one signal per job
+            _disarm()
+            outcome = None  # the row already says cancelled
+
+        db.session.rollback()  # anything the job left uncommitted
+        if outcome:
+            _finish(job_id, **outcome)
+        db.session.remove()
+
+
+# --- Web process side ---
+
+
+class ComputePool:
+    def __init__(self, workers=COMPUTE_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _pool(self):
+        # A pool inherited from the gunicorn master is not usable in a worker
+        if self._pid != os.getpid():
+            self._executor = None
+            self._futures = {}
+            self._pid = os.getpid()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def _start(self, job_id):
+        """Hand a job to the pool, once more on a fresh pool if it is broken"""
+        try:
+            return self._pool().submit(_execute, job_id)
+        except BrokenProcessPool:
+            # A pool process died (OOM kill, crash); the executor takes no
+            # more work, so replace it
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            return self._pool().submit(_execute, job_id)
+
+    def pending(self):
+        """Jobs this process submitted that have not finished"""
+        # Futures that raised stay until refresh() has failed their job
+        self._futures = {
+            k: f for k, f in self._futures.items() if not f.done() or _crashed(f)
+        }
+        return sum(not f.done() for f in self._futures.values())
+
+    def submit(self, kind, params=None, user_id=None, timeout=None):
+        """
+        Queue `kind` with `params`. Returns (job, created); created is False
+        when an identical queued, running or recently finished job is
+        reused. Raises UnknownJobKind or PoolBusy.
+        """
+        spec = JOBS.get(kind)
+        if spec is None:
+            raise UnknownJobKind(f"Unknown job kind: {kind}")
+        params = params or {}
+        key = params_key(kind, params)
+        now = datetime.utcnow()
+
+        reusable = [ComputeJob.status.in_(ACTIVE_STATUSES)]
+        if spec.cache_seconds:
+            reusable.append(
+                (ComputeJob.status == "done")
+                & (
+                    ComputeJob.finished_at
+                    >= now - timedelta(seconds=spec.cache_seconds)
+                )
+            )
+        for existing in (
+            ComputeJob.query.filter(
+                ComputeJob.kind == kind,
+                ComputeJob.params_key == key,
+                or_(*reusable),
+            )
+            .order_by(ComputeJob.created_at.desc())
+            .all()
+        ):
+            if self.refresh(existing).status in ACTIVE_STATUSES + ("done",):
+                return existing, False
+
+        with self._lock:
+            if self.pending() >= self.max_pending:
+                raise PoolBusy("Too many compute jobs queued; retry shortly")
+            job = ComputeJob(
+                id=uuid.uuid4().hex,
+                kind=kind,
+                params=json.dumps(params, sort_keys=True, default=str),
+                params_key=key,
+                status="queued",
+                timeout_seconds=int(min(timeout or spec.timeout, spec.timeout)),
+                submitted_by=user_id,
+                created_at=now,
+            )
+            db.session.add(job)
+            db.session.commit()
+            try:
+                self._futures[job.id] = self._start(job.id)
+            except Exception as e:
+                job.status, job.error = "failed", f"Could not start: {e!r}"
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                raise PoolBusy("Compute pool unavailable; retry shortly") from e
+        return job, True
+
+    def refresh(self, job):
+        """Fail jobs whose worker is evidently gone (hung, killed, restarted)"""
+        now = datetime.utcnow()
+        lost = None
+        future = self._futures.get(job.id)
+        if job.status in ACTIVE_STATUSES and future is not None and _crashed(future):
+            # Its pool process died, or _execute itself raised
+            lost = ("failed", f"Worker failed: {future.exception()!r}")
+            self._futures.pop(job.id, None)
+        elif job.status == "running" and job.started_at:
+            limit = job.timeout_seconds + TIMEOUT_GRACE_SECONDS
+            if now - job.started_at > timedelta(seconds=limit):
+                lost = ("timed_out", f"Exceeded {job.timeout_seconds}s")
+        elif job.status == "queued" and job.created_at:
+            if now - job.created_at > timedelta(seconds=QUEUE_TIMEOUT_SECONDS):
+                lost = ("failed", "Job never started; its worker was lost")
+        if lost:
+            job.status, job.error = lost
+            job.finished_at = now
+            db.session.commit()
+        return job
+
+    def wait(self, job, timeout, poll_seconds=0.25):
+        """
+        Wait up to `timeout` seconds for `job` to finish and return it
+        refreshed. Jobs this process submitted are awaited on their future;
+        others (reused from another worker) by polling the row.
+        """
+        deadline = time.monotonic() + timeout
+        future = self._futures.get(job.id)
+        if future is not None:
+            wait_futures([future], timeout=timeout)
+        while True:
+            db.session.commit()  # a new snapshot, not the request's first read
+            db.session.refresh(job)
+            job = self.refresh(job)
+            remaining = deadline - time.monotonic()
+            if job.status not in ACTIVE_STATUSES or remaining <= 0:
+                return job
+            time.sleep(min(poll_seconds, remaining))
+
+    def cancel(self, job):
+        """
+        Cancel a queued or running job. A running job is interrupted by its
+        watcher within CANCEL_POLL_SECONDS. Returns False if it already
+        finished.
+        """
+        if job.status not in ACTIVE_STATUSES:
+            return False
+        future = self._futures.get(job.id)
+        if future is not None:
+            future.cancel()
+        cancelled = db.session.execute(
+            update(ComputeJob)
+            .where(ComputeJob.id == job.id, ComputeJob.status.in_(ACTIVE_STATUSES))
+            .values(status="cancelled", finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        db.session.refresh(job)
+        return bool(cancelled)
+
+
+def _crashed(future):
+    return future.done() and not future.cancelled() and future.exception() is not None
+
+
+def job_summary(job, include_result=True):
+    summary = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "timeout_seconds": job.timeout_seconds,
+        "error": job.error,
+    }
+    if include_result and job.status == "done":
+        summary["result"] = json.loads(job.result) if job.result else None
+    return summary
+
+
+compute_pool = ComputePool()
@@ -0,0 +1,465 @@
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, or_, select
+
+from extensions import db
+from models import Customer, CustomerMatchKey
+
+# Tamil script -> the Latin spelling field agents usually type
+TAMIL_VOWELS = {
+    "அ": "a", "ஆ": "aa", "இ": "i", "ஈ": "ii", "உ": "u", "ஊ": "uu",
+    "எ": "e", "ஏ": "ee", "ஐ": "ai", "ஒ": "o", "ஓ": "oo", "ஔ": "au",
+}  # fmt: skip
+TAMIL_CONSONANTS = {
+    "க": "k", "ங": "ng", "ச": "s", "ஜ": "j", "ஞ": "nj", "ட": "t",
+    "ண": "n", "த": "th", "ந": "n", "ன": "n", "ப": "p", "ம": "m",
+    "ய": "y", "ர": "r", "ற": "r", "ல": "l", "ள": "l", "ழ": "zh",
+    "வ": "v", "ஶ": "sh", "ஷ": "sh", "ஸ": "s", "ஹ": "h",
+}  # fmt: skip
+TAMIL_VOWEL_SIGNS = {
+    "ா": "aa", "ி": "i", "ீ": "ii", "ு": "u", "ூ": "uu", "ெ": "e",
+    "ே": "ee", "ை": "ai", "ொ": "o", "ோ": "oo", "ௌ": "au",
+}  # fmt: skip
+TAMIL_VIRAMA = "்"
+
+# Romanised Tamil spells the same sound many ways (Senthil/Sendhil/Chenthil,
+# Murugan/Murukan, Raja/Rasa). Applied in order, longest patterns first.
+PHONETIC_FOLDS = (
+    ("zh", "l"), ("tch", "s"), ("ch", "s"), ("sh", "s"), ("th", "t"),
+    ("dh", "t"), ("bh", "p"), ("ph", "p"), ("kh", "k"), ("gh", "k"),
+    ("ck", "k"), ("x", "ks"), ("q", "k"), ("c", "k"), ("g", "k"),
+    ("d", "t"), ("b", "p"), ("f", "p"), ("j", "s"), ("z", "s"), ("w", "v"),
+)  # fmt: skip
+VOWEL_FOLDS = (("aa", "a"), ("ee", "i"), ("ii", "i"), ("oo", "u"), ("uu", "u"))
+VOWELS = set("aeiouy")
+
+# Titles that say nothing about who the customer is
+NAME_STOPWORDS = {"mr", "mrs", "ms", "dr", "smt", "sri", "shri", "thiru", "tmt"}
+
+KEY_NAME = "name"  # one per name token
+KEY_NAME_FULL = "name_full"  # all tokens, order-independent
+KEY_NAME_AREA = "name_area"  # full name within an area
+KEY_PHONE = "phone"
+KEY_ID_PROOF = "id_proof"
+
+# Retrieval weights for the selective keys; name tokens count 1 each
+KEY_WEIGHTS = {KEY_PHONE: 20, KEY_ID_PROOF: 20, KEY_NAME_AREA: 10, KEY_NAME_FULL: 5}
+
+CANDIDATE_LIMIT = 50
+# Rows read per name token, so a very common token ("kumar") stays cheap
+TOKEN_POSTING_LIMIT = 200
+MAX_RESULTS = 10
+NAME_MIN_SIMILARITY = 0.5
+INDEX_BATCH_SIZE = 1000
+
+
+def transliterate(text):
+    """Tamil script to Latin; other scripts are stripped of accents"""
+    out = []
+    inherent = False
+    for ch in text:
+        if ch in TAMIL_VOWEL_SIGNS:
+            out.append(TAMIL_VOWEL_SIGNS[ch])
+            inherent = False
+            continue
+        if ch == TAMIL_VIRAMA:
+            inherent = False
+            continue
+        if inherent:
+            out.append("a")
+            inherent = False
+        if ch in TAMIL_CONSONANTS:
+            out.append(TAMIL_CONSONANTS[ch])
+            inherent = True
+        elif ch in TAMIL_VOWELS:
+            out.append(TAMIL_VOWELS[ch])
+        else:
+            out.append(ch)
+    if inherent:
+        out.append("a")
+
+    text = unicodedata.normalize("NFKD", "".join(out))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def name_tokens(name):
+    """Lower-case Latin tokens, without titles and single-letter initials"""
+    text = re.sub(r"[^a-z]+", " ", transliterate(name or "").lower())
+    return [t for t in text.split() if len(t) > 1 and t not in NAME_STOPWORDS]
+
+
+def fold_token(token):
+    """Collapse spelling variants but keep vowels (used for similarity)"""
+    for pattern, repl in PHONETIC_FOLDS:
+        token = token.replace(pattern, repl)
+    token = token.replace("h", "")
+    for pattern, repl in VOWEL_FOLDS:
+        token = token.replace(pattern, repl)
+    return re.sub(r"(.)\1+", r"\1", token)
+
+
+def phonetic_code(token):
+    """Consonant skeleton of a folded token: murugan, murukan -> mrkn"""
+    folded = fold_token(token)
+    if not folded:
+        return ""
+    head = "a" if folded[0] in VOWELS else folded[0]
+    tail = "".join(ch for ch in folded[1:] if ch not in VOWELS)
+    return re.sub(r"(.)\1+", r"\1", head + tail)
+
+
+def normalize_phone(number):
+    """Last 10 digits, so +91 / 0 prefixes and spacing do not matter"""
+    digits = re.sub(r"\D", "", number or "")
+    if len(digits) < 6:
+        return None
+    return digits[-10:]
+
+
+def id_proof_hash(number):
+    """Documents are matched by hash so the side table holds no raw IDs"""
+    value = re.sub(r"[^A-Z0-9]", "", (number or "").upper())
+    if len(value) < 4:
+        return None
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def normalize_area(area):
+    return re.sub(r"\s+", " ", (area or "").strip().lower())
+
+
+def build_keys(
+    name=None, mobile=None, alternate_contact=None, id_proof=None, area=None
+):
+    """Set of (key_type, key_value) pairs for one customer"""
+    keys = set()
+    codes = sorted({phonetic_code(t) for t in name_tokens(name)})
+    codes = [c for c in codes if len(c) > 1]
+    for code in codes:
+        keys.add((KEY_NAME, code))
+    if codes:
+        full = " ".join(codes)
+        keys.add((KEY_NAME_FULL, full[:64]))
+        if normalize_area(area):
+            scoped = f"{full}@{normalize_area(area)}"
+            keys.add((KEY_NAME_AREA, hashlib.sha256(scoped.encode()).hexdigest()))
+    for number in (mobile, alternate_contact):
+        phone = normalize_phone(number)
+        if phone:
+            keys.add((KEY_PHONE, phone))
+    proof = id_proof_hash(id_proof)
+    if proof:
+        keys.add((KEY_ID_PROOF, proof))
+    return keys
+
+
+def _keys_for(row):
+    return build_keys(
+        row.get("name"),
+        row.get("mobile_number"),
+        row.get("alternate_contact"),
+        row.get("id_proof_number"),
+        row.get("area"),
+    )
+
+
+def index_rows(connection, rows):
+    """
+    Insert match keys for freshly inserted customers.
+    `rows` are dicts with id, name, mobile_number, alternate_contact,
+    id_proof_number and area - used by bulk paths that bypass ORM events.
+    """
+    key_rows = [
+        {"customer_id": row["id"], "key_type": key_type, "key_value": key_value}
+        for row in rows
+        if row.get("id")
+        for key_type, key_value in _keys_for(row)
+    ]
+    if key_rows:
+        connection.execute(insert(CustomerMatchKey.__table__), key_rows)
+    return len(key_rows)
+
+
+def _customer_row(target):
+    return {
+        "id": target.id,
+        "name": target.name,
+        "mobile_number": target.mobile_number,
+        "alternate_contact": target.alternate_contact,
+        "id_proof_number": target.id_proof_number,
+        "area": target.area,
+    }
+
+
+def _delete_keys(connection, customer_ids):
+    table = CustomerMatchKey.__table__
+    connection.execute(delete(table).where(table.c.customer_id.in_(customer_ids)))
+
+
+INDEXED_FIELDS = (
+    "name",
+    "mobile_number",
+    "alternate_contact",
+    "id_proof_number",
+    "area",
+)
+
+
+@event.listens_for(Customer, "after_insert")
+def _index_after_insert(mapper, connection, target):
+    index_rows(connection, [_customer_row(target)])
+
+
+@event.listens_for(Customer, "after_update")
+def _reindex_after_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[f].history.has_changes() for f in INDEXED_FIELDS):
+        return
+    _delete_keys(connection, [target.id])
+    index_rows(connection, [_customer_row(target)])
+
+
+@event.listens_for(Customer, "before_delete")
+def _unindex_before_delete(mapper, connection, target):
+    _delete_keys(connection, [target.id])
+
+
+def index_missing(connection, batch_size=INDEX_BATCH_SIZE):
+    """Derive keys for customers that have none yet; returns how many"""
+    customers = Customer.__table__
+    keys = CustomerMatchKey.__table__
+    last_id = 0
+    indexed = 0
+    while True:
+        batch = connection.execute(
+            select(
+                customers.c.id,
+                customers.c.name,
+                customers.c.mobile_number,
+                customers.c.alternate_contact,
+                customers.c.id_proof_number,
+                customers.c.area,
+            )
+            .where(customers.c.id > last_id)
+            .order_by(customers.c.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        has_keys = {
+            customer_id
+            for (customer_id,) in connection.execute(
+                select(keys.c.customer_id)
+                .where(keys.c.customer_id.in_([row.id for row in batch]))
+                .distinct()
+            )
+        }
+        missing = [row._asdict() for row in batch if row.id not in has_keys]
+        index_rows(connection, missing)
+        indexed += len(missing)
+        last_id = batch[-1].id
+    return indexed
+
+
+def rebuild_index(batch_size=INDEX_BATCH_SIZE):
+    """Re-derive every customer's keys (after changing the folds)"""
+    connection = db.session.connection()
+    connection.execute(delete(CustomerMatchKey.__table__))
+    return index_missing(connection, batch_size)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def name_similarity(a, b):
+    """Dice coefficient over trigrams of the folded, order-independent name"""
+    fa = " ".join(sorted(fold_token(t) for t in name_tokens(a)))
+    fb = " ".join(sorted(fold_token(t) for t in name_tokens(b)))
+    if not fa or not fb:
+        return 0.0
+    if fa == fb:
+        return 1.0
+    ga, gb = _trigrams(fa), _trigrams(fb)
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+
+class DuplicateMatcher:
+    """
+    Ranks possible duplicates of a (new) customer.
+    Candidates come from one grouped lookup on customer_match_keys, so the
+    cost depends on how many customers share a key, not on table size;
+    only those candidates are loaded and scored.
+    """
+
+    def candidates(self, keys, exclude_id=None, limit=CANDIDATE_LIMIT):
+        """
+        Customer ids sharing keys with the probe, best first.
+        Selective keys (phone, ID proof, full name) are resolved in one
+        grouped query; per-token postings are only read, capped, when
+        those do not already fill the candidate list.
+        """
+        by_type = {}
+        for key_type, key_value in keys:
+            by_type.setdefault(key_type, []).append(key_value)
+
+        weights = Counter()
+        selective = {t: v for t, v in by_type.items() if t in KEY_WEIGHTS}
+        if selective:
+            weight = case(
+                *[(CustomerMatchKey.key_type == t, w) for t, w in KEY_WEIGHTS.items()],
+                else_=0,
+            )
+            rows = (
+                db.session.query(
+                    CustomerMatchKey.customer_id, func.sum(weight).label("weight")
+                )
+                .filter(
+                    or_(
+                        *[
+                            and_(
+                                CustomerMatchKey.key_type == key_type,
+                                CustomerMatchKey.key_value.in_(values),
+                            )
+                            for key_type, values in selective.items()
+                        ]
+                    )
+                )
+                .group_by(CustomerMatchKey.customer_id)
+                .order_by(func.sum(weight).desc())
+                .limit(limit + 1)
+                .all()
+            )
+            weights.update({r.customer_id: int(r.weight) for r in rows})
+
+        if len(weights) <= limit:
+            for code in by_type.get(KEY_NAME, []):
+                posting = (
+                    db.session.query(CustomerMatchKey.customer_id)
+                    .filter(
+                        CustomerMatchKey.key_type == KEY_NAME,
+                        CustomerMatchKey.key_value == code,
+                    )
+                    .limit(TOKEN_POSTING_LIMIT)
+                    .all()
+                )
+                weights.update(r.customer_id for r in posting)
+
+        weights.pop(exclude_id, None)
+        return [cid for cid, _ in weights.most_common(limit)]
+
+    def score(self, probe, candidate):
+        """Returns (score 0-100, match type, matched_on list) or None"""
+        matched_on = []
+        score = 0.0
+
+        proof = id_proof_hash(probe.get("id_proof_number"))
+        if proof and proof == id_proof_hash(candidate.id_proof_number):
+            matched_on.append("id_proof")
+            score = 100.0
+
+        probe_phones = {
+            normalize_phone(probe.get("mobile_number")),
+            normalize_phone(probe.get("alternate_contact")),
+        } - {None}
+        if probe_phones & {normalize_phone(candidate.mobile_number)}:
+            matched_on.append("mobile")
+            score = max(score, 95.0)
+        if probe_phones & {normalize_phone(candidate.alternate_contact)}:
+            matched_on.append("alternate_contact")
+            score = max(score, 90.0)
+
+        same_area = bool(
+            normalize_area(probe.get("area"))
+            and normalize_area(probe.get("area")) == normalize_area(candidate.area)
+        )
+        similarity = name_similarity(probe.get("name"), candidate.name)
+        if similarity >= NAME_MIN_SIMILARITY:
+            matched_on.append("name")
+            if same_area:
+                matched_on.append("area")
+            score = max(score, 70 * similarity + (15 if same_area else 0))
+
+        if not matched_on:
+            return None
+
+        if "id_proof" in matched_on:
+            match_type = "id_proof"
+        elif "mobile" in matched_on:
+            match_type = "exact_mobile"
+        elif "alternate_contact" in matched_on:
+            match_type = "alternate_contact"
+        elif same_area:
+            match_type = "similar_name_area"
+        else:
+            match_type = "similar_name"
+        return round(score, 1), match_type, matched_on
+
+    def find(self, probe, exclude_id=None, max_results=MAX_RESULTS):
+        """
+        probe: dict with any of name, mobile_number, alternate_contact,
+        id_proof_number, area. Returns ranked candidate dicts.
+        """
+        keys = _keys_for(probe)
+        ids = self.candidates(keys, exclude_id=exclude_id)
+        if probe.get("mobile_number"):
+            # Exact number on the unique column, even for an unindexed customer
+            exact = (
+                db.session.query(Customer.id)
+                .filter(Customer.mobile_number == probe["mobile_number"])
+                .scalar()
+            )
+            if exact and exact != exclude_id and exact not in ids:
+                ids.append(exact)
+        if not ids:
+            return []
+
+        rows = (
+            db.session.query(
+                Customer.id,
+                Customer.customer_id,
+                Customer.name,
+                Customer.mobile_number,
+                Customer.alternate_contact,
+                Customer.id_proof_number,
+                Customer.area,
+            )
+            .filter(Customer.id.in_(ids))
+            .all()
+        )
+
+        results = []
+        for row in rows:
+            scored = self.score(probe, row)
+            if not scored:
+                continue
+            score, match_type, matched_on = scored
+            if score >= 90:
+                confidence = "high"
+            elif score >= 60:
+                confidence = "medium"
+            else:
+                confidence = "low"
+            results.append(
+                {
+                    "type": match_type,
+                    "id": row.id,
+                    "customer_id": row.customer_id,
+                    "name": row.name,
+                    "mobile": row.mobile_number,
+                    "area": row.area,
+                    "confidence": confidence,
+                    "score": score,
+                    "matched_on": matched_on,
+                }
+            )
+
+        results.sort(key=lambda r: (-r["score"], r["id"]))
+        return results[:max_results]
+
+
+duplicate_matcher = DuplicateMatcher()
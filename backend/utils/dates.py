@@ -0,0 +1,121 @@
+"""
+Sargable date predicates for DateTime columns.
+
+`func.date(col) == day` wraps the column in a function, so no index on
+col (or on (x, col)) can be used and every candidate row is evaluated.
+These helpers express the same conditions as half-open ranges on the raw
+column instead.
+
+day_diff() and elapsed_days() are the portable date arithmetic the
+grouped reports need: whole calendar days, and whole 24-hour days,
+between two DateTime expressions.
+"""
+
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import Integer, and_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+def day_start(day):
+    """Midnight at the start of `day` (a date or datetime)"""
+    if isinstance(day, datetime):
+        day = day.date()
+    return datetime.combine(day, time.min)
+
+
+def day_bounds(day):
+    """(start, end) with end exclusive, covering the whole calendar day"""
+    start = day_start(day)
+    return start, start + timedelta(days=1)
+
+
+def on_day(column, day):
+    """Same rows as date(column) == day"""
+    start, end = day_bounds(day)
+    return and_(column >= start, column < end)
+
+
+def between_days(column, start_day=None, end_day=None):
+    """Same rows as date(column) BETWEEN start_day AND end_day; either may be None"""
+    conditions = []
+    if start_day:
+        conditions.append(column >= day_start(start_day))
+    if end_day:
+        conditions.append(column < day_bounds(end_day)[1])
+    return and_(*conditions)
+
+
+def on_or_before_day(column, day):
+    """Same rows as date(column) <= day"""
+    return column < day_bounds(day)[1]
+
+
+def before_day(column, day):
+    """Same rows as date(column) < day"""
+    return column < day_start(day)
+
+
+class day_diff(FunctionElement):
+    """date(later) - date(earlier) in whole days, as a SQL expression"""
+
+    type = Integer()
+    name = "day_diff"
+    inherit_cache = True
+
+
+def _day_diff_args(element, compiler, **kw):
+    later, earlier = element.clauses
+    return compiler.process(later, **kw), compiler.process(earlier, **kw)
+
+
+@compiles(day_diff)
+def _day_diff_default(element, compiler, **kw):
+    return "(CAST(%s AS DATE) - CAST(%s AS DATE))" % _day_diff_args(
+        element, compiler, **kw
+    )
+
+
+@compiles(day_diff, "sqlite")
+def _day_diff_sqlite(element, compiler, **kw):
+    return "CAST(julianday(date(%s)) - julianday(date(%s)) AS INTEGER)" % (
+        _day_diff_args(element, compiler, **kw)
+    )
+
+
+@compiles(day_diff, "mysql")
+def _day_diff_mysql(element, compiler, **kw):
+    return "DATEDIFF(%s, %s)" % _day_diff_args(element, compiler, **kw)
+
+
+class elapsed_days(FunctionElement):
+    """Whole 24-hour days from earlier to later, like (later - earlier).days"""
+
+    type = Integer()
+    name = "elapsed_days"
+    inherit_cache = True
+
+
+@compiles(elapsed_days)
+def _elapsed_days_default(element, compiler, **kw):
+    return "CAST(FLOOR(EXTRACT(EPOCH FROM (%s - %s)) / 86400) AS INTEGER)" % (
+        _day_diff_args(element, compiler, **kw)
+    )
+
+
+@compiles(elapsed_days, "sqlite")
+def _elapsed_days_sqlite(element, compiler, **kw):
+    later, earlier = _day_diff_args(element, compiler, **kw)
+    difference = f"(julianday({later}) - julianday({earlier}))"
+    # CAST truncates toward zero; step down for negative fractions
+    return (
+        f"(CAST({difference} AS INTEGER) - "
+        f"({difference} < CAST({difference} AS INTEGER)))"
+    )
+
+
+@compiles(elapsed_days, "mysql")
+def _elapsed_days_mysql(element, compiler, **kw):
+    later, earlier = _day_diff_args(element, compiler, **kw)
+    return f"FLOOR(TIMESTAMPDIFF(SECOND, {earlier}, {later}) / 86400)"
@@ -0,0 +1,293 @@
+"""
+Connection pool sizing, health and metrics for the SQLAlchemy engine.
+
+Every gunicorn worker has its own pool. By default it holds one
+connection per request thread plus one for the scheduler thread, with
+as many overflow connections again for the short side transactions the
+idempotency store and ID allocator open while a request holds its own.
+When DB_MAX_CONNECTIONS gives the server's limit, the per-worker pool
+is shrunk so that all workers, and their compute pool processes, fit
+under it with DB_RESERVED_CONNECTIONS to spare. DB_POOL_SIZE and
+DB_MAX_OVERFLOW override the derived numbers.
+
+Connections are pinged on checkout (pool_pre_ping), so a connection the
+server or a proxy dropped is replaced rather than failing the request.
+They are also recycled after DB_POOL_RECYCLE seconds, before the usual
+idle cutoffs. The pool hands out the most recently used connection
+first, so idle surplus ages out. A checkout waits at most
+DB_POOL_TIMEOUT seconds for a free connection, then fails fast.
+
+Each transaction gets the statement timeout of its route class (see
+ROUTE_CLASSES). Work outside a request, such as scheduled jobs and
+compute workers, runs as "batch". The timeout is applied as
+statement_timeout on PostgreSQL and max_execution_time on MySQL, and
+only sent when it differs from the connection's current one.
+
+InstrumentedQueuePool records checkout wait times and pool exhaustion
+per process; pool_metrics() reports them with the pool's current state.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+# Concurrency per process; same defaults as gunicorn_config.py
+GUNICORN_WORKERS = int(
+    os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1)
+)
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", 2))
+# Background threads per worker that use the database (the job scheduler)
+BACKGROUND_THREADS = 1
+# Connections each compute pool process may hold (utils/compute_pool.py)
+COMPUTE_PROCESS_CONNECTIONS = 2
+
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 0))  # 0: no cap
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Under the 300 s idle cutoff of common proxies and load balancers
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 280))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 10))
+
+# Statement timeouts in milliseconds per route class; 0 disables
+STATEMENT_TIMEOUTS = {
+    "interactive": int(os.getenv("DB_TIMEOUT_INTERACTIVE_MS", 15000)),
+    "report": int(os.getenv("DB_TIMEOUT_REPORT_MS", 60000)),
+    "batch": int(os.getenv("DB_TIMEOUT_BATCH_MS", 600000)),
+}
+
+# Blueprints whose routes aggregate over whole tables
+ROUTE_CLASSES = {
+    "reports": "report",
+    "analytics": "report",
+    "document": "report",
+    "admin_tools": "report",
+}
+
+# Checkout wait histogram bucket upper bounds, in milliseconds
+WAIT_BUCKETS_MS = (1, 10, 100, 1000)
+
+TIMEOUT_INFO_KEY = "statement_timeout_ms"
+
+
+def route_class():
+    """Route class of the current request, or "batch" outside a request"""
+    if not has_request_context():
+        return "batch"
+    if "/automation/" in request.path:
+        return "batch"
+    return ROUTE_CLASSES.get(request.blueprint, "interactive")
+
+
+def compute_workers():
+    from utils.compute_pool import COMPUTE_WORKERS
+
+    return COMPUTE_WORKERS
+
+
+def pool_sizing(role="web"):
+    """(pool_size, max_overflow) for one process of `role` ("web" or "compute")"""
+    if role == "compute":
+        return 1, COMPUTE_PROCESS_CONNECTIONS - 1
+
+    pool_size = GUNICORN_THREADS + BACKGROUND_THREADS
+    max_overflow = GUNICORN_THREADS
+    if DB_MAX_CONNECTIONS:
+        per_worker = (
+            DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS
+        ) // GUNICORN_WORKERS - compute_workers() * COMPUTE_PROCESS_CONNECTIONS
+        per_worker = max(per_worker, 2)
+        pool_size = min(pool_size, per_worker - 1)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+
+    pool_size = int(os.getenv("DB_POOL_SIZE", pool_size))
+    max_overflow = int(os.getenv("DB_MAX_OVERFLOW", max_overflow))
+    return pool_size, max_overflow
+
+
+class PoolStats:
+    """Checkout counters of this process's pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.since = datetime.utcnow()
+            self.checkouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+            self.exhausted = 0
+            self.connects = 0
+            self.invalidated = 0
+
+    def record_checkout(self, wait_ms):
+        bucket = next(
+            (i for i, bound in enumerate(WAIT_BUCKETS_MS) if wait_ms < bound),
+            len(WAIT_BUCKETS_MS),
+        )
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.wait_buckets[bucket] += 1
+
+    def record_exhausted(self):
+        with self._lock:
+            self.exhausted += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def as_dict(self):
+        with self._lock:
+            labels = [f"<{b}ms" for b in WAIT_BUCKETS_MS]
+            labels.append(f">={WAIT_BUCKETS_MS[-1]}ms")
+            return {
+                "since": self.since.isoformat() + "Z",
+                "checkouts": self.checkouts,
+                "wait_ms": {
+                    "avg": (
+                        round(self.wait_total_ms / self.checkouts, 3)
+                        if self.checkouts
+                        else 0.0
+                    ),
+                    "max": round(self.wait_max_ms, 3),
+                    "histogram": dict(zip(labels, self.wait_buckets)),
+                },
+                "exhausted": self.exhausted,
+                "connects": self.connects,
+                "invalidated": self.invalidated,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every checkout, including any wait for a free slot"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            pool_stats.record_exhausted()
+            raise
+        pool_stats.record_checkout((time.perf_counter() - started) * 1000)
+        return connection
+
+
+def engine_options(url, role="web"):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # Flask-SQLAlchemy's single shared connection
+
+    pool_size, max_overflow = pool_sizing(role)
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+        "pool_use_lifo": True,
+    }
+    backend = url.get_backend_name()
+    if backend in ("postgresql", "mysql"):
+        options["connect_args"] = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    return options
+
+
+def _set_statement_timeout(connection, timeout_ms):
+    backend = connection.dialect.name
+    if backend == "postgresql":
+        connection.exec_driver_sql(f"SET statement_timeout = {int(timeout_ms)}")
+    elif backend == "mysql":
+        # SELECT statements only; MySQL has no limit for writes
+        connection.exec_driver_sql(
+            f"SET SESSION max_execution_time = {int(timeout_ms)}"
+        )
+    else:
+        return False
+    return True
+
+
+def _apply_route_timeout(session, transaction, connection):
+    timeout_ms = STATEMENT_TIMEOUTS.get(route_class(), 0)
+    info = connection.connection.info  # lives as long as the DBAPI connection
+    if info.get(TIMEOUT_INFO_KEY) == timeout_ms:
+        return
+    try:
+        if _set_statement_timeout(connection, timeout_ms):
+            info[TIMEOUT_INFO_KEY] = timeout_ms
+    except Exception as e:
+        print(f"Could not set statement timeout: {e}")
+
+
+def _forget_timeout(connection):
+    # Rolling back undoes a SET made in the transaction on PostgreSQL
+    connection.connection.info.pop(TIMEOUT_INFO_KEY, None)
+
+
+_session_hooked = False
+
+
+def install(engine):
+    """Attach metrics and statement timeouts to the app's engine"""
+    global _session_hooked
+    if not isinstance(engine.pool, InstrumentedQueuePool):
+        return
+
+    event.listen(engine.pool, "connect", lambda *a: pool_stats.record_connect())
+    event.listen(engine.pool, "invalidate", lambda *a: pool_stats.record_invalidated())
+    event.listen(engine, "rollback", _forget_timeout)
+    if not _session_hooked:
+        event.listen(Session, "after_begin", _apply_route_timeout)
+        _session_hooked = True
+
+
+def pool_metrics(engine):
+    """This process's pool configuration, current state and checkout stats"""
+    pool = engine.pool
+    metrics = {
+        "pid": os.getpid(),
+        "dialect": engine.dialect.name,
+        "pool_class": type(pool).__name__,
+        "statement_timeouts_ms": STATEMENT_TIMEOUTS,
+    }
+    if isinstance(pool, QueuePool):
+        metrics["config"] = {
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "timeout_seconds": pool.timeout(),
+            "recycle_seconds": pool._recycle,
+            "pre_ping": pool._pre_ping,
+            "gunicorn_workers": GUNICORN_WORKERS,
+            "gunicorn_threads": GUNICORN_THREADS,
+            "max_connections": DB_MAX_CONNECTIONS or None,
+        }
+        metrics["state"] = {
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "capacity": pool.size() + pool._max_overflow,
+        }
+    metrics.update(pool_stats.as_dict())
+    return metrics
@@ -0,0 +1,55 @@
+from flask import g, has_request_context
+from sqlalchemy import inspect
+
+# Ids per IN (...) query, under every backend's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+class Hydrator:
+    """
+    Identity map from (model, primary key) to entity. load() fetches every
+    id it has not seen yet with one IN query per model, so a list of rows
+    referencing users, loans or customers costs one query per model
+    instead of one per row. Ids with no row map to None.
+    """
+
+    def __init__(self):
+        self._maps = {}
+
+    def load(self, model, ids):
+        """{id: entity or None} for the given ids"""
+        ids = {i for i in ids if i is not None}
+        cache = self._maps.setdefault(model, {})
+        missing = sorted(ids - cache.keys())
+        if missing:
+            pk = inspect(model).primary_key[0]
+            for start in range(0, len(missing), CHUNK_SIZE):
+                chunk = missing[start : start + CHUNK_SIZE]
+                for entity in model.query.filter(pk.in_(chunk)):
+                    cache[getattr(entity, pk.key)] = entity
+            for i in missing:
+                cache.setdefault(i, None)
+        return {i: cache[i] for i in ids}
+
+    def get(self, model, id):
+        return self.load(model, [id]).get(id)
+
+
+def hydrator():
+    """The current request's Hydrator (a throwaway one outside requests)"""
+    if not has_request_context():
+        return Hydrator()
+    if "hydrator" not in g:
+        g.hydrator = Hydrator()
+    return g.hydrator
+
+
+def hydrate(model, ids):
+    """Batch-load `model` rows by id for this request: {id: entity or None}"""
+    return hydrator().load(model, ids)
+
+
+def name_of(entities, id, default="Unknown"):
+    """entities[id].name, or `default` when the id is unknown"""
+    entity = entities.get(id)
+    return entity.name if entity else default
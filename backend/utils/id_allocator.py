@@ -0,0 +1,165 @@
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Customer, Loan, IdSequence
+
+# prefix -> column holding the formatted ids (used to seed a new year's sequence)
+SERIES = {
+    "CUST": Customer.customer_id,
+    "LN": Loan.loan_id,
+}
+
+ID_FORMAT = "{prefix}-{year}-{number:06d}"
+
+# Numbers each process reserves per round-trip. Larger blocks mean fewer
+# writes to id_sequences but bigger gaps when a worker restarts.
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", 20))
+
+
+def format_id(prefix, year, number):
+    return ID_FORMAT.format(prefix=prefix, year=year, number=number)
+
+
+def _highest_existing(conn, prefix, year):
+    """Largest number already issued for prefix/year (0 if none)"""
+    column = SERIES[prefix]
+    like = f"{prefix}-{year}-%"
+    last = conn.execute(select(func.max(column)).where(column.like(like))).scalar()
+    if not last:
+        return 0
+    try:
+        return int(last.rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _ensure_sequence(name, prefix, year):
+    """Create the year's sequence row, starting after any ids already in use"""
+    table = IdSequence.__table__
+    try:
+        with db.engine.begin() as conn:
+            exists = conn.execute(
+                select(table.c.name).where(table.c.name == name)
+            ).first()
+            if exists:
+                return
+            conn.execute(
+                insert(table).values(
+                    name=name,
+                    next_value=_highest_existing(conn, prefix, year) + 1,
+                    updated_at=datetime.utcnow(),
+                )
+            )
+    except IntegrityError:
+        # Another worker created it first - that row is just as good
+        pass
+
+
+def reserve_block(prefix, count, year=None):
+    """
+    Atomically reserves `count` consecutive numbers for prefix/year.
+
+    PostgreSQL and SQLite >= 3.35 use UPDATE ... RETURNING; MySQL runs the
+    UPDATE (which takes the InnoDB row lock) and reads the row back in the
+    same transaction. Either way the reservation commits immediately in its
+    own transaction, so numbers lost to a later rollback simply leave a gap.
+    Returns the first reserved number.
+
+    Call before the request session starts writing: on SQLite the separate
+    connection cannot commit while the session holds the write lock.
+    """
+    if count <= 0:
+        raise ValueError("count must be positive")
+
+    year = year or datetime.utcnow().year
+    name = f"{prefix}-{year}"
+    table = IdSequence.__table__
+
+    stmt = (
+        update(table)
+        .where(table.c.name == name)
+        .values(
+            next_value=table.c.next_value + count,
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+    for _ in range(2):
+        with db.engine.begin() as conn:
+            if conn.dialect.update_returning:
+                new_next = conn.execute(stmt.returning(table.c.next_value)).scalar()
+                if new_next is not None:
+                    return new_next - count
+            elif conn.execute(stmt).rowcount:
+                new_next = conn.execute(
+                    select(table.c.next_value).where(table.c.name == name)
+                ).scalar()
+                return new_next - count
+        _ensure_sequence(name, prefix, year)
+
+    raise RuntimeError(f"Could not allocate ids for sequence {name}")
+
+
+class IdAllocator:
+    """
+    Hands out human-readable business ids (CUST-/LN-) from id_sequences.
+    Each process keeps a pre-reserved block per sequence so most inserts
+    never touch the shared row; ids stay unique across gunicorn workers
+    but are only roughly ordered between them.
+    """
+
+    def __init__(self, block_size=ID_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._blocks = {}  # (prefix, year) -> [next_number, end_exclusive]
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # A block inherited from the gunicorn master must not be reused by
+        # every forked worker.
+        if self._pid != os.getpid():
+            self._blocks = {}
+            self._pid = os.getpid()
+
+    def next_id(self, prefix, year=None):
+        year = year or datetime.utcnow().year
+        key = (prefix, year)
+        with self._lock:
+            self._check_fork()
+            block = self._blocks.get(key)
+            if not block or block[0] >= block[1]:
+                first = reserve_block(prefix, self.block_size, year)
+                block = self._blocks[key] = [first, first + self.block_size]
+            number = block[0]
+            block[0] += 1
+        return format_id(prefix, year, number)
+
+    def allocate(self, prefix, count, year=None):
+        """`count` ids at once; large batches reserve their own block"""
+        year = year or datetime.utcnow().year
+        if count < self.block_size:
+            return [self.next_id(prefix, year) for _ in range(count)]
+        first = reserve_block(prefix, count, year)
+        return [format_id(prefix, year, first + i) for i in range(count)]
+
+    def reset(self):
+        with self._lock:
+            self._blocks = {}
+
+
+id_allocator = IdAllocator()
+
+
+def next_id(prefix, year=None):
+    """Single id such as CUST-2024-000123"""
+    return id_allocator.next_id(prefix, year)
+
+
+def allocate_ids(prefix, count, year=None):
+    """Returns `count` formatted, unused ids such as CUST-2024-000123"""
+    return id_allocator.allocate(prefix, count, year)
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import jsonify
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+
+# Offline phones can retry a queued request days later
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", 72)))
+# How long an in-flight claim blocks retries. Longer than the gunicorn
+# timeout, so a claim whose worker died is taken over by the next retry.
+IDEMPOTENCY_LEASE = timedelta(seconds=int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 300)))
+MAX_KEY_LENGTH = 100
+CACHE_SIZE = 2048
+PURGE_EVERY = 500  # claims between opportunistic purges of expired keys
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, msg, status_code):
+        super().__init__(msg)
+        self.msg = msg
+        self.status_code = status_code
+
+
+def request_hash(payload):
+    """Stable hash of the JSON body, to catch a key reused for other data"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Idempotency-Key handling for write endpoints.
+    Keys are scoped per (user, endpoint). A key is claimed in its own short
+    transaction before the handler runs; the final response is written by
+    complete() in the handler's transaction, so it commits atomically with
+    the write it describes. A claim is leased for IDEMPOTENCY_LEASE and
+    only kept for the full TTL once completed, so a request whose worker
+    was killed mid-way does not block its retries. Completed responses are
+    also kept in a small per-process LRU so hot retries skip the database.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, cache_size=CACHE_SIZE, lease=None):
+        self.ttl = ttl
+        self.lease = lease or IDEMPOTENCY_LEASE
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (user_id, endpoint, key) -> entry dict
+        self._lock = threading.Lock()
+        self._claims = 0
+
+    def _cache_get(self, scope):
+        with self._lock:
+            entry = self._cache.get(scope)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= datetime.utcnow():
+                del self._cache[scope]
+                return None
+            self._cache.move_to_end(scope)
+            return entry
+
+    def _cache_put(self, scope, entry):
+        with self._lock:
+            self._cache[scope] = entry
+            self._cache.move_to_end(scope)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _load(conn, scope):
+        table = IdempotencyKey.__table__
+        user_id, endpoint, key = scope
+        return conn.execute(
+            select(table).where(
+                table.c.user_id == user_id,
+                table.c.endpoint == endpoint,
+                table.c.key == key,
+            )
+        ).first()
+
+    def _lapsed(self, row, now):
+        """Expired, or an in-flight claim whose lease has run out"""
+        if row.expires_at <= now:
+            return True
+        # Also covers claims written with the full TTL before leases existed
+        return row.status != "completed" and row.created_at + self.lease <= now
+
+    def _replay(self, entry, digest):
+        if entry["request_hash"] != digest:
+            raise IdempotencyConflict("idempotency_key_reused", 422)
+        if entry["status"] != "completed":
+            raise IdempotencyConflict("request_in_progress", 409)
+        return json.loads(entry["response_body"]), entry["response_code"]
+
+    def begin(self, user_id, endpoint, key, payload):
+        """
+        Claim `key` for this request.
+        Returns None when the caller should process the request, or the
+        stored (body, status_code) to replay. Raises IdempotencyConflict
+        for a key that is still in flight or was used with another body.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyConflict("invalid_idempotency_key", 400)
+
+        scope = (user_id, endpoint, key)
+        digest = request_hash(payload)
+
+        cached = self._cache_get(scope)
+        if cached:
+            return self._replay(cached, digest)
+
+        table = IdempotencyKey.__table__
+        now = datetime.utcnow()
+        for _ in range(2):
+            with db.engine.begin() as conn:
+                row = self._load(conn, scope)
+                if row is not None and self._lapsed(row, now):
+                    conn.execute(delete(table).where(table.c.id == row.id))
+                    row = None
+                if row is not None:
+                    entry = dict(row._mapping)
+                    if entry["status"] == "completed":
+                        self._cache_put(scope, entry)
+                    return self._replay(entry, digest)
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(
+                        insert(table).values(
+                            user_id=user_id,
+                            endpoint=endpoint,
+                            key=key,
+                            request_hash=digest,
+                            status="in_progress",
+                            created_at=now,
+                            expires_at=now + self.lease,
+                        )
+                    )
+                break
+            except IntegrityError:
+                continue  # a concurrent retry claimed it first; re-read
+        else:
+            raise IdempotencyConflict("request_in_progress", 409)
+
+        self._claims += 1
+        if self._claims % PURGE_EVERY == 0:
+            self.purge_expired()
+        return None
+
+    def complete(self, user_id, endpoint, key, body, status_code):
+        """Record the response in the current session (commit with the write)"""
+        db.session.query(IdempotencyKey).filter_by(
+            user_id=user_id, endpoint=endpoint, key=key
+        ).update(
+            {
+                "status": "completed",
+                "response_code": status_code,
+                "response_body": json.dumps(body, default=str),
+                "expires_at": datetime.utcnow() + self.ttl,
+            },
+            synchronize_session=False,
+        )
+
+    def release(self, user_id, endpoint, key):
+        """Drop an unfinished claim so the client can retry after a failure"""
+        table = IdempotencyKey.__table__
+        with db.engine.begin() as conn:
+            conn.execute(
+                delete(table).where(
+                    table.c.user_id == user_id,
+                    table.c.endpoint == endpoint,
+                    table.c.key == key,
+                    table.c.status == "in_progress",
+                )
+            )
+
+    def purge_expired(self):
+        table = IdempotencyKey.__table__
+        with db.engine.begin() as conn:
+            return conn.execute(
+                delete(table).where(table.c.expires_at <= datetime.utcnow())
+            ).rowcount
+
+
+def replay_response(body, status_code):
+    response = jsonify(body)
+    response.headers[REPLAY_HEADER] = "true"
+    return response, status_code
+
+
+idempotency_store = IdempotencyStore()
@@ -130,3 +130,19 @@ def get_distance_meters(lat1, lon1, lat2, lon2):
     c = 2 * math.asin(math.sqrt(a))
     r = 6371000  # Radius of earth in meters. Use 3956 for miles
     return c * r
+
+
+def get_distances_meters(lat1, lon1, lat2, lon2):
+    """
+    Vectorised get_distance_meters over equal-length sequences.
+    Pairs with a missing coordinate come back as NaN.
+    """
+    import numpy as np
+
+    coords = [np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2)]
+    lat1, lon1, lat2, lon2 = map(np.radians, coords)
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * 6371000
@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+# Bump if the token payload changes; old tokens are then rejected cleanly
+CURSOR_VERSION = 1
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, row_id):
+    """
+    Opaque, URL-safe token for the last row of a page.
+    Payload: {"v": version, "k": sort key, "t": key type, "i": row id}
+    """
+    if isinstance(sort_value, datetime):
+        key, key_type = sort_value.isoformat(), "dt"
+    elif isinstance(sort_value, date):
+        key, key_type = sort_value.isoformat(), "date"
+    else:
+        key, key_type = sort_value, "num"
+
+    payload = json.dumps(
+        {"v": CURSOR_VERSION, "k": key, "t": key_type, "i": row_id},
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Returns (sort_value, row_id) or raises InvalidCursor"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload.get("v") != CURSOR_VERSION:
+            raise InvalidCursor("Cursor version mismatch")
+
+        key = payload["k"]
+        if payload["t"] == "dt":
+            key = datetime.fromisoformat(key)
+        elif payload["t"] == "date":
+            key = date.fromisoformat(key)
+        elif key is not None:
+            key = float(key)
+        return key, int(payload["i"])
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+
+
+def get_page_size(args, default=DEFAULT_PAGE_SIZE):
+    """Reads ?limit= (or legacy ?per_page=) and clamps it"""
+    size = args.get("limit", type=int) or args.get("per_page", type=int) or default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, sort_col, id_col, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Keyset (seek) pagination, newest/largest first.
+    Orders by (sort_col DESC, id_col DESC) and continues strictly after the
+    cursor row, so page N costs one index range scan like page 1.
+
+    Returns (rows, next_cursor). Each row must expose the sort and id values
+    under the column keys (works for entities and column projections).
+    """
+    if cursor:
+        last_key, last_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                sort_col < last_key,
+                and_(sort_col == last_key, id_col < last_id),
+            )
+        )
+
+    rows = query.order_by(sort_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, sort_col.key), getattr(last, id_col.key)
+        )
+    return rows, next_cursor
@@ -1,108 +1,272 @@
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
+from sqlalchemy import DateTime, and_, case, func, literal, or_, select
+
+from extensions import db
+from models import EMIAllocation, EMISchedule, Loan
+from utils.dates import day_diff, day_start
+from utils.model_store import ModelStore, feature_hash
+
+MODEL_PATH = "behavior_model.pkl"
+
+FEATURE_SPEC = 2  # 2: paid EMIs dated by the allocation ledger
+SEGMENT_FEATURES = ["reliability_score", "avg_delay_days", "payment_volatility"]
+FEATURE_HASH = feature_hash(FEATURE_SPEC, SEGMENT_FEATURES)
+
+# Clusters ranked by reliability get these labels, best first
+SEGMENT_LABELS = ["VIP (GOLD)", "SILVER", "BRONZE", "HIGH RISK"]
+N_SEGMENTS = len(SEGMENT_LABELS)
+
+# Per-customer aggregates returned by the grouped query
+AGGREGATE_COLUMNS = [
+    "customer_id",
+    "loans_closed",
+    "total_emis",
+    "on_time",
+    "delay_sum",
+    "delay_sq",
+    "max_delay_days",
+    "paid_amount",
+    "paid_count",
+]
+
+DEFAULT_CAPACITY = 5000
+
+
+def _aggregate_query(customer_ids, today):
+    """
+    One statement, one row per customer with loans: closed loans plus the
+    due/on-time/delay sums over their due (or paid) EMIs.
+
+    A paid EMI is dated by its last allocation in the ledger (the day the
+    collection that settled it was made); a paid EMI with no ledger rows
+    counts as on time. An unpaid EMI past its due date is late by today.
+    """
+    today = literal(today, DateTime)
+    settled = select(
+        EMIAllocation.emi_id, func.max(EMIAllocation.paid_at).label("settled_at")
+    ).group_by(EMIAllocation.emi_id)
+    loans = select(
+        Loan.customer_id,
+        func.sum(case((Loan.status == "closed", 1), else_=0)).label("loans_closed"),
+    ).group_by(Loan.customer_id)
+    if customer_ids is not None:
+        loan_ids = select(Loan.id).where(Loan.customer_id.in_(customer_ids))
+        settled = settled.where(EMIAllocation.loan_id.in_(loan_ids))
+        loans = loans.where(Loan.customer_id.in_(customer_ids))
+    settled = settled.subquery()
+    loans = loans.subquery()
+
+    paid = EMISchedule.status == "paid"
+    paid_delay = day_diff(settled.c.settled_at, EMISchedule.due_date)
+    delay = case(
+        (~paid, day_diff(today, EMISchedule.due_date)),
+        (and_(settled.c.settled_at.isnot(None), paid_delay > 0), paid_delay),
+        else_=0,
+    )
+    per_emi = (
+        select(
+            Loan.customer_id,
+            delay.label("delay"),
+            case(
+                (and_(paid, or_(settled.c.settled_at.is_(None), paid_delay <= 0)), 1),
+                else_=0,
+            ).label("on_time"),
+            case((paid, func.coalesce(EMISchedule.amount, 0)), else_=0).label(
+                "paid_amount"
+            ),
+            case((paid, 1), else_=0).label("paid"),
+        )
+        .select_from(EMISchedule)
+        .join(Loan, Loan.id == EMISchedule.loan_id)
+        .outerjoin(settled, settled.c.emi_id == EMISchedule.id)
+        .where(or_(paid, EMISchedule.due_date < today))
+    )
+    if customer_ids is not None:
+        per_emi = per_emi.where(Loan.customer_id.in_(customer_ids))
+    per_emi = per_emi.subquery()
+
+    by_customer = (
+        select(
+            per_emi.c.customer_id,
+            func.count().label("total_emis"),
+            func.sum(per_emi.c.on_time).label("on_time"),
+            func.sum(per_emi.c.delay).label("delay_sum"),
+            func.sum(per_emi.c.delay * per_emi.c.delay).label("delay_sq"),
+            func.max(per_emi.c.delay).label("max_delay_days"),
+            func.sum(per_emi.c.paid_amount).label("paid_amount"),
+            func.sum(per_emi.c.paid).label("paid_count"),
+        )
+        .group_by(per_emi.c.customer_id)
+        .subquery()
+    )
+    return select(
+        loans.c.customer_id,
+        loans.c.loans_closed,
+        *[
+            func.coalesce(column, 0)
+            for column in list(by_customer.c)[1:]  # all but customer_id
+        ],
+    ).outerjoin(by_customer, by_customer.c.customer_id == loans.c.customer_id)
+
+
+def behavior_features(customer_ids=None, today=None):
+    """
+    Repayment behaviour features, one row per customer with loans, indexed
+    by customer_id: reliability_score (on-time % of due EMIs),
+    avg_delay_days, max_delay_days, payment_volatility (std dev of
+    delays), total_loans_closed, avg_payment_capacity and total_emis.
+
+    customer_ids=None computes the whole population. Either way the
+    database does the per-EMI work in one grouped query; pandas only turns
+    the per-customer sums into features.
+    """
+    today = day_start(today or datetime.utcnow())
+    emis = pd.DataFrame(
+        db.session.execute(_aggregate_query(customer_ids, today)).all(),
+        columns=AGGREGATE_COLUMNS,
+    ).set_index("customer_id")
+    if emis.empty:
+        return pd.DataFrame(columns=SEGMENT_FEATURES).rename_axis("customer_id")
+    emis = emis.astype(float)
+
+    n = emis["total_emis"].where(emis["total_emis"] > 0)
+    features = pd.DataFrame(index=emis.index)
+    features["reliability_score"] = (emis["on_time"] / n * 100).fillna(100.0)
+    features["avg_delay_days"] = (emis["delay_sum"] / n).fillna(0.0)
+    variance = (emis["delay_sq"] / n - features["avg_delay_days"] ** 2).clip(lower=0)
+    features["payment_volatility"] = np.sqrt(variance).where(
+        emis["total_emis"] > 1, 0.0
+    )
+    features["max_delay_days"] = emis["max_delay_days"]
+    features["total_loans_closed"] = emis["loans_closed"].astype(int)
+    features["avg_payment_capacity"] = (
+        emis["paid_amount"] / emis["paid_count"].where(emis["paid_count"] > 0)
+    ).fillna(DEFAULT_CAPACITY)
+    features["total_emis"] = emis["total_emis"].astype(int)
+    return features
+
+
+def suggested_limit(segment, capacity):
+    # AI Loan Suggestion Rule
+    # Base logic tailored by Segment
+    multiplier = 1.0
+    if segment == "VIP (GOLD)":
+        multiplier = 2.5  # Trust them with more
+    elif segment == "SILVER":
+        multiplier = 1.5
+    elif segment == "HIGH RISK":
+        multiplier = 0.5  # Restrict them
+
+    limit = float(capacity) * 10 * multiplier
+    limit = round(limit / 5000) * 5000  # Round to nearest 5k
+    return max(min(limit, 200000), 10000)  # Cap between 10k and 2lakh
 
 
 class BehaviorEngine:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        # For small datasets, we retrain on the fly to adapt to changing behavior immediately.
-        # For larger datasets, we would load a saved model.
+    """
+    Customer segmentation (VIP / Silver / Bronze / High risk).
 
-    def analyze_behavior(self, customer_features):
-        """
-        Input: dataframe or list of dicts with:
-        - reliability_score (0-100)
-        - avg_delay_days (float)
-        - max_delay_days (float)
-        - total_loans_closed (int)
-        - payment_volatility (std dev of payment intervals)
+    refit() - the nightly job - computes features for every customer,
+    fits StandardScaler + KMeans on the full population and persists only
+    the scaler parameters, centroids and segment labels. score() assigns
+    the nearest centroid with plain numpy, so a single customer costs the
+    feature queries and a few microseconds of arithmetic.
+    """
 
-        Output: Dictionary mapping customer_id -> Segment & Suggested Limit
-        """
-        if not customer_features:
-            return {}
+    def __init__(self, path=MODEL_PATH):
+        self.store = ModelStore(path, FEATURE_HASH)
 
-        df = pd.DataFrame(customer_features)
-        if df.empty:
-            return {}
+    def fit(self, features):
+        X = features[SEGMENT_FEATURES].fillna(0).to_numpy(dtype=float)
+        n_clusters = min(N_SEGMENTS, len(np.unique(X, axis=0)))
+        if n_clusters < 2:  # Require at least 2 distinct points for clustering
+            return None
 
-        # Features for clustering
-        # We focus on reliability and consistency
-        X = df[["reliability_score", "avg_delay_days", "payment_volatility"]].fillna(0)
+        scaler = StandardScaler().fit(X)
+        kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
+        clusters = kmeans.fit_predict(scaler.transform(X))
 
-        # Scaling
-        X_scaled = self.scaler.fit_transform(X)
+        # Rank clusters by Reliability (Highest score = Best)
+        centers = scaler.inverse_transform(kmeans.cluster_centers_)
+        labels = [None] * n_clusters
+        for rank, cid in enumerate(np.argsort(-centers[:, 0])):
+            labels[cid] = SEGMENT_LABELS[min(rank, N_SEGMENTS - 1)]
 
-        # K-Means Clustering (4 Segments: VIP, Regular, Inconsistent, Risk)
-        n_clusters = 4
-        if len(df) < 4:
-            n_clusters = len(df)
+        return {
+            "version": self.store.next_version(),
+            "trained_at": datetime.utcnow(),
+            "n_customers": len(X),
+            "mean": scaler.mean_,
+            "scale": scaler.scale_,
+            "centroids": kmeans.cluster_centers_,
+            "labels": labels,
+            "segment_sizes": {
+                labels[cid]: int(count)
+                for cid, count in zip(*np.unique(clusters, return_counts=True))
+            },
+        }
 
-        if n_clusters > 1:  # Require at least 2 points for clustering
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-            df["cluster"] = kmeans.fit_predict(X_scaled)
+    def refit(self):
+        """Nightly population fit; returns the model metadata"""
+        with self.store.lock:
+            bundle = self.fit(behavior_features())
+            if bundle is not None:
+                self.store.save(bundle)
+        return self.describe()
 
-            # Rank clusters by Reliability (Highest score = Best)
-            cluster_rank = (
-                df.groupby("cluster")["reliability_score"]
-                .mean()
-                .sort_values(ascending=False)
-            )
+    def describe(self):
+        bundle = self.store.load()
+        if bundle is None:
+            return {"version": None}
+        return {
+            "version": bundle["version"],
+            "feature_hash": bundle["feature_hash"],
+            "trained_at": bundle["trained_at"].isoformat(),
+            "n_customers": bundle["n_customers"],
+            "segments": bundle["segment_sizes"],
+        }
 
-            # Assign Labels
-            labels = {}
-            for i, (cid, score) in enumerate(cluster_rank.items()):
-                if i == 0:
-                    labels[cid] = "VIP (GOLD)"
-                elif i == 1:
-                    labels[cid] = "SILVER"
-                elif i == 2:
-                    labels[cid] = "BRONZE"
-                else:
-                    labels[cid] = "HIGH RISK"
-
-            df["segment"] = df["cluster"].map(labels)
-        else:
-            # Fallback for single customer or cold start
-            rel_score = df.iloc[0]["reliability_score"] if not df.empty else 0
-            if rel_score >= 90:
-                df["segment"] = "VIP (GOLD)"
-            elif rel_score >= 70:
-                df["segment"] = "SILVER"
-            elif rel_score >= 40:
-                df["segment"] = "BRONZE"
-            else:
-                df["segment"] = "HIGH RISK"
-
-        results = {}
-        for index, row in df.iterrows():
-            cid = row["customer_id"]
-            segment = row["segment"]
-
-            # AI Loan Suggestion Rule
-            # Base logic tailored by Segment
-            base_capacity = float(row.get("avg_payment_capacity", 5000))
-            multiplier = 1.0
-
-            if segment == "VIP (GOLD)":
-                multiplier = 2.5  # Trust them with more
-            elif segment == "SILVER":
-                multiplier = 1.5
-            elif segment == "HIGH RISK":
-                multiplier = 0.5  # Restrict them
-
-            suggested_limit = base_capacity * 10 * multiplier
-            suggested_limit = (
-                round(suggested_limit / 5000) * 5000
-            )  # Round to nearest 5k
-            suggested_limit = max(
-                min(suggested_limit, 200000), 10000
-            )  # Cap between 10k and 2lakh
-
-            results[cid] = {"segment": segment, "suggested_limit": suggested_limit}
-
-        return results
+    def segments(self, features):
+        """Segment label per row of `features`"""
+        X = np.nan_to_num(features[SEGMENT_FEATURES].to_numpy(dtype=float))
+        bundle = self.store.load()
+        if bundle is not None:
+            scaled = (X - bundle["mean"]) / bundle["scale"]
+            distances = ((scaled[:, None, :] - bundle["centroids"][None]) ** 2).sum(-1)
+            return np.asarray(bundle["labels"], dtype=object)[distances.argmin(1)]
+
+        # No fitted model yet (cold start): reliability thresholds
+        reliability = X[:, 0]
+        return np.select(
+            [reliability >= 90, reliability >= 70, reliability >= 40],
+            SEGMENT_LABELS[:3],
+            default=SEGMENT_LABELS[3],
+        )
+
+    def score(self, features):
+        """
+        Input: DataFrame from behavior_features() (indexed by customer_id)
+
+        Output: Dictionary mapping customer_id -> Segment & Suggested Limit
+        """
+        if features.empty:
+            return {}
+        return {
+            cid: {
+                "segment": segment,
+                "suggested_limit": suggested_limit(segment, capacity),
+            }
+            for cid, segment, capacity in zip(
+                features.index,
+                self.segments(features),
+                features["avg_payment_capacity"],
+            )
+        }
 
 
 behavior_engine = BehaviorEngine()
@@ -0,0 +1,201 @@
+import math
+from datetime import datetime
+
+from utils.interest_utils import get_distance_meters
+
+# Weight of the newest event in the per-agent running mean/variance
+ALPHA = 0.1
+# Events an agent needs before its z-scores are trusted
+WARMUP_EVENTS = 8
+# Score at which a collection is flagged (in standard deviations)
+Z_LIMIT = 4.0
+# Faster than a two-wheeler can move between doorsteps in town
+MAX_SPEED_KMH = 80.0
+# GPS error allowed between two fixes (same slack as the geofence check)
+GPS_TOLERANCE_METERS = 200.0
+# A longer pause starts a new round; it says nothing about pace
+MAX_GAP_SECONDS = 4 * 3600
+# Variance floors (log space) so a perfectly regular agent is not flagged
+# for the first tiny deviation
+MIN_AMOUNT_SD = 0.25
+MIN_GAP_SD = 0.5
+
+
+class AnomalyResult:
+    def __init__(self, score, reasons, features):
+        self.score = score
+        self.reasons = reasons
+        self.features = features
+
+    @property
+    def flagged(self):
+        return self.score >= Z_LIMIT
+
+
+class StreamState:
+    """
+    The stream-model attributes of AgentTrustState as a plain object, for
+    offline replay where ORM attribute tracking would double the cost.
+    """
+
+    __slots__ = (
+        "agent_id",
+        "stream_events",
+        "amount_mean",
+        "amount_var",
+        "gap_mean",
+        "gap_var",
+        "last_anomaly_score",
+        "last_collection_at",
+        "last_latitude",
+        "last_longitude",
+    )
+
+    def __init__(self, agent_id):
+        self.agent_id = agent_id
+        self.stream_events = 0
+        self.amount_mean = self.amount_var = None
+        self.gap_mean = self.gap_var = None
+        self.last_anomaly_score = None
+        self.last_collection_at = None
+        self.last_latitude = self.last_longitude = None
+
+
+def _coord(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value or None  # 0.0 counts as missing, as in the geofence check
+
+
+def _ew_update(mean, var, x):
+    """Exponentially weighted mean/variance, O(1) per event"""
+    if mean is None:
+        return x, 0.0
+    diff = x - mean
+    incr = ALPHA * diff
+    return mean + incr, (1 - ALPHA) * (var + diff * incr)
+
+
+def _z(x, mean, var, floor):
+    return (x - mean) / max(math.sqrt(var or 0.0), floor)
+
+
+class CollectionStreamDetector:
+    """
+    Online anomaly scoring over each agent's stream of collections.
+
+    The per-agent model is an exponentially weighted Gaussian over
+    log(amount) and log(seconds since the previous collection), kept in a
+    few AgentTrustState columns next to the last collection's time and
+    position. Scoring an event and folding it in are both O(1) with no
+    queries, so it runs inline in /submit; the replay script feeds
+    historical rows through the same code.
+    """
+
+    def features(self, state, amount, latitude, longitude, at=None):
+        at = at or datetime.utcnow()
+        feats = {
+            "log_amount": math.log1p(max(float(amount or 0), 0.0)),
+            "log_gap": None,
+            "gap_seconds": None,
+            "speed_kmh": None,
+            "at": at,
+            "latitude": _coord(latitude),
+            "longitude": _coord(longitude),
+        }
+        if state.last_collection_at is None:
+            return feats
+
+        gap = (at - state.last_collection_at).total_seconds()
+        if gap < 0:
+            return feats  # out-of-order replay row
+        feats["gap_seconds"] = gap
+        if gap <= MAX_GAP_SECONDS:
+            feats["log_gap"] = math.log1p(gap)
+
+        last_lat = _coord(state.last_latitude)
+        last_lon = _coord(state.last_longitude)
+        if gap <= MAX_GAP_SECONDS and None not in (
+            feats["latitude"],
+            feats["longitude"],
+            last_lat,
+            last_lon,
+        ):
+            meters = get_distance_meters(
+                last_lat, last_lon, feats["latitude"], feats["longitude"]
+            )
+            if meters > GPS_TOLERANCE_METERS:
+                travelled_km = (meters - GPS_TOLERANCE_METERS) / 1000.0
+                feats["speed_kmh"] = travelled_km / (max(gap, 1.0) / 3600.0)
+        return feats
+
+    def score(self, state, feats):
+        components = []
+        reasons = []
+
+        speed = feats["speed_kmh"]
+        if speed is not None:
+            components.append(Z_LIMIT * speed / MAX_SPEED_KMH)
+            if speed >= MAX_SPEED_KMH:
+                reasons.append(
+                    f"Travel Anomaly: {round(speed)} km/h implied since previous collection"
+                )
+
+        if (state.stream_events or 0) >= WARMUP_EVENTS:
+            z_amount = abs(
+                _z(
+                    feats["log_amount"],
+                    state.amount_mean,
+                    state.amount_var,
+                    MIN_AMOUNT_SD,
+                )
+            )
+            components.append(z_amount)
+            if z_amount >= Z_LIMIT:
+                reasons.append(
+                    f"Amount Anomaly: {z_amount:.1f} sd from agent's usual collections"
+                )
+
+            if feats["log_gap"] is not None and state.gap_mean is not None:
+                # Only unusually short gaps are suspicious
+                z_gap = -_z(feats["log_gap"], state.gap_mean, state.gap_var, MIN_GAP_SD)
+                components.append(z_gap)
+                if z_gap >= Z_LIMIT:
+                    reasons.append(
+                        f"Pace Anomaly: {int(feats['gap_seconds'])}s gap is "
+                        f"{z_gap:.1f} sd faster than agent's usual pace"
+                    )
+
+        score = max(components, default=0.0)
+        return AnomalyResult(round(max(score, 0.0), 3), reasons, feats)
+
+    def update(self, state, feats, score=None):
+        """Fold the event into the agent's model and last-seen position"""
+        state.amount_mean, state.amount_var = _ew_update(
+            state.amount_mean, state.amount_var, feats["log_amount"]
+        )
+        if feats["log_gap"] is not None:
+            state.gap_mean, state.gap_var = _ew_update(
+                state.gap_mean, state.gap_var, feats["log_gap"]
+            )
+        state.stream_events = (state.stream_events or 0) + 1
+        if score is not None:
+            state.last_anomaly_score = score
+        if state.last_collection_at is None or feats["at"] >= state.last_collection_at:
+            # An out-of-order event does not move the agent back in time
+            state.last_collection_at = feats["at"]
+            state.last_latitude = feats["latitude"]
+            state.last_longitude = feats["longitude"]
+
+    def observe(self, state, amount, latitude, longitude, at=None):
+        """Score an event against the model, then learn from it"""
+        result = self.score(
+            state, self.features(state, amount, latitude, longitude, at)
+        )
+        self.update(state, result.features, result.score)
+        return result
+
+
+stream_detector = CollectionStreamDetector()
@@ -1,59 +1,208 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
 from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import IsolationForest
+from sqlalchemy import case, func, select
+
+from extensions import db
+from models import AgentTrustState, Collection, User, UserRole
+from utils.model_store import ModelStore, feature_hash
+
+MODEL_PATH = "worker_model.pkl"
+# Refit cadence the automation endpoint enforces (unless forced)
+REFIT_INTERVAL = timedelta(hours=int(os.getenv("WORKER_MODEL_REFIT_HOURS", 24)))
+
+# Feature layout the persisted models were fitted on; bump FEATURE_SPEC when
+# the feature definitions change so old bundles are refitted, not misread
+FEATURE_SPEC = 1
+ANOMALY_FEATURES = ["count", "risk_index", "amount"]
+CLUSTER_FEATURES = ["amount", "count"]
+FEATURE_HASH = feature_hash(FEATURE_SPEC, ANOMALY_FEATURES, CLUSTER_FEATURES)
+
+# Below this many agents IsolationForest is meaningless; use rules instead
+MIN_AGENTS_FOR_FOREST = 10
+
+
+def agent_features():
+    """
+    Per field agent: approved amount, collection count, flagged count and
+    batch entries (several collections with the same timestamp), in one
+    grouped query.
+    """
+    c = Collection.__table__
+    stats = (
+        select(
+            c.c.agent_id,
+            func.sum(case((c.c.status == "approved", c.c.amount), else_=0)).label(
+                "amount"
+            ),
+            func.count(c.c.id).label("count"),
+            func.sum(case((c.c.status == "flagged", 1), else_=0)).label("flagged"),
+        )
+        .group_by(c.c.agent_id)
+        .subquery()
+    )
+    stamps = (
+        select(c.c.agent_id)
+        .group_by(c.c.agent_id, c.c.created_at)
+        .having(func.count(c.c.id) > 1)
+        .subquery()
+    )
+    batches = (
+        select(stamps.c.agent_id, func.count().label("batch_events"))
+        .group_by(stamps.c.agent_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(
+            User.id,
+            User.name,
+            func.coalesce(stats.c.amount, 0),
+            func.coalesce(stats.c.count, 0),
+            func.coalesce(stats.c.flagged, 0),
+            func.coalesce(batches.c.batch_events, 0),
+        )
+        .outerjoin(stats, stats.c.agent_id == User.id)
+        .outerjoin(batches, batches.c.agent_id == User.id)
+        .where(User.role == UserRole.FIELD_AGENT)
+        .order_by(User.id)
+    )
+    return [
+        {
+            "agent_id": agent_id,
+            "name": name,
+            "amount": float(amount or 0),
+            "count": int(count or 0),
+            "flagged": int(flagged or 0),
+            "batch_events": int(batch_events or 0),
+        }
+        for agent_id, name, amount, count, flagged, batch_events in rows
+    ]
+
+
+def data_watermark():
+    """
+    Changes whenever the features can have changed: every collection and
+    review touches its agent's AgentTrustState row, and new agents change
+    the field agent count. Two small aggregate reads.
+    """
+    trust_rows, trust_updated = db.session.query(
+        func.count(AgentTrustState.agent_id), func.max(AgentTrustState.updated_at)
+    ).one()
+    agents, last_agent = (
+        db.session.query(func.count(User.id), func.max(User.id))
+        .filter(User.role == UserRole.FIELD_AGENT)
+        .one()
+    )
+    return (trust_rows, str(trust_updated), agents, last_agent)
 
-MODEL_PATH_ISO = "worker_anomaly_model.pkl"
-MODEL_PATH_KMEANS = "worker_cluster_model.pkl"
+
+def _frame(agent_rows):
+    df = pd.DataFrame(
+        agent_rows, columns=["agent_id", "amount", "count", "flagged", "batch_events"]
+    )
+    # Weighted risk
+    df["risk_index"] = (df["batch_events"] * 2) + (df["flagged"] * 5)
+    return df
 
 
 class WorkerIntelligence:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        # We don't necessarily need to persist these for small batches,
-        # retraining on live data per request is often better for dynamic dashboards
-        # unless dataset is huge. For < 100 agents, live training is ms.
+    """
+    Workforce anomaly detection (IsolationForest) and performance tiers
+    (KMeans) for the analytics pages.
+
+    Models are fitted by refit() - on a schedule via the automation
+    endpoint - and persisted with a version and the feature hash they were
+    fitted on. Requests only score against the loaded models, and the
+    scored report is cached per data watermark, so an unchanged dashboard
+    costs two tiny queries.
+    """
+
+    def __init__(self, path=MODEL_PATH):
+        self.store = ModelStore(path, FEATURE_HASH)
+        self._report = None  # (watermark, model version, rows)
+
+    # --- model lifecycle ---
+
+    def is_stale(self):
+        bundle = self.store.load()
+        return (
+            bundle is None or datetime.utcnow() - bundle["trained_at"] >= REFIT_INTERVAL
+        )
+
+    def fit(self, agent_rows):
+        """Fit fresh models on the given feature rows (no persistence)"""
+        df = _frame(agent_rows)
+
+        iso = None
+        if len(df) >= MIN_AGENTS_FOR_FOREST:
+            iso = IsolationForest(contamination=0.1, random_state=42)
+            iso.fit(df[ANOMALY_FEATURES].fillna(0))
+
+        kmeans, labels = None, {}
+        n_clusters = min(3, len(df))
+        if n_clusters > 0:
+            kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
+            kmeans.fit(df[CLUSTER_FEATURES].fillna(0))
+            # Label clusters by their average amount (first cluster feature)
+            order = np.argsort(-kmeans.cluster_centers_[:, 0])
+            for rank, cid in enumerate(order):
+                if rank == 0:
+                    labels[int(cid)] = "TOP PERFORMER"
+                elif rank == n_clusters - 1:
+                    labels[int(cid)] = "UNDERPERFORMING"
+                else:
+                    labels[int(cid)] = "STEADY"
+
+        return {
+            "version": self.store.next_version(),
+            "trained_at": datetime.utcnow(),
+            "n_agents": len(df),
+            "isolation_forest": iso,
+            "kmeans": kmeans,
+            "cluster_labels": labels,
+        }
+
+    def refit(self, force=False):
+        """Scheduled refit; returns the bundle metadata"""
+        with self.store.lock:
+            if force or self.is_stale():
+                self.store.save(self.fit(agent_features()))
+                self._report = None
+        return self.describe()
 
-    def analyze_workforce(self, agent_data_list):
+    def describe(self):
+        bundle = self.store.load()
+        if bundle is None:
+            return {"version": None}
+        return {
+            "version": bundle["version"],
+            "feature_hash": bundle["feature_hash"],
+            "trained_at": bundle["trained_at"].isoformat(),
+            "n_agents": bundle["n_agents"],
+        }
+
+    # --- request-time scoring ---
+
+    def score(self, agent_rows, bundle):
         """
         Input: List of dicts: [
             {'agent_id': 1, 'amount': 50000, 'count': 50, 'batch_events': 2, 'flagged': 0},
             ...
         ]
 
-        Outputs:
-        - DataFrame with 'anomaly_score', 'is_anomaly', 'cluster_label'
+        Output: map of agent_id -> {'is_suspicious', 'cluster', 'risk_score'}
         """
-        if not agent_data_list:
+        if not agent_rows:
             return {}
+        df = _frame(agent_rows)
 
-        df = pd.DataFrame(agent_data_list)
-        if df.empty:
-            return {}
-
-        # Features for analysis
-        # 1. Volume (Amount)
-        # 2. Activity (Count)
-        # 3. Risk (Batch Events + Flagged)
-
-        # Prepare Feature Matrix
-        X = df[["amount", "count", "batch_events", "flagged"]].copy()
-        X["risk_index"] = (X["batch_events"] * 2) + (X["flagged"] * 5)  # Weighted risk
-
-        # Select features for ML
-        # Anomaly Detection Features: Focus on pattern irregularity
-        X_anomaly = X[["count", "risk_index", "amount"]]
-
-        # Fill NaN
-        X_anomaly = X_anomaly.fillna(0)
-
-        # --- 1. Anomaly Detection (Isolation Forest) ---
-        # Detects agents whose behavior significantly deviates from the norm
-        # e.g. Too many collections in short time (Fraud) or zero collections (Slacker)
-        if len(df) >= 10:  # Increased threshold for meaningful Isolation Forest
-            iso = IsolationForest(contamination=0.1, random_state=42)
-            df["anomaly_score"] = iso.fit_predict(X_anomaly)
-            df["is_suspicious"] = df["anomaly_score"] == -1
+        iso = bundle["isolation_forest"]
+        if iso is not None and len(df) >= MIN_AGENTS_FOR_FOREST:
+            df["is_suspicious"] = iso.predict(df[ANOMALY_FEATURES].fillna(0)) == -1
         else:
             # Enhanced fallback for small teams: Multi-factor threshold
             df["is_suspicious"] = (
@@ -62,53 +211,46 @@ class WorkerIntelligence:
                 | ((df["amount"] == 0) & (df["count"] > 0))
             )  # Flag zero collection attempts if activity exists
 
-        # --- 2. Performance Clustering (K-Means) ---
-        # Cluster into: Top Performers, Average, Underperformers
-        # We use Amount and Count for this
-        X_cluster = X[["amount", "count"]]
-
-        n_clusters = 3
-        if len(df) < 3:
-            n_clusters = len(df)  # Edge case for very small teams
-
-        if n_clusters > 0:
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-            df["cluster_id"] = kmeans.fit_predict(X_cluster)
-
-            # Label Clusters based on average performance
-            cluster_centers = (
-                df.groupby("cluster_id")["amount"].mean().sort_values(ascending=False)
-            )
-
-            # Map ID to human label
-            labels = {}
-            for i, (cid, avg_amt) in enumerate(cluster_centers.items()):
-                if i == 0:
-                    labels[cid] = "TOP PERFORMER"
-                elif i == n_clusters - 1:
-                    labels[cid] = "UNDERPERFORMING"
-                else:
-                    labels[cid] = "STEADY"
-
-            df["cluster_label"] = df["cluster_id"].map(labels)
+        kmeans = bundle["kmeans"]
+        if kmeans is not None:
+            clusters = kmeans.predict(df[CLUSTER_FEATURES].fillna(0))
+            df["cluster_label"] = [
+                bundle["cluster_labels"].get(int(cid), "STEADY") for cid in clusters
+            ]
         else:
             df["cluster_label"] = "N/A"
 
-        # Return map of agent_id -> result dict
-        results = {}
-        # Important: risk_index was calculated in X, need to ensure it's in final iteration or access correctly
-        # Let's join risk_index back to df for easier iteration
-        df["risk_index"] = X["risk_index"]
-
-        for index, row in df.iterrows():
-            agent_id = row["agent_id"]
-            results[agent_id] = {
-                "is_suspicious": bool(row["is_suspicious"]),
-                "cluster": row["cluster_label"],
-                "risk_score": float(row["risk_index"]),
+        return {
+            row.agent_id: {
+                "is_suspicious": bool(row.is_suspicious),
+                "cluster": row.cluster_label,
+                "risk_score": float(row.risk_index),
             }
+            for row in df.itertuples()
+        }
+
+    def report(self):
+        """
+        Feature rows of every field agent merged with their model results,
+        cached until the data watermark or model version changes.
+        """
+        watermark = data_watermark()
+        bundle = self.store.load()
+        if bundle is None:
+            # Cold start: no fitted model on disk yet
+            self.refit(force=True)
+            bundle = self.store.bundle
+
+        cached = self._report
+        if cached and cached[0] == watermark and cached[1] == bundle["version"]:
+            return cached[2]
 
-        return results
+        rows = agent_features()
+        results = self.score(rows, bundle)
+        for row in rows:
+            row.update(results.get(row["agent_id"], {}))
+        self._report = (watermark, bundle["version"], rows)
+        return rows
 
 
 worker_engine = WorkerIntelligence()
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import joblib
+
+
+def feature_hash(*spec):
+    """Short hash of a model's feature layout, stored with each fit"""
+    return hashlib.sha256(repr(spec).encode()).hexdigest()[:16]
+
+
+class ModelStore:
+    """
+    One persisted model bundle (a joblib'd dict with at least "version" and
+    "feature_hash"), shared by all workers through the file.
+    load() re-reads the file only when its mtime changes and ignores a
+    bundle fitted on another feature layout; save() writes a temp file and
+    renames it, so readers never see a half-written bundle.
+    """
+
+    def __init__(self, path, features):
+        self.path = path
+        self.features = features
+        self.bundle = None
+        self._mtime = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.bundle
+        if mtime == self._mtime:
+            return self.bundle
+        try:
+            bundle = joblib.load(self.path)
+        except Exception as e:
+            print(f"DEBUG: Error loading {self.path}: {e}")
+            return self.bundle
+        self._mtime = mtime
+        if bundle.get("feature_hash") != self.features:
+            print(f"DEBUG: {self.path} was fitted on other features; ignoring it.")
+            return self.bundle
+        self.bundle = bundle
+        return bundle
+
+    def next_version(self):
+        bundle = self.load()
+        return bundle["version"] + 1 if bundle else 1
+
+    def save(self, bundle):
+        bundle["feature_hash"] = self.features
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump(bundle, tmp)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        self._mtime = os.path.getmtime(self.path)
+        self.bundle = bundle
+        return bundle
@@ -0,0 +1,383 @@
+"""
+Transactional outbox for collection and loan events pushed to webhooks.
+
+record_event()/record_events() add one event_outbox row per interested
+sink to the caller's session, so an event is stored if and only if the
+change that raised it commits. Nothing is recorded unless the
+webhook_events_enabled setting is on, and a sink whose URL setting is
+empty gets nothing.
+
+dispatch_pending() delivers the rows. Each loan's events reach a sink in
+the order they were recorded: a loan's later events wait while an
+earlier one is being retried. Batch sinks receive up to
+OUTBOX_BATCH_SIZE events per POST as {"events": [...]}; other sinks get
+one POST per event. A failed delivery is retried with exponential
+backoff and given up after OUTBOX_MAX_ATTEMPTS. When a sink answers 429
+or 5xx, or does not answer, dispatch to it pauses (honouring
+Retry-After) instead of piling more requests on it. Bodies are signed
+with HMAC-SHA256 in X-Webhook-Signature when WEBHOOK_SIGNING_SECRET is
+set.
+
+The dispatcher runs as the event_dispatch scheduled job. Each run polls
+the outbox every second for most of a minute, so events go out within
+about a second of their commit, and the job lease keeps dispatch in one
+process.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, insert, select, update
+
+from extensions import db
+from models import Collection, OutboxEvent
+from utils.settings_store import get_settings
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+WEBHOOK_SIGNING_SECRET = os.getenv("WEBHOOK_SIGNING_SECRET", "")
+WEBHOOK_TIMEOUT_SECONDS = 10
+RETRY_BASE_SECONDS = 15
+RETRY_MAX_SECONDS = 3600
+# Pending rows examined per pass when picking a sink's next batch
+SCAN_FACTOR = 5
+
+outbox = OutboxEvent.__table__
+
+# url_setting: the system setting holding the sink's URL
+# event_types: the events it receives (None for all)
+# batch: True to POST {"events": [...]}, False for one event per POST
+Sink = namedtuple("Sink", ["url_setting", "event_types", "batch"])
+
+SINKS = {
+    # n8n error-detection agent: one submitted collection per call
+    "error_detection": Sink(
+        "error_detection_webhook_url", frozenset({"collection.submitted"}), False
+    ),
+    "events": Sink("event_webhook_url", None, True),
+}
+
+# sink -> monotonic time before which dispatch to it is paused
+_paused_until = {}
+
+
+def retry_delay(attempt):
+    return timedelta(
+        seconds=min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    )
+
+
+def _sinks_for(settings, event_type):
+    return [
+        name
+        for name, sink in SINKS.items()
+        if settings.get_str(sink.url_setting)
+        and (sink.event_types is None or event_type in sink.event_types)
+    ]
+
+
+def record_events(events):
+    """
+    Stage events in the caller's transaction. `events` is an iterable of
+    (event_type, loan_id, data) with JSON-serialisable data. Returns the
+    number of outbox rows added; the caller commits.
+    """
+    settings = get_settings()
+    if not settings.get_bool("webhook_events_enabled"):
+        return 0
+    now = datetime.utcnow()
+    rows = []
+    for event_type, loan_id, data in events:
+        sinks = _sinks_for(settings, event_type)
+        if not sinks:
+            continue
+        payload = json.dumps(data, default=str)
+        rows.extend(
+            {
+                "sink": sink,
+                "event_type": event_type,
+                "loan_id": loan_id,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            }
+            for sink in sinks
+        )
+    if rows:
+        db.session.execute(insert(outbox), rows)
+    return len(rows)
+
+
+def record_event(event_type, loan_id, data):
+    return record_events([(event_type, loan_id, data)])
+
+
+def events_enabled():
+    """True when events are being recorded (to skip building payloads)"""
+    return get_settings().get_bool("webhook_events_enabled")
+
+
+# --- Event payloads ---
+
+
+def loan_data(loan, **extra):
+    return {
+        "loan_id": loan.id,
+        "loan_code": loan.loan_id,
+        "customer_id": loan.customer_id,
+        "status": loan.status,
+        "principal_amount": loan.principal_amount,
+        "pending_amount": loan.pending_amount,
+        **extra,
+    }
+
+
+def submitted_collection_data(collection, loan, fraud_warning=None):
+    """
+    collection.submitted, with the loan's recent approved collections so
+    the error-detection agent needs no call back for them
+    """
+    recent = db.session.execute(
+        select(Collection.amount, Collection.created_at)
+        .where(
+            Collection.loan_id == collection.loan_id,
+            Collection.status == "approved",
+            Collection.id != collection.id,
+        )
+        .order_by(Collection.created_at.desc())
+        .limit(10)
+    ).all()
+    today = datetime.utcnow().date()
+    return {
+        "collection_id": collection.id,
+        "loan_id": collection.loan_id,
+        "loan_code": loan.loan_id,
+        "customer_id": loan.customer_id,
+        "agent_id": collection.agent_id,
+        "line_id": collection.line_id,
+        "amount": collection.amount,
+        "payment_mode": collection.payment_mode,
+        "status": collection.status,
+        "created_at": collection.created_at.isoformat() + "Z",
+        "anomaly_score": collection.anomaly_score,
+        "fraud_warning": fraud_warning,
+        "history": [{"amount": a, "date": at.isoformat()} for a, at in recent],
+        "has_entry_today": any(at.date() == today for _, at in recent),
+    }
+
+
+def reviewed_collection_data(collection_id, loan_id, agent_id, amount, status, by):
+    return {
+        "collection_id": collection_id,
+        "loan_id": loan_id,
+        "agent_id": agent_id,
+        "amount": amount,
+        "status": status,
+        "reviewed_by": by,
+    }
+
+
+# --- Dispatch ---
+
+
+def _next_batch(sink, now, size):
+    """
+    The sink's next deliverable events, oldest first. An event is held
+    back while an earlier event of the same loan is still pending.
+    """
+    rows = db.session.execute(
+        select(
+            outbox.c.id,
+            outbox.c.event_type,
+            outbox.c.loan_id,
+            outbox.c.payload,
+            outbox.c.attempts,
+            outbox.c.next_attempt_at,
+            outbox.c.created_at,
+        )
+        .where(outbox.c.sink == sink, outbox.c.status == "pending")
+        .order_by(outbox.c.id)
+        .limit(size * SCAN_FACTOR)
+    ).all()
+    blocked, batch = set(), []
+    for row in rows:
+        if row.loan_id is not None and row.loan_id in blocked:
+            continue
+        if row.next_attempt_at > now:
+            if row.loan_id is not None:
+                blocked.add(row.loan_id)
+            continue
+        batch.append(row)
+        if len(batch) == size:
+            break
+    return batch
+
+
+def _envelope(row):
+    return {
+        "id": row.id,
+        "type": row.event_type,
+        "loan_id": row.loan_id,
+        "occurred_at": row.created_at.isoformat() + "Z",
+        "data": json.loads(row.payload),
+    }
+
+
+def _post(session, url, body):
+    """POST JSON; returns (ok, retry_after_seconds or None, error)"""
+    import requests
+
+    data = json.dumps(body, default=str).encode()
+    headers = {"Content-Type": "application/json"}
+    if WEBHOOK_SIGNING_SECRET:
+        headers["X-Webhook-Signature"] = hmac.new(
+            WEBHOOK_SIGNING_SECRET.encode(), data, hashlib.sha256
+        ).hexdigest()
+    try:
+        response = session.post(
+            url, data=data, headers=headers, timeout=WEBHOOK_TIMEOUT_SECONDS
+        )
+    except requests.RequestException as e:
+        return False, None, str(e)
+    if response.status_code < 300:
+        return True, None, None
+    retry_after = None
+    if response.status_code in (429, 503):
+        try:
+            retry_after = float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            pass
+    return False, retry_after, f"HTTP {response.status_code}"
+
+
+def _mark_delivered(ids, now):
+    db.session.execute(
+        update(outbox)
+        .where(outbox.c.id.in_(ids))
+        .values(
+            status="delivered",
+            attempts=outbox.c.attempts + 1,
+            delivered_at=now,
+            last_error=None,
+        )
+    )
+
+
+def _mark_failed(rows, now, error):
+    """Schedule a retry, or give up once OUTBOX_MAX_ATTEMPTS is reached"""
+    attempt = max(row.attempts for row in rows) + 1
+    db.session.execute(
+        update(outbox)
+        .where(outbox.c.id.in_([row.id for row in rows]))
+        .values(
+            attempts=outbox.c.attempts + 1,
+            status=case(
+                (outbox.c.attempts + 1 >= OUTBOX_MAX_ATTEMPTS, "failed"),
+                else_="pending",
+            ),
+            next_attempt_at=now + retry_delay(attempt),
+            last_error=error,
+        )
+    )
+    return retry_delay(attempt)
+
+
+def _deliver(session, name, sink, url, batch):
+    """Send one batch; returns (delivered, failed, pause_seconds or None)"""
+    now = datetime.utcnow()
+    if sink.batch:
+        ok, retry_after, error = _post(
+            session, url, {"events": [_envelope(row) for row in batch]}
+        )
+        if ok:
+            _mark_delivered([row.id for row in batch], now)
+            db.session.commit()
+            return len(batch), 0, None
+        delay = _mark_failed(batch, now, error)
+        db.session.commit()
+        print(f"Webhook sink {name} failed: {error}")
+        return 0, len(batch), retry_after or delay.total_seconds()
+
+    delivered = []
+    for row in batch:
+        event = _envelope(row)
+        ok, retry_after, error = _post(
+            session,
+            url,
+            {**event["data"], "event_id": event["id"], "event_type": event["type"]},
+        )
+        if not ok:
+            if delivered:
+                _mark_delivered(delivered, now)
+            delay = _mark_failed([row], now, error)
+            db.session.commit()
+            print(f"Webhook sink {name} failed: {error}")
+            return len(delivered), 1, retry_after or delay.total_seconds()
+        delivered.append(row.id)
+    _mark_delivered(delivered, now)
+    db.session.commit()
+    return len(delivered), 0, None
+
+
+def dispatch_pending(budget_seconds=50, idle_seconds=1.0, session=None):
+    """
+    Deliver outbox events until `budget_seconds` have passed, polling
+    every `idle_seconds` while there is nothing to send. Returns counts.
+    """
+    import requests
+
+    session = session or requests.Session()
+    deadline = time.monotonic() + budget_seconds
+    totals = Counter()
+    while True:
+        settings = get_settings()
+        busy = False
+        for name, sink in SINKS.items():
+            url = settings.get_str(sink.url_setting)
+            if not url or _paused_until.get(name, 0) > time.monotonic():
+                continue
+            batch = _next_batch(name, datetime.utcnow(), OUTBOX_BATCH_SIZE)
+            db.session.commit()  # end the read transaction between polls
+            if not batch:
+                continue
+            busy = True
+            delivered, failed, pause = _deliver(session, name, sink, url, batch)
+            totals["delivered"] += delivered
+            totals["failed_attempts"] += failed
+            if pause:
+                # Back off the whole sink, not just the failed events
+                _paused_until[name] = time.monotonic() + pause
+                totals["paused"] += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not busy:
+            time.sleep(min(idle_seconds, remaining))
+    return dict(totals)
+
+
+def outbox_summary():
+    """Event counts by sink and status, with the oldest pending event's age"""
+    summary = {}
+    for sink, status, count, oldest in db.session.execute(
+        select(
+            outbox.c.sink,
+            outbox.c.status,
+            func.count(),
+            func.min(outbox.c.created_at),
+        ).group_by(outbox.c.sink, outbox.c.status)
+    ):
+        entry = summary.setdefault(sink, {})
+        entry[status] = count
+        if status == "pending" and oldest:
+            entry["oldest_pending_seconds"] = int(
+                (datetime.utcnow() - oldest).total_seconds()
+            )
+    return summary
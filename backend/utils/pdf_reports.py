@@ -0,0 +1,253 @@
+import glob
+import hashlib
+import os
+from calendar import monthrange
+from datetime import date, datetime
+
+from fpdf import FPDF
+
+# Cached statements live next to the other runtime artefacts (uploads/, *.pkl)
+PDF_CACHE_DIR = os.getenv("REPORT_PDF_CACHE_DIR", "cache/daily_reports")
+
+# Bump whenever the static layout below changes so stale files are not served
+TEMPLATE_VERSION = 1
+
+# Fonts used by the static layer, registered in this order in every document
+# so the /F1../F3 references baked into the template stream stay valid.
+TEMPLATE_FONTS = (("Helvetica", "B"), ("Helvetica", ""), ("Helvetica", "I"))
+
+SLATE_900 = (15, 23, 42)
+SLATE_800 = (30, 41, 59)
+SLATE_500 = (100, 116, 139)
+SLATE_400 = (148, 163, 184)
+GREEN_800 = (22, 101, 52)
+
+# (field, label, is_bold) - None inserts the 4mm gap between sections
+STATEMENT_ROWS = (
+    ("total_amount", "Total Collections Approved", True),
+    None,
+    ("morning_amount", "Morning Session", False),
+    ("evening_amount", "Evening Session", False),
+    None,
+    ("cash_amount", "Cash Payments", False),
+    ("upi_amount", "UPI Payments", False),
+    None,
+    ("loan_principal", "Principal Collected", False),
+    ("loan_interest", "Interest Collected", False),
+)
+
+# Row values that feed the cache key, i.e. everything drawn on the page
+REPORT_FIELDS = (
+    "report_date",
+    "total_amount",
+    "morning_amount",
+    "evening_amount",
+    "cash_amount",
+    "upi_amount",
+    "loan_principal",
+    "loan_interest",
+    "collection_count",
+)
+
+
+class StatementTemplate:
+    """
+    Static page of the daily accounting statement.
+    Header, labels, rules and fills are rendered once per process into a raw
+    page stream; each report only draws its numbers into the recorded slots.
+    """
+
+    def __init__(self):
+        self.stream, self.slots = self._build()
+
+    @staticmethod
+    def _register_fonts(pdf):
+        for family, style in TEMPLATE_FONTS:
+            pdf.set_font(family, style, 12)
+
+    def _build(self):
+        pdf = FPDF()
+        self._register_fonts(pdf)
+        pdf.add_page()
+        slots = {}
+
+        def slot(name, w, h, style, size, color, align="L"):
+            if w == 0:
+                w = pdf.w - pdf.r_margin - pdf.get_x()
+            slots[name] = {
+                "x": pdf.get_x(),
+                "y": pdf.get_y(),
+                "w": w,
+                "h": h,
+                "style": style,
+                "size": size,
+                "color": color,
+                "align": align,
+            }
+
+        # 1. Header Section
+        pdf.set_font("Helvetica", "B", 22)
+        pdf.set_text_color(*SLATE_900)
+        pdf.cell(0, 15, "ARUN FINANCE", ln=True, align="C")
+
+        pdf.set_font("Helvetica", "", 12)
+        pdf.set_text_color(*SLATE_500)
+        pdf.cell(0, 8, "Official Daily Accounting Statement", ln=True, align="C")
+        pdf.ln(2)
+        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+        pdf.ln(10)
+
+        # 2. Date Section (label static, date drawn per report)
+        pdf.set_font("Helvetica", "B", 14)
+        pdf.set_text_color(*SLATE_800)
+        label = "Report Date: "
+        pdf.cell(pdf.get_string_width(label), 10, label)
+        slot("report_date", 0, 10, "B", 14, SLATE_800)
+        pdf.ln(10)
+        pdf.ln(5)
+
+        # 3. Main Summary Table
+        pdf.set_fill_color(248, 250, 252)
+        pdf.set_font("Helvetica", "B", 12)
+        pdf.cell(0, 12, "  FINANCIAL BREAKDOWN", ln=True, fill=True)
+
+        for row in STATEMENT_ROWS:
+            if row is None:
+                pdf.ln(4)
+                continue
+            field, label, is_bold = row
+            style = "B" if is_bold else ""
+            border = "B" if is_bold else 0
+            color = GREEN_800 if is_bold else SLATE_800
+
+            pdf.set_x(15)
+            pdf.set_font("Helvetica", style, 12)
+            pdf.set_text_color(*color)
+            pdf.cell(90, 12, f"{label}:", border=border)
+            slot(field, 0, 12, style, 12, color, align="R")
+            pdf.cell(0, 12, "", border=border, ln=True)
+
+        pdf.set_text_color(*SLATE_800)
+        pdf.ln(10)
+        pdf.set_fill_color(241, 245, 249)
+        slot("collection_count", 0, 12, "", 12, SLATE_800)
+        pdf.cell(0, 12, "", ln=True, fill=True)
+
+        # 4. Footer
+        pdf.set_y(-40)
+        pdf.set_font("Helvetica", "I", 9)
+        pdf.set_text_color(*SLATE_400)
+        pdf.cell(
+            0,
+            5,
+            "This is a computer-generated report and does not require a physical signature.",
+            ln=True,
+            align="C",
+        )
+        slot("generated_at", 0, 5, "I", 9, SLATE_400, align="C")
+
+        return pdf.pages[1], slots
+
+    def render(self, report):
+        """Draw only the per-report values on top of the static page"""
+        values = {
+            "report_date": report.report_date.strftime("%d %b %Y"),
+            "collection_count": f"  Total Transactions: {report.collection_count or 0}",
+            "generated_at": f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S IST')}",
+        }
+        for row in STATEMENT_ROWS:
+            if row is not None:
+                values[row[0]] = f"INR {getattr(report, row[0]) or 0:,.2f}"
+
+        pdf = FPDF()
+        self._register_fonts(pdf)
+        pdf.add_page()
+        # q/Q keeps the template's colours and fonts out of our drawing state
+        pdf.pages[pdf.page] += "q\n" + self.stream + "Q\n"
+
+        for name, text in values.items():
+            s = self.slots[name]
+            pdf.set_font("Helvetica", s["style"], s["size"])
+            pdf.set_text_color(*s["color"])
+            pdf.set_xy(s["x"], s["y"])
+            pdf.cell(s["w"], s["h"], text, align=s["align"])
+
+        pdf_out = pdf.output(dest="S")
+        if isinstance(pdf_out, str):
+            return pdf_out.encode("latin-1")
+        return bytes(pdf_out)
+
+
+class StatementPDFCache:
+    """
+    Content-addressed on-disk cache of daily accounting statement PDFs.
+    The key hashes the report id with every value drawn on the page, so an
+    edited report (the row's effective version) gets a new file and ETag.
+    """
+
+    def __init__(self, cache_dir=PDF_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._template = None
+
+    @property
+    def template(self):
+        if self._template is None:
+            self._template = StatementTemplate()
+        return self._template
+
+    @staticmethod
+    def cache_key(report):
+        digest = hashlib.sha256(f"v{TEMPLATE_VERSION}:{report.id}".encode())
+        for field in REPORT_FIELDS:
+            digest.update(f"|{getattr(report, field)!r}".encode())
+        return digest.hexdigest()
+
+    def path_for(self, report, key=None):
+        key = key or self.cache_key(report)
+        return os.path.join(self.cache_dir, f"report_{report.id}_{key[:32]}.pdf")
+
+    def get_or_render(self, report, key=None):
+        """Returns (path, rendered) - rendered is False on a cache hit"""
+        path = self.path_for(report, key)
+        if os.path.exists(path):
+            return path, False
+
+        pdf_bytes = self.template.render(report)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Drop superseded versions of this report before publishing the new one
+        for stale in glob.glob(
+            os.path.join(self.cache_dir, f"report_{report.id}_*.pdf")
+        ):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+        # Write-then-rename so concurrent workers never serve a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(pdf_bytes)
+        os.replace(tmp_path, path)
+        return path, True
+
+    def render_month(self, reports):
+        """Pre-generate statements for a batch of reports (e.g. one month)"""
+        rendered = 0
+        cached = 0
+        for report in reports:
+            _, was_rendered = self.get_or_render(report)
+            if was_rendered:
+                rendered += 1
+            else:
+                cached += 1
+        return {"rendered": rendered, "cached": cached, "total": rendered + cached}
+
+
+def month_bounds(month_str):
+    """'2024-05' -> (date(2024, 5, 1), date(2024, 5, 31))"""
+    year, month = (int(p) for p in month_str.split("-", 1))
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+statement_cache = StatementPDFCache()
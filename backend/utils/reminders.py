@@ -0,0 +1,464 @@
+"""
+EMI reminder pipeline: select, render, enqueue, deliver.
+
+enqueue_reminders() selects every unpaid EMI due on a day with one range
+query on emi_schedule(due_date, status), renders the message template
+once per row and bulk-inserts the messages into reminder_outbox. Running
+it twice for the same day queues nothing new.
+
+deliver_pending() drains the outbox in batches. Messages are sent from a
+small thread pool (REMINDER_CONCURRENCY) paced by a rate limiter
+(REMINDER_RATE_PER_SECOND), and each batch's outcome is written back in
+one statement. Failures are retried with backoff up to
+REMINDER_MAX_ATTEMPTS. Delivery runs as the scheduled reminder_delivery
+job, whose lease keeps it to one process at a time, so the rate limit
+holds for the whole deployment. At the default 50 messages/s a 50k
+day takes about 17 minutes: the 12:30 UTC (18:00 IST) fan-out is
+delivered by 13:00 UTC.
+
+The provider is pluggable through REMINDER_PROVIDER: "stub" (default;
+sends nothing, for local runs), "http" (a JSON gateway at
+REMINDER_PROVIDER_URL) or "module:attr" naming any object with a
+send(channel, recipient, body) method that returns the provider's
+message id. Providers report delivery back through
+apply_delivery_reports().
+"""
+
+import importlib
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+
+from extensions import db
+from models import Customer, EMISchedule, Loan, ReminderMessage
+from utils.dates import on_day
+from utils.settings_store import DEFAULTS, get_settings
+
+REMINDER_PROVIDER = os.getenv("REMINDER_PROVIDER", "stub")
+REMINDER_PROVIDER_URL = os.getenv("REMINDER_PROVIDER_URL", "")
+REMINDER_PROVIDER_TOKEN = os.getenv("REMINDER_PROVIDER_TOKEN", "")
+# Parallel provider calls, and the ceiling on messages sent per second
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", 8))
+REMINDER_RATE_PER_SECOND = float(os.getenv("REMINDER_RATE_PER_SECOND", 50))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 200))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", 5))
+# A 'sending' message whose lease lapsed (its process died) is queued again
+REMINDER_LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 1800
+INSERT_CHUNK = 1000
+
+outbox = ReminderMessage.__table__
+
+
+class ProviderError(Exception):
+    """A send the provider refused; retryable=False means never retry it"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class StubProvider:
+    """Accepts every message without sending it (local and test runs)"""
+
+    name = "stub"
+
+    def __init__(self):
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send(self, channel, recipient, body):
+        with self._lock:
+            self.sent += 1
+        return f"stub-{uuid.uuid4().hex}"
+
+
+class HttpProvider:
+    """
+    Generic SMS/WhatsApp gateway: POSTs {"channel", "to", "message"} as JSON
+    and reads the message id from the "id" or "message_id" response field.
+    """
+
+    name = "http"
+
+    def __init__(self, url=REMINDER_PROVIDER_URL, token=REMINDER_PROVIDER_TOKEN):
+        import requests
+
+        if not url:
+            raise RuntimeError("REMINDER_PROVIDER_URL is not set")
+        self.url = url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=REMINDER_CONCURRENCY)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def send(self, channel, recipient, body):
+        import requests
+
+        try:
+            response = self.session.post(
+                self.url,
+                json={"channel": channel, "to": recipient, "message": body},
+                timeout=10,
+            )
+        except requests.RequestException as e:
+            raise ProviderError(str(e))
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ProviderError(f"Gateway returned {response.status_code}")
+        if response.status_code >= 400:
+            raise ProviderError(
+                f"Gateway rejected message: {response.status_code} {response.text[:200]}",
+                retryable=False,
+            )
+        data = response.json() if response.content else {}
+        return str(data.get("id") or data.get("message_id") or "")
+
+
+PROVIDERS = {"stub": StubProvider, "http": HttpProvider}
+
+_provider = None
+
+
+def get_provider():
+    """The configured provider, built once per process"""
+    global _provider
+    if _provider is None:
+        if REMINDER_PROVIDER in PROVIDERS:
+            _provider = PROVIDERS[REMINDER_PROVIDER]()
+        else:
+            module, _, attr = REMINDER_PROVIDER.partition(":")
+            target = getattr(importlib.import_module(module), attr)
+            _provider = target() if isinstance(target, type) else target
+    return _provider
+
+
+class RateLimiter:
+    """Spaces calls evenly at `rate` per second across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def retry_delay(attempt):
+    return timedelta(
+        seconds=min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    )
+
+
+# --- Selection and enqueueing ---
+
+
+def select_targets(day):
+    """Unpaid EMIs due on `day` with their loan and customer, in one query"""
+    return db.session.execute(
+        select(
+            EMISchedule.id.label("emi_id"),
+            EMISchedule.amount,
+            EMISchedule.due_date,
+            Loan.id.label("loan_pk"),
+            Loan.loan_id,
+            Customer.id.label("customer_id"),
+            Customer.name,
+            Customer.mobile_number,
+            Customer.area,
+        )
+        .join(Loan, EMISchedule.loan_id == Loan.id)
+        .join(Customer, Loan.customer_id == Customer.id)
+        .where(on_day(EMISchedule.due_date, day), EMISchedule.status != "paid")
+        .order_by(EMISchedule.id)
+    ).all()
+
+
+def _template(settings):
+    """The configured template, or the default one if it does not render"""
+    template = settings.get_str("reminder_template")
+    sample = dict(name="", amount="", loan_id="", due_date="", upi_id="")
+    try:
+        template.format_map(sample)
+        return template
+    except (KeyError, IndexError, ValueError):
+        return DEFAULTS["reminder_template"]
+
+
+def enqueue_reminders(day=None, channel=None):
+    """
+    Queue a reminder for every unpaid EMI due on `day` (default tomorrow)
+    that has none yet on `channel`. Commits; returns counts.
+    """
+    day = day or (datetime.utcnow() + timedelta(days=1)).date()
+    settings = get_settings()
+    channel = channel or settings.get_str("reminder_channel")
+    template = _template(settings)
+    upi_id = settings.get_str("upi_id")
+    due_label = day.strftime("%d-%m-%Y")
+
+    targets = select_targets(day)
+    already = set(
+        db.session.execute(
+            select(outbox.c.emi_id).where(
+                outbox.c.due_date == day, outbox.c.channel == channel
+            )
+        ).scalars()
+    )
+    now = datetime.utcnow()
+    rows = [
+        {
+            "due_date": day,
+            "emi_id": t.emi_id,
+            "loan_id": t.loan_pk,
+            "customer_id": t.customer_id,
+            "channel": channel,
+            "recipient": t.mobile_number,
+            "body": template.format_map(
+                {
+                    "name": t.name,
+                    "amount": f"{t.amount:,.2f}",
+                    "loan_id": t.loan_id or t.loan_pk,
+                    "due_date": due_label,
+                    "upi_id": upi_id,
+                }
+            ),
+            "status": "queued",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for t in targets
+        if t.emi_id not in already
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(outbox), rows[start : start + INSERT_CHUNK])
+    db.session.commit()
+    return {
+        "due_date": day.isoformat(),
+        "channel": channel,
+        "selected": len(targets),
+        "queued": len(rows),
+        "already_queued": len(targets) - len(rows),
+    }
+
+
+# --- Delivery ---
+
+
+def _drop_stale(now):
+    """Requeue lapsed sends; cancel reminders for paid or past EMIs"""
+    db.session.execute(
+        update(outbox)
+        .where(outbox.c.status == "sending", outbox.c.lease_expires_at < now)
+        .values(status="queued", lease_expires_at=None)
+    )
+    db.session.execute(
+        update(outbox)
+        .where(
+            outbox.c.status == "queued",
+            outbox.c.due_date < now.date(),
+        )
+        .values(status="cancelled", error="Due date passed before delivery")
+    )
+    paid = select(EMISchedule.id).where(
+        EMISchedule.id == outbox.c.emi_id, EMISchedule.status == "paid"
+    )
+    db.session.execute(
+        update(outbox)
+        .where(outbox.c.status == "queued", paid.exists())
+        .values(status="cancelled", error="EMI paid before delivery")
+    )
+    db.session.commit()
+
+
+def _claim_batch(now, size):
+    """Mark the next due messages 'sending' under a fresh lease and return them"""
+    ids = (
+        db.session.execute(
+            select(outbox.c.id)
+            .where(outbox.c.status == "queued", outbox.c.next_attempt_at <= now)
+            .order_by(outbox.c.next_attempt_at, outbox.c.id)
+            .limit(size)
+        )
+        .scalars()
+        .all()
+    )
+    if not ids:
+        return []
+    lease = now + timedelta(seconds=REMINDER_LEASE_SECONDS)
+    db.session.execute(
+        update(outbox)
+        .where(outbox.c.id.in_(ids), outbox.c.status == "queued")
+        .values(status="sending", lease_expires_at=lease)
+    )
+    db.session.commit()
+    return db.session.execute(
+        select(
+            outbox.c.id,
+            outbox.c.channel,
+            outbox.c.recipient,
+            outbox.c.body,
+            outbox.c.attempts,
+        ).where(
+            outbox.c.id.in_(ids),
+            outbox.c.status == "sending",
+            outbox.c.lease_expires_at == lease,
+        )
+    ).all()
+
+
+def _send(provider, limiter, message):
+    limiter.wait()
+    try:
+        return (
+            message,
+            provider.send(message.channel, message.recipient, message.body),
+            None,
+        )
+    except ProviderError as e:
+        return message, None, e
+    except Exception as e:
+        return message, None, ProviderError(str(e))
+
+
+def _record(results):
+    """Write one batch's outcomes back in a single executemany UPDATE"""
+    now = datetime.utcnow()
+    params = []
+    for message, provider_id, error in results:
+        attempts = message.attempts + 1
+        if error is None:
+            status, next_at, sent_at = "sent", now, now
+        elif error.retryable and attempts < REMINDER_MAX_ATTEMPTS:
+            status, next_at, sent_at = "queued", now + retry_delay(attempts), None
+        else:
+            status, next_at, sent_at = "failed", now, None
+        params.append(
+            {
+                "_id": message.id,
+                "status": status,
+                "attempts": attempts,
+                "next_attempt_at": next_at,
+                "provider_message_id": provider_id,
+                "error": str(error) if error else None,
+                "sent_at": sent_at,
+            }
+        )
+    db.session.execute(
+        update(outbox)
+        .where(outbox.c.id == bindparam("_id"))
+        .values(
+            status=bindparam("status"),
+            attempts=bindparam("attempts"),
+            next_attempt_at=bindparam("next_attempt_at"),
+            provider_message_id=bindparam("provider_message_id"),
+            error=bindparam("error"),
+            sent_at=bindparam("sent_at"),
+            lease_expires_at=None,
+        ),
+        params,
+    )
+    db.session.commit()
+    return Counter(
+        "retrying" if p["status"] == "queued" else p["status"] for p in params
+    )
+
+
+def deliver_pending(budget_seconds=110, provider=None):
+    """
+    Send queued messages until the outbox is empty or `budget_seconds`
+    have passed (checked between batches). Returns counts by outcome.
+    """
+    provider = provider or get_provider()
+    limiter = RateLimiter(REMINDER_RATE_PER_SECOND)
+    deadline = time.monotonic() + budget_seconds
+    totals = Counter()
+
+    _drop_stale(datetime.utcnow())
+    with ThreadPoolExecutor(
+        max_workers=REMINDER_CONCURRENCY, thread_name_prefix="reminder-send"
+    ) as pool:
+        while time.monotonic() < deadline:
+            batch = _claim_batch(datetime.utcnow(), REMINDER_BATCH_SIZE)
+            if not batch:
+                break
+            results = list(
+                pool.map(lambda message: _send(provider, limiter, message), batch)
+            )
+            totals.update(_record(results))
+    totals["remaining"] = db.session.execute(
+        select(db.func.count())
+        .select_from(outbox)
+        .where(outbox.c.status.in_(["queued", "sending"]))
+    ).scalar()
+    return dict(totals)
+
+
+# --- Delivery reports ---
+
+REPORTED_STATUSES = {"delivered", "failed"}
+
+
+def apply_delivery_reports(reports):
+    """
+    Apply provider callbacks: [{"id": provider message id, "status":
+    "delivered"|"failed", "error": optional}]. Returns rows updated.
+    """
+    now = datetime.utcnow()
+    params = [
+        {
+            "_pid": str(r["id"]),
+            "status": r["status"],
+            "error": r.get("error"),
+            "delivered_at": now if r["status"] == "delivered" else None,
+        }
+        for r in reports
+        if r.get("id") and r.get("status") in REPORTED_STATUSES
+    ]
+    if not params:
+        return 0
+    updated = db.session.execute(
+        update(outbox)
+        .where(
+            and_(
+                outbox.c.provider_message_id == bindparam("_pid"),
+                # IN () cannot be expanded inside an executemany
+                or_(outbox.c.status == "sent", outbox.c.status == "delivered"),
+            )
+        )
+        .values(
+            status=bindparam("status"),
+            error=bindparam("error"),
+            delivered_at=bindparam("delivered_at"),
+        ),
+        params,
+    ).rowcount
+    db.session.commit()
+    return updated
+
+
+def outbox_summary(day):
+    """Message counts by status for reminders of EMIs due on `day`"""
+    counts = dict(
+        db.session.execute(
+            select(outbox.c.status, db.func.count())
+            .where(outbox.c.due_date == day)
+            .group_by(outbox.c.status)
+        ).all()
+    )
+    return {"due_date": day.isoformat(), "total": sum(counts.values()), **counts}
@@ -0,0 +1,126 @@
+"""
+Background jobs run by utils/scheduler.py, and when they run.
+
+Schedules are 5-field cron expressions (minute hour day month weekday) in
+UTC. Each job runs in an app context, commits its own work and returns a
+small JSON-serialisable dict that is stored with the run. A failed run
+is retried up to max_attempts times with exponential backoff before the
+job waits for its next scheduled time. The lease must outlast the
+job's longest run.
+
+CPU-heavy jobs (model refits, the penalty snapshot, tamper scans) run in
+the compute pool (utils/compute_pool.py), so when the scheduler loop
+runs inside a gunicorn worker its thread only waits on them and does
+not hold the GIL from that worker's requests.
+"""
+
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import update
+
+from extensions import db
+from models import EMISchedule
+
+JobSpec = namedtuple("JobSpec", ["func", "schedule", "max_attempts", "lease_seconds"])
+
+
+def mark_overdue_emis(now=None):
+    """Flag pending/partial EMIs past their due date as overdue; returns the count"""
+    now = now or datetime.utcnow()
+    updated = db.session.execute(
+        update(EMISchedule)
+        .where(
+            EMISchedule.due_date < now,
+            EMISchedule.status.in_(["pending", "partial"]),
+        )
+        .values(status="overdue")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return updated
+
+
+def overdue_sweep():
+    return {"updated_count": mark_overdue_emis()}
+
+
+def offloaded(kind, params=None, timeout=None):
+    """Run compute job `kind` in the pool and return its result; raises if it fails"""
+    from utils.compute_jobs import JOBS
+    from utils.compute_pool import TIMEOUT_GRACE_SECONDS, compute_pool
+
+    job, _ = compute_pool.submit(kind, params, timeout=timeout)
+    job = compute_pool.wait(
+        job, job.timeout_seconds + TIMEOUT_GRACE_SECONDS, poll_seconds=5
+    )
+    if job.status != "done":
+        raise RuntimeError(f"{kind} job {job.id} {job.status}: {job.error}")
+    return json.loads(job.result) if job.result else None
+
+
+def penalty_snapshot():
+    return offloaded("penalty_snapshot")
+
+
+def tamper_scan():
+    return offloaded("tamper_scan", {"full": False}, timeout=500)
+
+
+def tamper_full_scan():
+    return offloaded("tamper_scan", {"full": True})
+
+
+def worker_model_refit():
+    return offloaded("worker_model_refit")
+
+
+def behavior_model_refit():
+    return offloaded("behavior_model_refit")
+
+
+def accounting_close():
+    from utils.accounting import daily_accounting_stats, save_daily_report
+
+    from utils.outbox import record_event
+
+    stats = daily_accounting_stats()
+    save_daily_report(stats)
+    record_event("accounting.daily_close", None, stats)
+    db.session.commit()
+    return stats
+
+
+def reminder_fanout():
+    from utils.reminders import enqueue_reminders
+
+    return enqueue_reminders()
+
+
+def reminder_delivery():
+    from utils.reminders import deliver_pending
+
+    return deliver_pending(budget_seconds=110)
+
+
+def event_dispatch():
+    from utils.outbox import dispatch_pending
+
+    return dispatch_pending(budget_seconds=50)
+
+
+SCHEDULE = {
+    "overdue_sweep": JobSpec(overdue_sweep, "5 0 * * *", 3, 600),
+    "penalty_snapshot": JobSpec(penalty_snapshot, "20 0 * * *", 3, 1800),
+    "tamper_scan": JobSpec(tamper_scan, "*/15 * * * *", 2, 600),
+    "tamper_full_scan": JobSpec(tamper_full_scan, "40 1 * * *", 3, 1800),
+    "worker_model_refit": JobSpec(worker_model_refit, "0 */6 * * *", 2, 1800),
+    "behavior_model_refit": JobSpec(behavior_model_refit, "0 2 * * *", 3, 3600),
+    "accounting_close": JobSpec(accounting_close, "15 23 * * *", 5, 600),
+    # Queue tomorrow's reminders at 18:00 IST; delivery drains the outbox
+    "reminder_fanout": JobSpec(reminder_fanout, "30 12 * * *", 3, 600),
+    "reminder_delivery": JobSpec(reminder_delivery, "*/2 * * * *", 1, 300),
+    # Polls the webhook outbox for most of each minute
+    "event_dispatch": JobSpec(event_dispatch, "* * * * *", 1, 120),
+}
@@ -0,0 +1,333 @@
+"""
+Database-backed scheduler for the jobs in utils.scheduled_jobs.SCHEDULE.
+
+Every app process may run the scheduler loop; the scheduled_jobs table
+makes sure each due job runs in one of them. A process claims a job with
+a single conditional UPDATE that sets a lease (owner and expiry) only if
+the job is due and not leased. The lease is released when the run ends,
+or lapses if the process dies, and another process then picks the job
+up. Every run is recorded in job_runs with its duration and outcome.
+
+The loop starts with the first request when SCHEDULER_ENABLED is set
+(the default), so scripts that only build the app never run jobs. For a
+dedicated scheduler process, run `python -m utils.scheduler` from
+backend/.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import JobRun, ScheduledJob
+from utils.scheduled_jobs import SCHEDULE
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+# Seconds between checks for due jobs
+SCHEDULER_POLL_SECONDS = int(os.getenv("SCHEDULER_POLL_SECONDS", 30))
+# Retry delays double from RETRY_BASE_SECONDS up to RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+
+
+class CronSchedule:
+    """
+    Standard 5-field cron expression (minute hour day month weekday) with
+    *, lists, ranges and steps; weekday 0 or 7 is Sunday. When both day and
+    weekday are restricted, either matching is enough, as in cron.
+    """
+
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        (
+            self.minutes,
+            self.hours,
+            self.days,
+            self.months,
+            weekdays,
+        ) = (self._parse(f, lo, hi) for f, (lo, hi) in zip(fields, self.BOUNDS))
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, lo, hi):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/", 1)
+                step = int(step)
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = (int(p) for p in part.split("-", 1))
+            else:
+                start = int(part)
+                end = hi if step != 1 else start
+            if step < 1 or not lo <= start <= end <= hi:
+                raise ValueError(f"Bad cron field {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        weekday = (moment.weekday() + 1) % 7  # cron counts from Sunday
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return weekday in self.weekdays
+        if self.any_weekday:
+            return moment.day in self.days
+        return moment.day in self.days or weekday in self.weekdays
+
+    def next_after(self, after):
+        """First matching minute strictly after `after`"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment <= limit:
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = moment.replace(
+                    year=moment.year + year, month=month + 1, day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+def retry_delay(attempt):
+    return timedelta(
+        seconds=min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    )
+
+
+def sync_jobs(now=None):
+    """Create rows for new jobs and reschedule jobs whose cron changed"""
+    now = now or datetime.utcnow()
+    rows = {job.name: job for job in ScheduledJob.query.all()}
+    for name, spec in SCHEDULE.items():
+        job = rows.get(name)
+        if job is None:
+            db.session.add(
+                ScheduledJob(
+                    name=name,
+                    schedule=spec.schedule,
+                    enabled=True,
+                    next_run_at=CronSchedule(spec.schedule).next_after(now),
+                    attempts=0,
+                )
+            )
+        elif job.schedule != spec.schedule:
+            job.schedule = spec.schedule
+            job.next_run_at = CronSchedule(spec.schedule).next_after(now)
+            job.attempts = 0
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # another process added them first
+
+
+def _claim(name, owner, now):
+    """Lease the job if it is due and free; True when this process won it"""
+    spec = SCHEDULE[name]
+    claimed = db.session.execute(
+        update(ScheduledJob)
+        .where(
+            ScheduledJob.name == name,
+            ScheduledJob.enabled.is_(True),
+            ScheduledJob.next_run_at <= now,
+            or_(
+                ScheduledJob.lease_expires_at.is_(None),
+                ScheduledJob.lease_expires_at < now,
+            ),
+        )
+        .values(
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=spec.lease_seconds),
+            last_started_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed:
+        # Runs left 'running' by a process that died holding an older lease
+        db.session.execute(
+            update(JobRun)
+            .where(JobRun.job_name == name, JobRun.status == "running")
+            .values(status="abandoned", finished_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return bool(claimed)
+
+
+def _run(name, owner):
+    """Execute a claimed job, record the run and schedule the next one"""
+    spec = SCHEDULE[name]
+    job = db.session.get(ScheduledJob, name)
+    run = JobRun(
+        job_name=name,
+        attempt=job.attempts + 1,
+        worker=owner,
+        status="running",
+        started_at=datetime.utcnow(),
+    )
+    db.session.add(run)
+    db.session.commit()
+    run_id, attempt = run.id, run.attempt
+
+    started = time.perf_counter()
+    try:
+        result, error = spec.func(), None
+    except Exception as e:
+        db.session.rollback()
+        result, error = None, str(e)
+        print(f"Scheduled job {name} failed (attempt {attempt}): {e}")
+    duration_ms = int((time.perf_counter() - started) * 1000)
+
+    now = datetime.utcnow()
+    if error is None:
+        next_run_at, attempts = CronSchedule(spec.schedule).next_after(now), 0
+    elif attempt < spec.max_attempts:
+        next_run_at, attempts = now + retry_delay(attempt), attempt
+    else:
+        # Out of retries: wait for the next scheduled time
+        next_run_at, attempts = CronSchedule(spec.schedule).next_after(now), 0
+
+    db.session.execute(
+        update(JobRun)
+        .where(JobRun.id == run_id)
+        .values(
+            status="failed" if error else "succeeded",
+            finished_at=now,
+            duration_ms=duration_ms,
+            result=json.dumps(result, default=str) if result is not None else None,
+            error=error,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.name == name, ScheduledJob.lease_owner == owner)
+        .values(
+            next_run_at=next_run_at,
+            attempts=attempts,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_finished_at=now,
+            last_status="failed" if error else "succeeded",
+            last_error=error,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return error is None
+
+
+def run_pending(owner=None, now=None):
+    """Run every job that is due and not leased elsewhere; returns their names"""
+    owner = owner or worker_name()
+    now = now or datetime.utcnow()
+    due = [
+        name
+        for (name,) in db.session.query(ScheduledJob.name)
+        .filter(ScheduledJob.enabled.is_(True), ScheduledJob.next_run_at <= now)
+        .order_by(ScheduledJob.next_run_at)
+        if name in SCHEDULE
+    ]
+    ran = []
+    for name in due:
+        if _claim(name, owner, now):
+            _run(name, owner)
+            ran.append(name)
+    return ran
+
+
+def trigger(name):
+    """Make a job due now (the next scheduler pass runs it)"""
+    updated = db.session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.name == name)
+        .values(next_run_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(updated)
+
+
+class Scheduler:
+    """Background thread calling run_pending() every poll interval"""
+
+    def __init__(self, app, poll_seconds=SCHEDULER_POLL_SECONDS):
+        self.app = app
+        self.poll_seconds = poll_seconds
+        self.owner = worker_name()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._loop, name="job-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        synced = False
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    if not synced:
+                        sync_jobs()
+                        synced = True
+                    run_pending(self.owner)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Scheduler error: {e}")
+                finally:
+                    db.session.remove()
+            self._stop.wait(self.poll_seconds)
+
+
+def init_scheduler(app):
+    """Start the scheduler with the app's first request, once per process"""
+    if not SCHEDULER_ENABLED:
+        return
+    app.extensions["scheduler"] = scheduler = Scheduler(app)
+    started = {"pid": None}
+
+    @app.before_request
+    def _start_scheduler():
+        if started["pid"] != os.getpid():
+            started["pid"] = os.getpid()
+            scheduler.owner = worker_name()
+            scheduler.start()
+
+
+if __name__ == "__main__":
+    from app import create_app
+
+    Scheduler(create_app())._loop()
@@ -0,0 +1,194 @@
+"""
+Process-wide, read-through cache of the system_settings table.
+
+Each process holds one immutable snapshot of every setting (defaults
+filled in) and serves reads from it without touching the database.
+Writers bump a version counter (a row in id_sequences) in the same
+transaction as the change; a process compares that counter with its
+snapshot's at most once every SETTINGS_POLL_SECONDS and reloads the
+table only when it moved. A change made by one worker therefore reaches
+the others within one poll interval, and the writing process at once.
+"""
+
+import ast
+import os
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+
+from sqlalchemy import insert, select, update
+
+from extensions import db
+from models import IdSequence, SystemSetting
+
+# Stored values are text; defaults use the same string form
+DEFAULTS = {
+    "default_interest_rate": "10.0",
+    "penalty_amount": "50.0",
+    "weekly_penalty_amount": "10.0",
+    "grace_period_days": "3",
+    "max_loan_amount": "50000.0",
+    "emi_frequency_options": "['daily', 'weekly', 'monthly']",
+    "worker_can_edit_customer": "false",
+    "upi_id": "arun.finance@okaxis",
+    "upi_qr_url": "",
+    "error_detection_webhook_url": "https://n8n.your-instance.com/webhook/error-detection",
+    "webhook_events_enabled": "false",
+    "event_webhook_url": "",
+    "reminder_channel": "sms",
+    "reminder_template": (
+        "Dear {name}, your EMI of Rs.{amount} for loan {loan_id} is due on "
+        "{due_date}. Please keep the amount ready or pay to UPI {upi_id}."
+    ),
+}
+
+# id_sequences row whose next_value is the settings version
+VERSION_KEY = "system_settings"
+
+# Longest a process may serve settings another worker has since changed
+SETTINGS_POLL_SECONDS = float(os.getenv("SETTINGS_POLL_SECONDS", 5))
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+class Settings:
+    """
+    One immutable snapshot of system settings. The typed accessors parse the
+    stored text and fall back to the DEFAULTS value when a setting is missing
+    or does not parse.
+    """
+
+    __slots__ = ("version", "values")
+
+    def __init__(self, version, values):
+        merged = dict(DEFAULTS)
+        merged.update(values)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "values", MappingProxyType(merged))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings snapshots are read-only")
+
+    def _typed(self, key, parse):
+        try:
+            return parse(self.values[key])
+        except (KeyError, TypeError, ValueError, SyntaxError):
+            if key not in DEFAULTS:
+                raise
+            return parse(DEFAULTS[key])
+
+    def get_str(self, key):
+        return self._typed(key, str)
+
+    def get_int(self, key):
+        return self._typed(key, lambda v: int(float(v)))
+
+    def get_float(self, key):
+        return self._typed(key, float)
+
+    def get_bool(self, key):
+        return self._typed(key, lambda v: v.strip().lower() in TRUE_VALUES)
+
+    def get_list(self, key):
+        def parse(value):
+            parsed = ast.literal_eval(value)
+            if not isinstance(parsed, (list, tuple)):
+                raise ValueError(f"{key} is not a list")
+            return list(parsed)
+
+        return self._typed(key, parse)
+
+    def as_dict(self):
+        return dict(self.values)
+
+
+def _read_version():
+    return (
+        db.session.execute(
+            select(IdSequence.next_value).where(IdSequence.name == VERSION_KEY)
+        ).scalar()
+        or 0
+    )
+
+
+def _bump_version():
+    """Advance the version counter inside the caller's transaction"""
+    now = datetime.utcnow()
+    bumped = db.session.execute(
+        update(IdSequence)
+        .where(IdSequence.name == VERSION_KEY)
+        .values(next_value=IdSequence.next_value + 1, updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not bumped:
+        db.session.execute(
+            insert(IdSequence).values(name=VERSION_KEY, next_value=1, updated_at=now)
+        )
+
+
+class SettingsStore:
+    """Holds the process's snapshot and decides when to re-check the version"""
+
+    def __init__(self, poll_seconds=SETTINGS_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The snapshot; queries only when a version check is due"""
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and time.monotonic() - self._checked_at < self.poll_seconds
+        ):
+            return snapshot
+        with self._lock:
+            if (
+                self._snapshot is None
+                or time.monotonic() - self._checked_at >= self.poll_seconds
+            ):
+                self._refresh()
+            return self._snapshot
+
+    def _refresh(self):
+        version = _read_version()
+        if self._snapshot is None or self._snapshot.version != version:
+            rows = db.session.execute(select(SystemSetting.key, SystemSetting.value))
+            self._snapshot = Settings(version, {key: value for key, value in rows})
+        self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Force a version check on the next read"""
+        self._checked_at = 0.0
+
+    def update(self, values):
+        """
+        Write `values` ({key: value}) and bump the version. Caller commits;
+        this process sees the change on its next read.
+        """
+        existing = {
+            s.key: s
+            for s in SystemSetting.query.filter(SystemSetting.key.in_(list(values)))
+        }
+        now = datetime.utcnow()
+        for key, value in values.items():
+            setting = existing.get(key)
+            if setting is None:
+                setting = SystemSetting(
+                    key=key, description=key.replace("_", " ").title()
+                )
+                db.session.add(setting)
+            setting.value = str(value)
+            setting.updated_at = now
+        _bump_version()
+        self.invalidate()
+
+
+settings_store = SettingsStore()
+
+
+def get_settings():
+    """This process's current Settings snapshot"""
+    return settings_store.current()
@@ -0,0 +1,241 @@
+"""
+Set-based tamper detection: loan balances and paid EMIs reconciled against
+approved collections and the EMIAllocation ledger.
+
+One statement joins four grouped subqueries (schedule, approved
+collections, ledger, loans) and returns only loans that fail a check, so
+a full-book scan is a few table scans in the database rather than
+queries per loan or per EMI. Findings persist in tamper_findings and are
+resolved when a later scan no longer sees them.
+
+Incremental scans recheck only loans with collections, allocations or
+audit entries newer than the previous scan's watermarks. Edits made
+directly in the database leave no such trace, so the scheduled full scan
+catches those.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import case, func, or_, select, true, union
+
+from extensions import db
+from models import (
+    Collection,
+    Customer,
+    EMIAllocation,
+    EMISchedule,
+    Loan,
+    LoanAuditLog,
+    TamperFinding,
+    TamperScan,
+)
+
+# Loan statuses whose books are reconciled
+CHECKED_STATUSES = ("active",)
+# Rupee difference tolerated (EMI amounts are rounded to paise)
+TOLERANCE = 1.0
+
+BALANCE_MISMATCH = "BALANCE_MISMATCH"
+PAID_WITHOUT_COLLECTION = "PAID_WITHOUT_COLLECTION"
+
+
+def _watermarks():
+    return db.session.execute(
+        select(
+            select(func.coalesce(func.max(Collection.id), 0)).scalar_subquery(),
+            select(func.coalesce(func.max(EMIAllocation.id), 0)).scalar_subquery(),
+            select(func.coalesce(func.max(LoanAuditLog.id), 0)).scalar_subquery(),
+        )
+    ).one()
+
+
+def _touched_loans(previous):
+    """Loans with rows newer than the previous scan"""
+    return union(
+        select(Collection.loan_id).where(Collection.id > previous.last_collection_id),
+        select(EMIAllocation.loan_id).where(
+            EMIAllocation.id > previous.last_allocation_id
+        ),
+        select(LoanAuditLog.loan_id).where(LoanAuditLog.id > previous.last_audit_id),
+    )
+
+
+def _in_scope(column, scope):
+    return column.in_(scope) if scope is not None else true()
+
+
+def reconcile(scope=None):
+    """
+    Failing checks as {(loan_id, kind): (reason, expected, actual)} for the
+    loans in `scope` (a select of loan ids; None = the whole book).
+
+    BALANCE_MISMATCH: pending_amount != schedule total (principal +
+    interest) - approved collections.
+    PAID_WITHOUT_COLLECTION: paid EMIs add up to more than the ledger has
+    allocated to the loan.
+    """
+    schedule = (
+        select(
+            EMISchedule.loan_id,
+            func.sum(EMISchedule.amount).label("scheduled"),
+            func.sum(case((EMISchedule.status == "paid", 1), else_=0)).label(
+                "paid_emis"
+            ),
+            func.sum(
+                case((EMISchedule.status == "paid", EMISchedule.amount), else_=0)
+            ).label("paid_amount"),
+        )
+        .where(_in_scope(EMISchedule.loan_id, scope))
+        .group_by(EMISchedule.loan_id)
+        .subquery()
+    )
+    collected = (
+        select(
+            Collection.loan_id,
+            func.sum(Collection.amount).label("collected"),
+            func.count(Collection.id).label("collections"),
+        )
+        .where(Collection.status == "approved", _in_scope(Collection.loan_id, scope))
+        .group_by(Collection.loan_id)
+        .subquery()
+    )
+    ledger = (
+        select(
+            EMIAllocation.loan_id,
+            func.sum(EMIAllocation.amount).label("allocated"),
+        )
+        .where(_in_scope(EMIAllocation.loan_id, scope))
+        .group_by(EMIAllocation.loan_id)
+        .subquery()
+    )
+
+    total_collected = func.coalesce(collected.c.collected, 0)
+    allocated = func.coalesce(ledger.c.allocated, 0)
+    outstanding = schedule.c.scheduled - total_collected
+    expected_pending = case((outstanding > 0, outstanding), else_=0)
+    balance_off = func.abs(Loan.pending_amount - expected_pending) > TOLERANCE
+    paid_uncovered = schedule.c.paid_amount - allocated > TOLERANCE
+
+    rows = db.session.execute(
+        select(
+            Loan.id,
+            Loan.pending_amount,
+            expected_pending,
+            schedule.c.paid_emis,
+            schedule.c.paid_amount,
+            allocated,
+            func.coalesce(collected.c.collections, 0),
+            balance_off,
+            paid_uncovered,
+        )
+        .join(schedule, schedule.c.loan_id == Loan.id)
+        .outerjoin(collected, collected.c.loan_id == Loan.id)
+        .outerjoin(ledger, ledger.c.loan_id == Loan.id)
+        .where(
+            Loan.status.in_(CHECKED_STATUSES),
+            _in_scope(Loan.id, scope),
+            or_(balance_off, paid_uncovered),
+        )
+    )
+
+    findings = {}
+    for (
+        loan_id,
+        pending,
+        expected,
+        paid_emis,
+        paid_amount,
+        allocated_amount,
+        collections,
+        is_balance_off,
+        is_uncovered,
+    ) in rows:
+        if is_balance_off:
+            findings[(loan_id, BALANCE_MISMATCH)] = (
+                f"Pending amount {round(pending, 2)} does not match schedule "
+                f"minus approved collections ({round(expected, 2)}).",
+                float(expected),
+                float(pending),
+            )
+        if is_uncovered:
+            if not collections:
+                reason = "EMI marked PAID without any collection records detected."
+            else:
+                reason = (
+                    f"{paid_emis} EMI(s) marked PAID but collections cover only "
+                    f"{round(allocated_amount, 2)} of {round(paid_amount, 2)}."
+                )
+            findings[(loan_id, PAID_WITHOUT_COLLECTION)] = (
+                reason,
+                float(paid_amount),
+                float(allocated_amount),
+            )
+    return findings
+
+
+def _persist(findings, scope, now):
+    """Upsert this run's findings; resolve open ones in scope it no longer sees"""
+    # Resolved rows are kept too: a finding that recurs is reopened in place
+    existing = {
+        (f.loan_id, f.kind): f
+        for f in TamperFinding.query.filter(_in_scope(TamperFinding.loan_id, scope))
+    }
+    for key, (reason, expected, actual) in findings.items():
+        finding = existing.pop(key, None)
+        if finding is None:
+            finding = TamperFinding(loan_id=key[0], kind=key[1], first_seen_at=now)
+            db.session.add(finding)
+        elif finding.resolved_at is not None:
+            finding.first_seen_at = now
+            finding.resolved_at = None
+        finding.reason = reason
+        finding.expected = expected
+        finding.actual = actual
+        finding.last_seen_at = now
+
+    for finding in existing.values():
+        if finding.resolved_at is None:
+            finding.resolved_at = now
+
+
+def run_scan(full=False):
+    """
+    Reconcile loans touched since the previous scan (or the whole book when
+    full=True or there is no previous scan), persist the findings and
+    record the run. Commits; returns the TamperScan row.
+    """
+    previous = TamperScan.query.order_by(TamperScan.id.desc()).first()
+    full = full or previous is None
+    scan = TamperScan(full=full, started_at=datetime.utcnow())
+    (
+        scan.last_collection_id,
+        scan.last_allocation_id,
+        scan.last_audit_id,
+    ) = _watermarks()
+
+    scope = None if full else _touched_loans(previous)
+    findings = reconcile(scope)
+    _persist(findings, scope, scan.started_at)
+
+    scan.loans_checked = (
+        db.session.query(func.count(Loan.id))
+        .filter(Loan.status.in_(CHECKED_STATUSES), _in_scope(Loan.id, scope))
+        .scalar()
+    )
+    scan.findings = len(findings)
+    scan.finished_at = datetime.utcnow()
+    db.session.add(scan)
+    db.session.commit()
+    return scan
+
+
+def open_findings():
+    """Unresolved findings with loan number and customer name, newest first"""
+    return (
+        db.session.query(TamperFinding, Loan.loan_id, Customer.name)
+        .join(Loan, Loan.id == TamperFinding.loan_id)
+        .join(Customer, Customer.id == Loan.customer_id)
+        .filter(TamperFinding.resolved_at.is_(None))
+        .order_by(TamperFinding.last_seen_at.desc(), TamperFinding.id.desc())
+        .all()
+    )
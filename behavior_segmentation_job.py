@@ -0,0 +1,39 @@
+"""
+Nightly customer behavior segmentation.
+
+Computes repayment features for every customer, fits the segment model
+on the whole population and stores its centroids (behavior_model.pkl in
+the working directory, next to the other models). Run it from backend/
+so the app servers pick up the same file, e.g. from cron:
+
+    cd backend && python ../behavior_segmentation_job.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+
+def main():
+    from app import create_app
+    from utils.ml_behavior import behavior_engine
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        model = behavior_engine.refit()
+        elapsed = time.perf_counter() - started
+    if model["version"] is None:
+        print("Not enough customers with history to segment yet")
+        return 1
+    print(
+        f"Behavior model v{model['version']} fitted on {model['n_customers']} "
+        f"customers in {elapsed:.1f}s: {model['segments']}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
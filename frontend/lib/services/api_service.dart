@@ -1024,6 +1024,29 @@ class ApiService {
     }
   }
 
+  // Heavy analytics answer 202 with a compute job when they outlast the
+  // server's short wait; poll the job until its result is ready
+  Future<dynamic> _offloadedResult(http.Response response, String token) async {
+    final body = jsonDecode(response.body);
+    if (response.statusCode != 202) return body;
+    final jobId = body['job']['job_id'];
+    final deadline = DateTime.now().add(const Duration(seconds: 60));
+    while (DateTime.now().isBefore(deadline)) {
+      await Future.delayed(const Duration(seconds: 1));
+      final poll = await http.get(
+        Uri.parse('$_apiBase/compute/jobs/$jobId'),
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': 'Bearer $token'
+        },
+      ).timeout(const Duration(seconds: 10));
+      final job = jsonDecode(poll.body);
+      if (job['status'] == 'done') return job['result'];
+      if (job['status'] != 'queued' && job['status'] != 'running') break;
+    }
+    throw Exception('Compute job $jobId did not finish');
+  }
+
   Future<List<dynamic>> getWorkerPerformanceAnalytics(String token) async {
     try {
       final response = await http.get(
@@ -1033,7 +1056,7 @@ class ApiService {
           'Authorization': 'Bearer $token'
         },
       ).timeout(const Duration(seconds: 15));
-      return jsonDecode(response.body);
+      return await _offloadedResult(response, token);
     } catch (e) {
       return [];
     }
@@ -1063,7 +1086,7 @@ class ApiService {
           'Authorization': 'Bearer $token'
         },
       ).timeout(const Duration(seconds: 15));
-      return jsonDecode(response.body);
+      return await _offloadedResult(response, token);
     } catch (e) {
       return {'ai_summaries': ['AI analysis unavailable at this moment.']};
     }
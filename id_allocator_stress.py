@@ -0,0 +1,123 @@
+"""
+Concurrency stress test for the sequence-backed business id allocator.
+
+Spawns several processes (like gunicorn workers), each with a few threads,
+that all create customers and loans at the same time, then checks that no
+CUST-/LN- id was issued twice.
+
+Usage:
+    python id_allocator_stress.py                      # temporary SQLite file
+    DATABASE_URL=postgresql://... python id_allocator_stress.py
+    python id_allocator_stress.py --processes 8 --threads 4 --per-thread 50
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+
+def _worker(worker_no, threads, per_thread, errors):
+    from app import create_app
+    from models import db, Customer, Loan
+    from utils.id_allocator import next_id
+
+    app = create_app()
+
+    def run(thread_no):
+        with app.app_context():
+            for i in range(per_thread):
+                mobile = f"7{worker_no:03d}{thread_no:02d}{i:04d}"
+                try:
+                    # Allocate before writing, as the routes do (see reserve_block)
+                    cust_id, loan_id = next_id("CUST"), next_id("LN")
+                    customer = Customer(
+                        name=f"Stress {worker_no}-{thread_no}-{i}",
+                        mobile_number=mobile,
+                        customer_id=cust_id,
+                    )
+                    db.session.add(customer)
+                    db.session.flush()
+                    db.session.add(
+                        Loan(
+                            loan_id=loan_id,
+                            customer_id=customer.id,
+                            principal_amount=1000,
+                            pending_amount=1000,
+                        )
+                    )
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    errors.put(f"worker {worker_no}/{thread_no}: {e}")
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--per-thread", type=int, default=25)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "id_stress.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}?timeout=60"
+        print(f"Using temporary SQLite database: {path}")
+
+    # Create the schema once before the workers race
+    from app import create_app
+    from models import db, Customer, Loan
+
+    app = create_app()
+
+    ctx = multiprocessing.get_context("spawn")
+    errors = ctx.Manager().Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(n, args.threads, args.per_thread, errors))
+        for n in range(args.processes)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    failures = []
+    while not errors.empty():
+        failures.append(errors.get())
+
+    expected = args.processes * args.threads * args.per_thread
+    with app.app_context():
+        ok = True
+        for label, column in (("CUST", Customer.customer_id), ("LN", Loan.loan_id)):
+            issued = [
+                value
+                for (value,) in db.session.query(column).filter(
+                    column.like(f"{label}-%")
+                )
+            ]
+            dupes = len(issued) - len(set(issued))
+            print(f"{label}: {len(issued)} rows, {dupes} duplicate ids")
+            ok = ok and dupes == 0 and len(issued) == expected
+
+    for f in failures[:10]:
+        print(f"  insert failed - {f}")
+
+    if ok and not failures:
+        print(f"PASS: {expected} customers and loans, all ids unique")
+        return 0
+    print("FAIL")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Index-usage check for the hot query predicates.
+
+Seeds a database with synthetic lines, customers, loans, EMIs, collections
+and logs, applies the migrations, then runs EXPLAIN on each hot query and
+checks that the planner picks the expected index.
+
+Usage:
+    python index_usage_check.py                         # temporary SQLite file
+    python index_usage_check.py --customers 5000
+    DATABASE_URL=postgresql://... python index_usage_check.py --no-seed
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+
+def seed(db, models, customers, days):
+    from sqlalchemy import insert
+
+    User, UserRole = models.User, models.UserRole
+    rng = random.Random(7)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    agents = [
+        User(
+            name=f"Agent {i}",
+            mobile_number=f"80000000{i:02d}",
+            role=UserRole.FIELD_AGENT,
+        )
+        for i in range(10)
+    ]
+    db.session.add_all(agents)
+    db.session.flush()
+    agent_ids = [a.id for a in agents]
+
+    lines = [
+        models.Line(name=f"Line {i}", area=f"Area {i}", agent_id=agent_ids[i % 10])
+        for i in range(20)
+    ]
+    db.session.add_all(lines)
+    db.session.flush()
+
+    db.session.execute(
+        insert(models.Customer),
+        [
+            {
+                "name": f"Customer {i}",
+                "mobile_number": f"9{i:09d}",
+                "area": f"Area {i % 40}",
+            }
+            for i in range(customers)
+        ],
+    )
+    customer_ids = [cid for (cid,) in db.session.query(models.Customer.id)]
+
+    db.session.execute(
+        insert(models.LineCustomer),
+        [
+            {"line_id": lines[i % 20].id, "customer_id": cid, "sequence_order": i // 20}
+            for i, cid in enumerate(customer_ids)
+        ],
+    )
+    db.session.execute(
+        insert(models.Loan),
+        [
+            {
+                "customer_id": cid,
+                "principal_amount": 10000,
+                "pending_amount": 10000,
+                "status": rng.choice(["active", "active", "closed", "created"]),
+                "created_at": now - timedelta(days=days),
+            }
+            for cid in customer_ids
+        ],
+    )
+    loan_ids = [lid for (lid,) in db.session.query(models.Loan.id)]
+
+    emis, collections = [], []
+    for lid in loan_ids:
+        for n in range(days):
+            due = now - timedelta(days=days - n)
+            emis.append(
+                {
+                    "loan_id": lid,
+                    "emi_no": n + 1,
+                    "due_date": due,
+                    "amount": 100,
+                    "principal_part": 90,
+                    "interest_part": 10,
+                    "balance": 100,
+                    "status": "paid" if n < days - 3 else "pending",
+                }
+            )
+            if n < days - 3:
+                collections.append(
+                    {
+                        "loan_id": lid,
+                        "agent_id": rng.choice(agent_ids),
+                        "amount": 100,
+                        "status": rng.choice(
+                            ["approved"] * 18 + ["pending", "rejected"]
+                        ),
+                        "created_at": due + timedelta(minutes=rng.randint(0, 600)),
+                        "business_date": due.date(),
+                    }
+                )
+    db.session.execute(insert(models.EMISchedule), emis)
+    db.session.execute(insert(models.Collection), collections)
+
+    db.session.execute(
+        insert(models.LocationLog),
+        [
+            {
+                "user_id": rng.choice(agent_ids),
+                "latitude": 13.0,
+                "longitude": 80.0,
+                "timestamp": now - timedelta(minutes=5 * i),
+            }
+            for i in range(customers * 2)
+        ],
+    )
+    db.session.execute(
+        insert(models.LoginLog),
+        [
+            {
+                "user_id": rng.choice(agent_ids),
+                "login_time": now - timedelta(hours=i),
+                "status": "success",
+            }
+            for i in range(customers)
+        ],
+    )
+    db.session.commit()
+    return agent_ids[0], lines[0].id, customer_ids[0], loan_ids[0]
+
+
+def hot_queries(db, models, agent_id, line_id, customer_id, loan_id):
+    """(label, expected index, query) - mirrors the route filters"""
+    from utils.bulk_review import REVIEW_STATUSES
+    from utils.dates import on_day, on_or_before_day
+
+    Collection, EMISchedule, Loan = models.Collection, models.EMISchedule, models.Loan
+    LocationLog, LineCustomer, LoginLog = (
+        models.LocationLog,
+        models.LineCustomer,
+        models.LoginLog,
+    )
+    today = datetime.utcnow().date()
+
+    return [
+        (
+            "submit_collection: already collected today",
+            "uq_collections_loan_business_date",
+            Collection.query.filter_by(loan_id=loan_id, business_date=today),
+        ),
+        (
+            "agent collections for a day",
+            "ix_collections_agent_created",
+            db.session.query(db.func.sum(Collection.amount)).filter(
+                Collection.agent_id == agent_id,
+                on_day(Collection.created_at, today),
+                Collection.payment_mode == "cash",
+            ),
+        ),
+        (
+            "review queue (?status=pending), newest first",
+            "ix_collections_status_created",
+            Collection.query.filter(Collection.status == REVIEW_STATUSES[0])
+            .order_by(Collection.created_at.desc(), Collection.id.desc())
+            .limit(50),
+        ),
+        (
+            "pending EMIs due on or before today",
+            "ix_emi_schedule_loan_status_due",
+            EMISchedule.query.filter(
+                EMISchedule.loan_id == loan_id,
+                EMISchedule.status == "pending",
+                on_or_before_day(EMISchedule.due_date, today),
+            ),
+        ),
+        (
+            "active loans of a customer",
+            "ix_loans_customer_status",
+            Loan.query.filter_by(customer_id=customer_id, status="active"),
+        ),
+        (
+            "agent location history for a day",
+            "ix_location_logs_user_time",
+            LocationLog.query.filter(
+                LocationLog.user_id == agent_id, on_day(LocationLog.timestamp, today)
+            ).order_by(LocationLog.timestamp.asc()),
+        ),
+        (
+            "line customers in route order",
+            "ix_line_customers_line_order",
+            LineCustomer.query.filter_by(line_id=line_id).order_by(
+                LineCustomer.sequence_order
+            ),
+        ),
+        (
+            "last successful login of a user",
+            "ix_login_logs_user_time",
+            LoginLog.query.filter_by(user_id=agent_id, status="success")
+            .order_by(LoginLog.login_time.desc())
+            .limit(1),
+        ),
+    ]
+
+
+def explain(db, query):
+    bind = db.session.get_bind()
+    sql = str(
+        query.statement.compile(bind=bind, compile_kwargs={"literal_binds": True})
+    )
+    prefix = "EXPLAIN QUERY PLAN" if bind.dialect.name == "sqlite" else "EXPLAIN"
+    rows = db.session.execute(db.text(f"{prefix} {sql}")).fetchall()
+    return "\n".join(" | ".join(str(v) for v in row) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--no-seed", action="store_true", help="use existing data")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "index_check.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        print(f"Using temporary SQLite database: {path}")
+    elif not args.no_seed:
+        print("Refusing to seed a configured DATABASE_URL; pass --no-seed")
+        return 2
+
+    from app import create_app
+    import models
+    from models import db
+    from migrations import upgrade, applied_versions
+
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+        print(f"Schema at version {max(applied_versions(db.engine), default=0)}")
+
+        if args.no_seed:
+            ids = (
+                db.session.query(models.User.id)
+                .filter_by(role=models.UserRole.FIELD_AGENT)
+                .scalar(),
+                db.session.query(db.func.min(models.Line.id)).scalar(),
+                db.session.query(db.func.min(models.Customer.id)).scalar(),
+                db.session.query(db.func.min(models.Loan.id)).scalar(),
+            )
+        else:
+            ids = seed(db, models, args.customers, args.days)
+
+        # Fresh statistics so the planner sees realistic selectivity
+        if db.engine.dialect.name in ("sqlite", "postgresql"):
+            db.session.execute(db.text("ANALYZE"))
+            db.session.commit()
+
+        failures = 0
+        for label, index, query in hot_queries(db, models, *ids):
+            plan = explain(db, query)
+            ok = index in plan
+            failures += not ok
+            print(f"{'PASS' if ok else 'FAIL'}  {label:45} {index}")
+            if args.verbose or not ok:
+                print("      " + plan.replace("\n", "\n      "))
+
+    if failures:
+        print(f"FAIL: {failures} hot queries do not use their index")
+        return 1
+    print("PASS: every hot query uses its index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())